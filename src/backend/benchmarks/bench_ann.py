@@ -0,0 +1,70 @@
+"""
+Recall vs latency of the IVF index against exact search over PCA projections.
+
+Run from src/backend:
+    python -m benchmarks.bench_ann --sizes 20000 100000 --nprobe 1 4 8 16 32 --metrics euclidean cosine --clusters 0
+"""
+import argparse
+import time
+import numpy as np
+from benchmarks.common import synthetic_projections, percentiles
+from src.image.imageRetriever import ImageRetriever
+from src.image.ivfIndex import IVFIndex
+from src.similarity import SimilarityCalculator
+
+
+def timed_search(retriever, queries, k, nprobe=None, metric="euclidean"):
+    latencies, results = [], []
+    for query in queries:
+        start = time.perf_counter()
+        found = retriever.search(query, result_limit=k, nprobe=nprobe, metric=metric)
+        latencies.append((time.perf_counter() - start) * 1000)
+        results.append({row for row, _ in found})
+    return results, latencies
+
+
+def run(sizes, nprobes, n_queries, k, metrics, n_clusters):
+    """
+    Exact search is the reference for every metric. The IVF cells are
+    Euclidean, so cosine and inner_product fall back to exact search and
+    should show recall 1.0 at exact-search latency.
+    """
+    print(f"{'N':>8} {'metric':>13} {'mode':>10} {'recall@k':>9} {'p50 (ms)':>9} {'p99 (ms)':>9}")
+    for n_samples in sizes:
+        data = synthetic_projections(n_samples + n_queries, n_clusters=n_clusters)
+        projections, queries = data[:n_samples], data[n_samples:]
+
+        retriever = ImageRetriever()
+        retriever.projections = projections
+        retriever.deleted = np.zeros(n_samples, dtype=bool)
+
+        start = time.perf_counter()
+        ann_index = IVFIndex().build(projections)
+        build_time = time.perf_counter() - start
+        for metric in metrics:
+            retriever.ann_index = None
+            exact, latencies = timed_search(retriever, queries, k, metric=metric)
+            p50, p99 = percentiles(latencies)
+            print(f"{n_samples:>8} {metric:>13} {'exact':>10} {1.0:>9.3f} {p50:>9.2f} {p99:>9.2f}")
+
+            retriever.ann_index = ann_index
+            for nprobe in nprobes:
+                approx, latencies = timed_search(retriever, queries, k, nprobe=nprobe, metric=metric)
+                recall = np.mean([len(a & e) / len(e) for a, e in zip(approx, exact)])
+                p50, p99 = percentiles(latencies)
+                print(f"{n_samples:>8} {metric:>13} {f'nprobe={nprobe}':>10} {recall:>9.3f} {p50:>9.2f} {p99:>9.2f}")
+        print(f"{n_samples:>8} IVF build with {len(ann_index.centroids)} lists: {build_time:.2f} s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[20000, 100000])
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 8, 16, 32])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--metrics", nargs="+", choices=SimilarityCalculator.METRICS,
+                        default=list(SimilarityCalculator.METRICS))
+    parser.add_argument("--clusters", type=int, default=200,
+                        help="clusters in the synthetic projections; 0 for unclustered, PCA-like points")
+    args = parser.parse_args()
+    run(args.sizes, args.nprobe, args.queries, args.k, args.metrics, args.clusters)
@@ -0,0 +1,72 @@
+"""
+Two-stage audio matching: the histogram scan alone vs the cascade that
+re-ranks the top-M histogram matches by banded DTW alignment, for several
+M, on transposed, slightly wrong snippets and on whole noisy songs.
+
+Run from src/backend:
+    python -m benchmarks.bench_cascade --songs 1000 --candidates 5 10 25 50 100
+"""
+import argparse
+import time
+import numpy as np
+from benchmarks.common import synthetic_melodies, hummed_snippets, percentiles
+from src.audio.audioRetriever import AudioRetriever
+
+
+def noisy_songs(songs, n_queries, noise=0.1, seed=2):
+    """Whole songs, transposed, with a share of wrong notes and dropped notes."""
+    rng = np.random.default_rng(seed)
+    queries, sources = [], []
+    for _ in range(n_queries):
+        song_id = int(rng.integers(len(songs)))
+        song = songs[song_id] + int(rng.integers(-5, 6))
+        wrong = rng.random(len(song)) < noise
+        song[wrong] += rng.choice([-2, -1, 1, 2], size=int(wrong.sum()))
+        queries.append(song[rng.random(len(song)) >= noise / 2])
+        sources.append(song_id)
+    return queries, sources
+
+
+def run(n_songs, song_length, snippet_length, n_queries, candidates_list):
+    retriever = AudioRetriever()
+    songs = synthetic_melodies(n_songs, length=song_length)
+    retriever.database = {f"song_{i}.mid": notes for i, notes in enumerate(songs)}
+    retriever.build_features()
+
+    workloads = {
+        f"snippet {snippet_length}": hummed_snippets(songs, n_queries, length=snippet_length),
+        "whole song": noisy_songs(songs, n_queries),
+    }
+    print(f"{n_songs} songs of {song_length} notes, {n_queries} queries per workload")
+    # recall: share of queries whose song survives the histogram prefilter (top-M, or top-5 without re-ranking).
+    print(f"{'workload':>12} {'method':>14} {'recall':>7} {'top-1':>6} {'top-5':>6} {'p50 (ms)':>9} {'p99 (ms)':>9}")
+    for workload, (queries, sources) in workloads.items():
+        for candidates in [None] + list(candidates_list):
+            latencies, top1, top5, recall = [], 0, 0, 0
+            for query, source in zip(queries, sources):
+                start = time.perf_counter()
+                scores = retriever.score(retriever.feature_vector(query))
+                if candidates is None:
+                    found = retriever.rank(scores, threshold=-1, result_limit=5)
+                else:
+                    found = retriever.rerank(query, scores, candidates=candidates, result_limit=5)
+                latencies.append((time.perf_counter() - start) * 1000)
+                names = [name for name, _ in found]
+                top1 += bool(names) and names[0] == f"song_{source}.mid"
+                top5 += f"song_{source}.mid" in names
+                recall += np.sum(scores > scores[source]) < (candidates or 5)
+            p50, p99 = percentiles(latencies)
+            method = "histogram" if candidates is None else f"cascade M={candidates}"
+            print(f"{workload:>12} {method:>14} {recall / n_queries:>7.2f} {top1 / n_queries:>6.2f} {top5 / n_queries:>6.2f} "
+                  f"{p50:>9.2f} {p99:>9.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--songs", type=int, default=1000)
+    parser.add_argument("--song-length", type=int, default=200)
+    parser.add_argument("--snippet", type=int, default=24)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--candidates", type=int, nargs="+", default=[5, 10, 25, 50, 100])
+    args = parser.parse_args()
+    run(args.songs, args.song_length, args.snippet, args.queries, args.candidates)
@@ -0,0 +1,43 @@
+"""
+Serial vs process-pool image decoding in ImageProcessor.load_images.
+
+Run from src/backend:
+    python -m benchmarks.bench_decode --images 2000 --workers 1 4 8 32
+"""
+import argparse
+import os
+import tempfile
+import time
+import numpy as np
+from benchmarks.common import write_synthetic_images
+from src.image.imageProcessing import ImageProcessor
+
+
+def run(n_images, size, workers_list, resize_shape):
+    with tempfile.TemporaryDirectory() as folder:
+        paths = write_synthetic_images(folder, n_images, size=size)
+        processor = ImageProcessor(resize_shape=resize_shape)
+
+        print(f"{n_images} images of {size[0]}x{size[1]}, {os.cpu_count()} cores available")
+        print(f"{'workers':>8} {'time (s)':>9} {'images/s':>9} {'speedup':>8}")
+        baseline_time = None
+        baseline_images = None
+        for workers in workers_list:
+            start = time.perf_counter()
+            images, loaded, failures = processor.load_images(paths, workers=workers)
+            elapsed = time.perf_counter() - start
+            if baseline_time is None:
+                baseline_time, baseline_images = elapsed, images
+            elif not np.array_equal(images, baseline_images):
+                print(f"FAIL: {workers} workers produced a different matrix than the serial path")
+            print(f"{workers:>8} {elapsed:>9.2f} {len(loaded) / elapsed:>9.1f} {baseline_time / elapsed:>7.2f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", type=int, default=2000)
+    parser.add_argument("--size", type=int, nargs=2, default=[640, 480])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--resize", type=int, nargs=2, default=[64, 64])
+    args = parser.parse_args()
+    run(args.images, tuple(args.size), args.workers, tuple(args.resize))
@@ -0,0 +1,138 @@
+"""
+Perceptual-hash deduplication in ImageRetriever: rows indexed, fit time and
+query latency with and without it, on a corpus where part of the images
+are re-encoded or resized copies of others. Deduplication is index-side
+only, so every query is projected; a copy query lists the images collapsed
+into its source's row after it.
+
+It also checks that distinct images on a shared background (words drawn
+on the same white canvas) keep separate rows, and exits with status 1 if
+any of them were merged.
+
+Run from src/backend:
+    python -m benchmarks.bench_dedup --images 2000 --duplicates 0.5 --queries 200
+"""
+import argparse
+import os
+import tempfile
+import time
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+from benchmarks.common import percentiles
+from src.image.imageRetriever import ImageRetriever
+
+
+def write_layout_images(folder, n_images, size=(320, 240), seed=0):
+    """
+    Distinct photo-like images: a random 6 x 8 color layout upscaled to size,
+    plus pixel noise. Unlike write_synthetic_images, which varies only the
+    tint of one gradient, every image has its own structure.
+    """
+    os.makedirs(folder, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    paths = []
+    for i in range(n_images):
+        layout = Image.fromarray(rng.integers(0, 255, (6, 8, 3), dtype=np.uint8)).resize(size, Image.BICUBIC)
+        pixels = np.clip(np.asarray(layout, dtype=np.float64) + rng.normal(0, 10, (size[1], size[0], 3)), 0, 255)
+        path = os.path.join(folder, f"img_{i:06d}.jpg")
+        Image.fromarray(pixels.astype(np.uint8)).save(path)
+        paths.append(path)
+    return paths
+
+
+def write_text_images(folder, n_images, size=(400, 300), font_size=40, seed=0):
+    """Distinct random words drawn in black at the same spot of a white canvas."""
+    os.makedirs(folder, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    font = ImageFont.load_default(size=font_size)
+    paths = []
+    for i in range(n_images):
+        word = "".join(chr(ord("a") + int(letter)) for letter in rng.integers(0, 26, 5))
+        image = Image.new("RGB", size, "white")
+        ImageDraw.Draw(image).text((size[0] // 4, size[1] // 2 - font_size // 2), word, fill="black", font=font)
+        path = os.path.join(folder, f"text_{i:06d}_{word}.png")
+        image.save(path)
+        paths.append(path)
+    return paths
+
+
+def write_copies(folder, paths, n_copies, seed=0):
+    """Re-encoded, resized or PNG copies of random images in paths. Returns the copies and their originals."""
+    rng = np.random.default_rng(seed)
+    copies, originals = [], []
+    for i in range(n_copies):
+        source = paths[int(rng.integers(len(paths)))]
+        image = Image.open(source)
+        kind = i % 3
+        if kind == 0:
+            path = os.path.join(folder, f"copy_{i:06d}.jpg")
+            image.save(path, quality=70)
+        elif kind == 1:
+            path = os.path.join(folder, f"copy_{i:06d}.jpg")
+            image.resize((image.width * 3 // 4, image.height * 3 // 4)).save(path, quality=90)
+        else:
+            path = os.path.join(folder, f"copy_{i:06d}.png")
+            image.save(path)
+        copies.append(path)
+        originals.append(source)
+    return copies, originals
+
+
+def run(n_images, duplicate_share, n_queries, size, n_components, n_texts):
+    with tempfile.TemporaryDirectory() as folder:
+        n_copies = int(n_images * duplicate_share)
+        paths = write_layout_images(os.path.join(folder, "corpus"), n_images - n_copies, size=size)
+        copies, _ = write_copies(os.path.join(folder, "corpus"), paths, n_copies)
+        query_copies, query_sources = write_copies(folder, paths, n_queries, seed=1)
+        novel = write_layout_images(os.path.join(folder, "novel"), n_queries, size=size, seed=1)
+
+        print(f"{n_images} images ({n_copies} copies), {n_queries} queries per workload")
+        print(f"{'hash_distance':>13} {'rows':>6} {'aliases':>8} {'fit (s)':>8} {'workload':>8} {'p50 (ms)':>9} "
+              f"{'p99 (ms)':>9} {'source found':>13}")
+        for hash_distance in (None, 4):
+            retriever = ImageRetriever(n_components=n_components, resize_shape=(50, 50), hash_distance=hash_distance)
+            start = time.perf_counter()
+            retriever.fit_paths(paths + copies)
+            fit_seconds = time.perf_counter() - start
+            n_aliases = sum(len(aliases) for aliases in retriever.aliases.values())
+
+            for workload, queries in (("copies", query_copies), ("novel", novel)):
+                latencies, found = [], 0
+                for i, query in enumerate(queries):
+                    data = open(query, "rb").read()
+                    start = time.perf_counter()
+                    results = retriever.predict(data, result_limit=5)
+                    latencies.append((time.perf_counter() - start) * 1000)
+                    if workload == "copies":
+                        found += os.path.basename(query_sources[i]) in [name for name, _ in results]
+                p50, p99 = percentiles(latencies)
+                found_share = f"{found / n_queries:.2f}" if workload == "copies" else "-"
+                print(f"{str(hash_distance):>13} {len(retriever.image_paths):>6} {n_aliases:>8} {fit_seconds:>8.2f} "
+                      f"{workload:>8} {p50:>9.2f} {p99:>9.2f} {found_share:>13}")
+
+        texts = write_text_images(os.path.join(folder, "text"), n_texts)
+        merged = []
+        for hash_distance in (None, 4):
+            retriever = ImageRetriever(n_components=min(n_components, n_texts - 1), resize_shape=(50, 50),
+                                       hash_distance=hash_distance)
+            retriever.fit_paths(texts)
+            print(f"hash_distance={hash_distance}: {len(retriever.image_paths)} rows for {n_texts} distinct "
+                  f"words on a shared canvas")
+            if len(retriever.image_paths) < n_texts:
+                merged.append(hash_distance)
+        for hash_distance in merged:
+            print(f"FAIL: hash_distance={hash_distance} merged distinct words into shared rows")
+        return not merged
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", type=int, default=2000)
+    parser.add_argument("--duplicates", type=float, default=0.5)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--size", type=int, nargs=2, default=[320, 240])
+    parser.add_argument("--components", type=int, default=50)
+    parser.add_argument("--texts", type=int, default=200, help="distinct words drawn for the shared-background check")
+    args = parser.parse_args()
+    ok = run(args.images, args.duplicates, args.queries, tuple(args.size), args.components, args.texts)
+    raise SystemExit(0 if ok else 1)
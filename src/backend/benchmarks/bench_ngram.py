@@ -0,0 +1,46 @@
+"""
+Interval n-gram inverted index vs the linear histogram scan for short,
+transposed, slightly wrong snippets.
+
+Run from src/backend:
+    python -m benchmarks.bench_ngram --sizes 1000 10000 --snippet 12 24
+"""
+import argparse
+import time
+from benchmarks.common import synthetic_melodies, hummed_snippets, percentiles
+from src.audio.audioRetriever import AudioRetriever
+
+
+def run(sizes, snippet_lengths, n_queries, song_length):
+    print(f"{'songs':>7} {'snippet':>8} {'method':>10} {'top-1':>6} {'p50 (ms)':>9} {'p99 (ms)':>9}")
+    for n_songs in sizes:
+        retriever = AudioRetriever()
+        songs = synthetic_melodies(n_songs, length=song_length)
+        retriever.database = {f"song_{i}.mid": notes for i, notes in enumerate(songs)}
+        retriever.build_features()
+
+        for length in snippet_lengths:
+            queries, sources = hummed_snippets(songs, n_queries, length=length)
+            for method in ("histogram", "ngram"):
+                latencies, correct = [], 0
+                for query, source in zip(queries, sources):
+                    start = time.perf_counter()
+                    if method == "ngram":
+                        found = retriever.search_snippet(query, result_limit=1)
+                    else:
+                        found = retriever.rank(retriever.score(retriever.feature_vector(query)),
+                                               threshold=-1, result_limit=1)
+                    latencies.append((time.perf_counter() - start) * 1000)
+                    correct += bool(found) and found[0][0] == f"song_{source}.mid"
+                p50, p99 = percentiles(latencies)
+                print(f"{n_songs:>7} {length:>8} {method:>10} {correct / n_queries:>6.2f} {p50:>9.3f} {p99:>9.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--snippet", type=int, nargs="+", default=[12, 24])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--song-length", type=int, default=400)
+    args = parser.parse_args()
+    run(args.sizes, args.snippet, args.queries, args.song_length)
@@ -0,0 +1,63 @@
+"""
+Fit time, peak memory and subspace agreement of the PCAProcessor solvers,
+on a steep spectrum (rank 64, scales ~ 1/k) and a flat one (rank 600,
+scales ~ 1/sqrt(k)). Every solver must stay within the tolerance on both;
+"auto" must pick an exact solver. The randomized solver adds power
+iterations until it converges and falls back to the Gram solver when it
+does not. The "ran" column shows the solver that actually produced the fit.
+
+Run from src/backend:
+    python -m benchmarks.bench_pca --sizes 1000 5000 20000
+"""
+import argparse
+from benchmarks.common import measure, synthetic_image_matrix, subspace_error, format_bytes
+from src.image.imageProcessing import PCAProcessor
+
+# name -> (rank, decay) of synthetic_image_matrix
+SPECTRA = {"steep": (64, 1.0), "flat": (600, 0.5)}
+
+
+def run(sizes, n_features, n_components, tolerance, full_max, spectra):
+    """
+    The exact SVD is the reference up to full_max samples; above that it is
+    skipped and the Gram solver (which agrees with it to ~1e-8) is used instead.
+    """
+    print(f"{'spectrum':>8} {'N':>8} {'solver':>11} {'ran':>10} {'fit (s)':>9} {'peak mem':>10} "
+          f"{'subspace err':>13}")
+    failures = []
+    for spectrum in spectra:
+        rank, decay = SPECTRA[spectrum]
+        for n_samples in sizes:
+            images = synthetic_image_matrix(n_samples, n_features=n_features, rank=rank, decay=decay)
+            reference = None
+            solvers = ("full", "gram", "auto", "randomized") if n_samples <= full_max else ("gram", "auto",
+                                                                                            "randomized")
+            for solver in solvers:
+                pca = PCAProcessor(n_components=n_components, solver=solver)
+                _, elapsed, peak = measure(pca.fit, images)
+                if reference is None:
+                    reference = pca.components
+                error = subspace_error(reference, pca.components)
+                if error > tolerance:
+                    failures.append((spectrum, n_samples, solver,
+                                     f"differs from the exact subspace by {error:.2e} (> {tolerance:.0e})"))
+                if solver == "auto" and pca.fitted_solver == "randomized":
+                    failures.append((spectrum, n_samples, solver, "picked the approximate randomized solver"))
+                print(f"{spectrum:>8} {n_samples:>8} {solver:>11} {pca.fitted_solver:>10} {elapsed:>9.3f} "
+                      f"{format_bytes(peak):>10} {error:>13.2e}")
+    for spectrum, n_samples, solver, reason in failures:
+        print(f"FAIL: {solver} on the {spectrum} spectrum at N={n_samples} {reason}")
+    return not failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 5000, 20000])
+    parser.add_argument("--features", type=int, default=4096)
+    parser.add_argument("--components", type=int, default=50)
+    parser.add_argument("--tolerance", type=float, default=1e-3)
+    parser.add_argument("--full-max", type=int, default=5000, help="largest N to run the exact SVD on")
+    parser.add_argument("--spectra", nargs="+", choices=list(SPECTRA), default=list(SPECTRA))
+    args = parser.parse_args()
+    ok = run(args.sizes, args.features, args.components, args.tolerance, args.full_max, args.spectra)
+    raise SystemExit(0 if ok else 1)
@@ -0,0 +1,66 @@
+"""
+Per-image preprocessing cost of ImageProcessor.load_image, "exact" (full
+resolution float64 grayscale, then resize) against "fast" (JPEG draft
+decoding, native "L" conversion, reducing resize, uint8 throughout), on
+large photos. Also reports how far the fast rows are from the exact ones
+and the peak memory of one decode in a fresh process.
+
+Run from src/backend:
+    python -m benchmarks.bench_preprocess --images 10 --size 4000 3000
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+from benchmarks.common import write_synthetic_images
+from src.image.imageProcessing import ImageProcessor
+
+
+def decode_peak_rss(path, mode, resize_shape):
+    """Peak RSS growth (MB) of decoding one image in a fresh process."""
+    code = (
+        "import sys; from benchmarks.common import peak_rss; "
+        "from src.image.imageProcessing import ImageProcessor; "
+        f"p = ImageProcessor(resize_shape={tuple(resize_shape)!r}, preprocessing={mode!r}); "
+        "before = peak_rss(); p.load_image(sys.argv[1]); print((peak_rss() - before) / 2 ** 20)"
+    )
+    backend = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.run([sys.executable, "-c", code, path], cwd=backend, capture_output=True, text=True,
+                            check=True).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def run(n_images, size, resize_shape, formats):
+    print(f"{n_images} images of {size[0]}x{size[1]} -> {resize_shape[0]}x{resize_shape[1]}")
+    for fmt in formats:
+        with tempfile.TemporaryDirectory() as folder:
+            paths = write_synthetic_images(folder, n_images, size=size, fmt=fmt)
+            rows = {}
+            print(f"\n{fmt}: {'mode':>6} {'ms/image':>9} {'speedup':>8} {'peak MB':>8}")
+            for mode in ("exact", "fast"):
+                processor = ImageProcessor(resize_shape=resize_shape, preprocessing=mode)
+                processor.load_image(paths[0])
+                start = time.perf_counter()
+                rows[mode] = np.array([processor.load_image(path) for path in paths])
+                elapsed = (time.perf_counter() - start) / n_images
+                if mode == "exact":
+                    exact_time = elapsed
+                peak = decode_peak_rss(paths[0], mode, resize_shape)
+                print(f"{'':>{len(fmt) + 1}} {mode:>6} {elapsed * 1000:>9.1f} {exact_time / elapsed:>7.2f}x {peak:>8.1f}")
+
+            difference = np.abs(rows["fast"].astype(np.int16) - rows["exact"].astype(np.int16))
+            print(f"  fast vs exact: mean |diff| {difference.mean():.2f}, p99 {np.percentile(difference, 99):.0f}, "
+                  f"max {difference.max()} gray levels")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", type=int, default=10)
+    parser.add_argument("--size", type=int, nargs=2, default=[4000, 3000])
+    parser.add_argument("--resize", type=int, nargs=2, default=[64, 64])
+    parser.add_argument("--formats", nargs="+", default=["jpg", "png"])
+    args = parser.parse_args()
+    run(args.images, tuple(args.size), tuple(args.resize), args.formats)
@@ -0,0 +1,120 @@
+"""
+Backend startup cost: time from process launch to the first /health
+response and to the first image and audio predictions, in fresh
+processes against a saved image index and a MIDI corpus.
+
+Run from src/backend:
+    python -m benchmarks.bench_startup --runs 5
+"""
+import argparse
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+import numpy as np
+from benchmarks.common import write_synthetic_images, synthetic_melodies, write_synthetic_midis, write_synthetic_wavs
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def prepare(workdir, n_images, n_songs):
+    """Write settings, a fitted image index, a MIDI corpus and the queries into workdir."""
+    shutil.copy(os.path.join(BACKEND, "settings.json"), workdir)
+    os.chdir(workdir)
+    sys.path.insert(0, BACKEND)
+    from src.settings import load_settings
+    from models.image_model import ImageModel
+
+    images = write_synthetic_images(os.path.join("corpus", "images"), n_images, size=(160, 120), fmt="png")
+    ImageModel(load_settings()["IMAGE_CONFIG"]).fit(os.path.join("corpus", "images"))
+    shutil.copy(images[0], "query.png")
+
+    songs = synthetic_melodies(n_songs, length=40)
+    write_synthetic_midis(os.path.join("corpus", "midi"), songs)
+    query = write_synthetic_wavs("queries", [songs[0][:16]])[0]
+    shutil.move(query, "query.wav")
+
+
+def child(launched, warm_up):
+    """Runs in a fresh process inside the prepared workdir; prints timestamps as JSON."""
+    timings = {}
+    import main
+    timings["import"] = time.time() - launched
+    client = main.app.test_client()
+    client.get("/health")
+    timings["health"] = time.time() - launched
+
+    if warm_up:
+        start = time.time()
+        client.post("/warmup")
+        timings["warm_up_call"] = time.time() - start
+
+    start = time.time()
+    response = client.post("/predict/image", data={"image": (open("query.png", "rb"), "query.png")})
+    assert response.status_code == 200, response.json
+    timings["first_image_prediction"] = time.time() - start
+    timings["time_to_first_image_prediction"] = time.time() - launched
+
+    midi_files = sorted(os.listdir(os.path.join("corpus", "midi")))
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w") as zip_file:
+        for name in midi_files:
+            zip_file.write(os.path.join("corpus", "midi", name), name)
+    archive.seek(0)
+    response = client.post("/upload/audio", data={"file": (archive, "songs.zip"), "wait": "true"})
+    assert response.status_code == 201, response.json
+
+    for label in ("first_audio_prediction", "second_audio_prediction"):
+        start = time.time()
+        response = client.post("/predict/audio", data={"audio": (open("query.wav", "rb"), "query.wav")})
+        assert response.status_code == 200, response.json
+        timings[label] = time.time() - start
+        # A repeat would be answered from the result cache.
+        main.audio_model.result_cache.clear()
+
+    print("TIMINGS " + json.dumps(timings))
+
+
+def run_trial(workdir, warm_up):
+    env = dict(os.environ, PYTHONPATH=BACKEND + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    command = [sys.executable, "-m", "benchmarks.bench_startup", "--child", str(time.time())]
+    if warm_up:
+        command.append("--warm-up")
+    output = subprocess.run(command, cwd=workdir, env=env, capture_output=True, text=True, check=True).stdout
+    line = next(line for line in output.splitlines() if line.startswith("TIMINGS "))
+    return json.loads(line[len("TIMINGS "):])
+
+
+def run(runs, n_images, n_songs):
+    workdir = tempfile.mkdtemp(prefix="bench_startup_")
+    cwd = os.getcwd()
+    try:
+        prepare(workdir, n_images, n_songs)
+        os.chdir(cwd)
+        for warm_up in (False, True):
+            trials = [run_trial(workdir, warm_up) for _ in range(runs)]
+            print(f"\n{'with' if warm_up else 'without'} /warmup (median of {runs} runs)")
+            for metric in trials[0]:
+                print(f"  {metric:<32} {np.median([trial[metric] for trial in trials]) * 1000:>9.1f} ms")
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--images", type=int, default=200)
+    parser.add_argument("--songs", type=int, default=50)
+    parser.add_argument("--child", type=float, help=argparse.SUPPRESS)
+    parser.add_argument("--warm-up", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child is not None:
+        child(args.child, args.warm_up)
+    else:
+        run(args.runs, args.images, args.songs)
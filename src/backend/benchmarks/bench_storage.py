@@ -0,0 +1,59 @@
+"""
+Memory, recall and latency of the projection storage modes.
+
+float64 is the exact baseline; float32 halves the index; int8 scans
+quantized codes and re-ranks a shortlist on the full-precision rows.
+
+Run from src/backend:
+    python -m benchmarks.bench_storage --sizes 20000 100000 --rerank 2 5 10
+"""
+import argparse
+import numpy as np
+from benchmarks.common import synthetic_projections, percentiles, format_bytes
+from benchmarks.bench_ann import timed_search
+from src.image.imageRetriever import ImageRetriever
+
+
+def make_retriever(projections, storage, rerank_factor=10):
+    retriever = ImageRetriever(storage=storage, rerank_factor=rerank_factor)
+    retriever.projections = projections
+    retriever.deleted = np.zeros(len(projections), dtype=bool)
+    retriever.pca_processor.mean_image = np.zeros(projections.shape[1])
+    retriever.pca_processor.components = np.eye(projections.shape[1])
+    retriever.compact()
+    return retriever
+
+
+def run(sizes, rerank_factors, n_queries, k):
+    print(f"{'N':>8} {'mode':>12} {'index size':>11} {'recall@k':>9} {'p50 (ms)':>9} {'p99 (ms)':>9}")
+    for n_samples in sizes:
+        data = synthetic_projections(n_samples + n_queries)
+        projections, queries = data[:n_samples], data[n_samples:]
+
+        modes = [("float64", None), ("float32", None)] + [("int8", factor) for factor in rerank_factors]
+        exact = None
+        for storage, factor in modes:
+            retriever = make_retriever(projections, storage, factor or 10)
+            found, latencies = timed_search(retriever, queries, k)
+            if exact is None:
+                exact = found
+            recall = np.mean([len(a & e) / len(e) for a, e in zip(found, exact)])
+            # The int8 codes are what a query scans; the full-precision rows
+            # it re-ranks stay memory-mapped on disk once the index is saved.
+            if retriever.quantizer is not None:
+                size = retriever.quantizer.codes.nbytes + retriever.quantizer.code_norms.nbytes
+            else:
+                size = retriever.projections.nbytes
+            p50, p99 = percentiles(latencies)
+            label = storage if factor is None else f"int8 x{factor}"
+            print(f"{n_samples:>8} {label:>12} {format_bytes(size):>11} {recall:>9.3f} {p50:>9.2f} {p99:>9.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[20000, 100000])
+    parser.add_argument("--rerank", type=int, nargs="+", default=[2, 5, 10])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=10)
+    args = parser.parse_args()
+    run(args.sizes, args.rerank, args.queries, args.k)
@@ -0,0 +1,73 @@
+"""
+One-shot vs block-streamed transcription of long audio files: wall time,
+peak memory of a fresh process and whether both produce the same notes.
+
+Run from src/backend:
+    python -m benchmarks.bench_streaming --minutes 5 20 --block 30
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import numpy as np
+from benchmarks.common import synthetic_melodies, write_synthetic_wavs
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def child(path, block_seconds, streaming):
+    """Runs in a fresh process: transcribe path once and print timings, peak memory and notes as JSON."""
+    import time
+    from benchmarks.common import peak_rss
+    from src.audio.audioProcessing import AudioProcessor
+    processor = AudioProcessor(block_seconds=block_seconds, stream_min_seconds=0 if streaming else None)
+    processor.warm_up()
+    before = peak_rss()
+    start = time.perf_counter()
+    notes = processor.transcribe(path)
+    print("RESULT " + json.dumps({
+        "seconds": time.perf_counter() - start,
+        "peak_mb": (peak_rss() - before) / 2 ** 20,
+        "notes": notes.tolist(),
+    }))
+
+
+def measure(path, block_seconds, streaming):
+    command = [sys.executable, "-m", "benchmarks.bench_streaming", "--child", path, "--block", str(block_seconds)]
+    if streaming:
+        command.append("--streaming")
+    output = subprocess.run(command, cwd=BACKEND, capture_output=True, text=True, check=True).stdout
+    line = next(line for line in output.splitlines() if line.startswith("RESULT "))
+    return json.loads(line[len("RESULT "):])
+
+
+def run(minutes_list, block_seconds, sample_rate):
+    print(f"{'minutes':>8} {'mode':>10} {'time (s)':>9} {'peak MB':>8} {'notes':>7} {'same':>5}")
+    with tempfile.TemporaryDirectory() as folder:
+        for minutes in minutes_list:
+            note_seconds = 0.3
+            songs = synthetic_melodies(1, length=int(minutes * 60 / note_seconds))
+            path = write_synthetic_wavs(os.path.join(folder, str(minutes)), songs, sample_rate=sample_rate,
+                                        note_seconds=note_seconds)[0]
+            oneshot = measure(path, block_seconds, streaming=False)
+            streamed = measure(path, block_seconds, streaming=True)
+            same = np.array_equal(oneshot["notes"], streamed["notes"])
+            for mode, result in (("one-shot", oneshot), ("streamed", streamed)):
+                print(f"{minutes:>8} {mode:>10} {result['seconds']:>9.1f} {result['peak_mb']:>8.0f} "
+                      f"{len(result['notes']):>7} {str(same):>5}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--minutes", type=float, nargs="+", default=[5, 20])
+    parser.add_argument("--block", type=float, default=30.0)
+    parser.add_argument("--sample-rate", type=int, default=44100)
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--streaming", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args.child, args.block, args.streaming)
+    else:
+        run(args.minutes, args.block, args.sample_rate)
@@ -0,0 +1,88 @@
+"""
+Accurate vs fast transcription tier: time to transcribe a hummed query and
+the retrieval accuracy it leads to, on the MIDI fixtures in test/.
+
+Every fixture song is indexed from its MIDI notes; queries are excerpts of
+them rendered as audio (with overtones and noise) and transcribed by each
+tier before the usual histogram, ngram and cascade matching.
+
+Run from src/backend:
+    python -m benchmarks.bench_tiers --queries 100 --excerpt 40 --noise 0.02
+"""
+import argparse
+import os
+import tempfile
+import time
+import zipfile
+import numpy as np
+from benchmarks.common import percentiles, write_synthetic_wavs
+from src.audio.audioRetriever import AudioRetriever
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "test", "midi_dataset (2).zip")
+
+
+def excerpts(songs, n_queries, length, seed=1):
+    """Random excerpts of length notes (whole songs when shorter). Returns (excerpts, source song ids)."""
+    rng = np.random.default_rng(seed)
+    queries, sources = [], []
+    for _ in range(n_queries):
+        song_id = int(rng.integers(len(songs)))
+        song = songs[song_id]
+        start = int(rng.integers(max(1, len(song) - length + 1)))
+        queries.append(song[start:start + length])
+        sources.append(song_id)
+    return queries, sources
+
+
+def run(archive, n_queries, excerpt_length, noise, sample_rate):
+    with tempfile.TemporaryDirectory() as folder:
+        with zipfile.ZipFile(archive) as zip_file:
+            zip_file.extractall(os.path.join(folder, "midi"))
+        retriever = AudioRetriever()
+        retriever.fit(os.path.join(folder, "midi"))
+        retriever.warm_up()
+        songs = list(retriever.database.values())
+        names = [os.path.basename(path) for path in retriever.song_paths]
+
+        queries, sources = excerpts([retriever.drop_repeats(np.asarray(song)) for song in songs], n_queries,
+                                    excerpt_length)
+        paths = write_synthetic_wavs(os.path.join(folder, "queries"), queries, sample_rate=sample_rate,
+                                     harmonics=(1.0, 0.5, 0.25), noise=noise)
+
+        print(f"{len(songs)} songs from {os.path.basename(archive)}, {n_queries} queries of {excerpt_length} notes, "
+              f"noise {noise}")
+        print(f"{'tier':>9} {'p50 (ms)':>9} {'p99 (ms)':>9} {'speedup':>8} {'method':>10} {'top-1':>6} {'top-5':>6}")
+        baseline = None
+        for tier in retriever.TIERS:
+            latencies, transcribed = [], []
+            for path in paths:
+                start = time.perf_counter()
+                transcribed.append(retriever.transcribe(path, tier=tier))
+                latencies.append((time.perf_counter() - start) * 1000)
+            p50, p99 = percentiles(latencies)
+            baseline = baseline or p50
+            for method, threshold in (("histogram", -1), ("ngram", 0.0), ("cascade", 0.0)):
+                top1, top5 = 0, 0
+                for notes, source in zip(transcribed, sources):
+                    if method == "ngram":
+                        found = retriever.search_snippet(notes, threshold=threshold, result_limit=5)
+                    else:
+                        scores = retriever.score(retriever.feature_vector(notes))
+                        found = (retriever.rank(scores, threshold=threshold, result_limit=5) if method == "histogram"
+                                 else retriever.rerank(notes, scores, threshold=threshold, result_limit=5))
+                    found = [name for name, _ in found]
+                    top1 += bool(found) and found[0] == names[source]
+                    top5 += names[source] in found
+                print(f"{tier:>9} {p50:>9.1f} {p99:>9.1f} {baseline / p50:>7.1f}x {method:>10} "
+                      f"{top1 / n_queries:>6.2f} {top5 / n_queries:>6.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--archive", default=os.path.normpath(FIXTURES))
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--excerpt", type=int, default=40)
+    parser.add_argument("--noise", type=float, default=0.02)
+    parser.add_argument("--sample-rate", type=int, default=44100)
+    args = parser.parse_args()
+    run(args.archive, args.queries, args.excerpt, args.noise, args.sample_rate)
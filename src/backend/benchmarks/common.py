@@ -0,0 +1,166 @@
+import os
+import time
+import tracemalloc
+import numpy as np
+
+
+def measure(fn, *args, **kwargs):
+    """
+    Run fn once and return (result, seconds, peak_bytes).
+    Peak memory is taken from tracemalloc, which also tracks NumPy buffers.
+    """
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        result = fn(*args, **kwargs)
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def synthetic_image_matrix(n_samples, n_features=4096, rank=64, noise=8.0, seed=0, decay=1.0):
+    """
+    Flattened grayscale images with a decaying spectrum: a low-rank signal
+    whose k-th direction has scale 60 / k**decay, plus pixel noise, clipped
+    to the 0..255 range.
+    """
+    rng = np.random.default_rng(seed)
+    basis = rng.standard_normal((rank, n_features))
+    scales = 60.0 / np.arange(1, rank + 1) ** decay
+    latent = rng.standard_normal((n_samples, rank)) * scales
+    images = 128.0 + latent @ basis + noise * rng.standard_normal((n_samples, n_features))
+    return np.clip(images, 0, 255)
+
+
+def subspace_error(components_a, components_b):
+    """Sine of the largest principal angle between two row subspaces."""
+    qa, _ = np.linalg.qr(components_a.T)
+    qb, _ = np.linalg.qr(components_b.T)
+    cosines = np.linalg.svd(qa.T @ qb, compute_uv=False)
+    return float(np.sqrt(max(0.0, 1.0 - np.min(cosines) ** 2)))
+
+
+def format_bytes(n_bytes):
+    return f"{n_bytes / (1024 * 1024):.1f} MB"
+
+
+def write_synthetic_images(folder, n_images, size=(640, 480), fmt="jpg", seed=0):
+    """Write n_images random photo-like RGB images to folder and return their paths."""
+    from PIL import Image
+    os.makedirs(folder, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    width, height = size
+    gradient = np.linspace(0, 255, width)[None, :, None]
+    paths = []
+    for i in range(n_images):
+        tint = rng.integers(0, 255, 3)[None, None, :]
+        noise = rng.normal(0, 25, (height, width, 3))
+        pixels = np.clip(0.5 * gradient + 0.5 * tint + noise, 0, 255).astype(np.uint8)
+        path = os.path.join(folder, f"img_{i:06d}.{fmt}")
+        Image.fromarray(pixels).save(path)
+        paths.append(path)
+    return paths
+
+
+def synthetic_projections(n_samples, n_components=50, n_clusters=200, seed=0):
+    """
+    Clustered points standing in for PCA projections of a real corpus.
+    n_clusters=0 gives centered points with decaying variance and no
+    clusters, where nearest neighbours under different metrics disagree.
+    """
+    rng = np.random.default_rng(seed)
+    scales = 400.0 / np.sqrt(np.arange(1, n_components + 1))
+    if n_clusters == 0:
+        return rng.standard_normal((n_samples, n_components)) * scales
+    centers = rng.standard_normal((n_clusters, n_components)) * 400.0
+    labels = rng.integers(0, n_clusters, n_samples)
+    return centers[labels] + rng.standard_normal((n_samples, n_components)) * scales
+
+
+def percentiles(samples_ms):
+    samples_ms = np.asarray(samples_ms)
+    return float(np.percentile(samples_ms, 50)), float(np.percentile(samples_ms, 99))
+
+
+def synthetic_melodies(n_songs, length=400, seed=0):
+    """Random-walk melodies (MIDI note numbers) with mostly stepwise motion."""
+    rng = np.random.default_rng(seed)
+    steps = rng.choice([-7, -5, -4, -3, -2, -1, 0, 1, 2, 3, 4, 5, 7], size=(n_songs, length))
+    starts = rng.integers(55, 72, size=(n_songs, 1))
+    return [np.clip(row, 21, 108).astype(np.int64) for row in starts + np.cumsum(steps, axis=1)]
+
+
+def hummed_snippets(songs, n_queries, length=16, noise=0.05, seed=1):
+    """
+    Transposed excerpts of random songs with a few wrong notes.
+    Returns (snippets, source song ids).
+    """
+    rng = np.random.default_rng(seed)
+    snippets, sources = [], []
+    for _ in range(n_queries):
+        song_id = int(rng.integers(len(songs)))
+        start = int(rng.integers(len(songs[song_id]) - length))
+        snippet = songs[song_id][start:start + length] + int(rng.integers(-5, 6))
+        wrong = rng.random(length) < noise
+        snippet[wrong] += rng.choice([-1, 1], size=int(wrong.sum()))
+        snippets.append(snippet)
+        sources.append(song_id)
+    return snippets, sources
+
+
+def write_synthetic_midis(folder, songs, prefix="song"):
+    """Write each note sequence as a MIDI file in folder and return the paths."""
+    from src.audio.audioProcessing import AudioProcessor
+    os.makedirs(folder, exist_ok=True)
+    processor = AudioProcessor()
+    paths = []
+    for i, notes in enumerate(songs):
+        path = os.path.join(folder, f"{prefix}_{i:06d}.mid")
+        processor.write_midi(notes, path)
+        paths.append(path)
+    return paths
+
+
+def write_synthetic_wavs(folder, songs, sample_rate=22050, note_seconds=0.25, prefix="song", harmonics=(1.0,),
+                         noise=0.0, seed=0):
+    """
+    Render each note sequence as a WAV file of tones with the given harmonic
+    amplitudes (a pure sine by default) plus white noise of standard
+    deviation noise, and return the paths.
+    """
+    import soundfile
+    os.makedirs(folder, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(sample_rate * note_seconds)) / sample_rate
+    envelope = np.minimum(1.0, np.minimum(t, t[::-1]) * 50)
+    paths = []
+    for i, notes in enumerate(songs):
+        frequencies = 440.0 * 2 ** ((np.asarray(notes) - 69) / 12)
+        tones = sum(amplitude * np.sin(2 * np.pi * k * frequencies[:, None] * t)
+                    for k, amplitude in enumerate(harmonics, start=1))
+        signal = (0.5 * envelope * tones / sum(harmonics)).ravel()
+        if noise:
+            signal = signal + noise * rng.standard_normal(len(signal))
+        path = os.path.join(folder, f"{prefix}_{i:06d}.wav")
+        soundfile.write(path, signal.astype(np.float32), sample_rate)
+        paths.append(path)
+    return paths
+
+
+def peak_rss():
+    """Peak resident set size of this process in bytes."""
+    import resource
+    import sys
+    # ru_maxrss survives exec on Linux, so a child started by a large parent
+    # would report the parent's peak; VmHWM is reset with the address space.
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
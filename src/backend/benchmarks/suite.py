@@ -0,0 +1,265 @@
+"""
+End-to-end benchmark suite: ingest throughput, query latency and peak
+memory of the image and audio pipelines on synthetic corpora.
+
+Every case runs in a fresh process, so its peak RSS is its own. Results
+are written as JSON and, given a baseline, compared metric by metric;
+the run exits with status 1 when a metric regresses beyond the tolerance.
+
+Run from src/backend:
+    python -m benchmarks.suite --preset small --save-baseline
+    python -m benchmarks.suite --preset small --baseline benchmarks/baseline_small.json
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import multiprocessing
+import numpy as np
+from benchmarks.common import (synthetic_image_matrix, synthetic_projections, write_synthetic_images,
+                               synthetic_melodies, hummed_snippets, write_synthetic_midis,
+                               write_synthetic_wavs, percentiles, peak_rss)
+
+PRESETS = {
+    "small": {"pca": [2000], "similarity": [20000], "image": [200], "midi": [200], "wav": [10]},
+    "medium": {"pca": [2000, 10000], "similarity": [20000, 100000], "image": [200, 1000],
+               "midi": [200, 2000], "wav": [10, 40]},
+    "large": {"pca": [10000, 50000], "similarity": [100000, 500000], "image": [1000, 5000],
+              "midi": [2000, 20000], "wav": [40, 160]},
+}
+
+# Metrics ending in "_per_s" are better when higher, every other metric
+# (latencies, seconds, bytes) is better when lower.
+HIGHER_IS_BETTER = "_per_s"
+
+
+def timed(fn, queries):
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        fn(query)
+        latencies.append((time.perf_counter() - start) * 1000)
+    p50, p99 = percentiles(latencies)
+    return {"p50_ms": p50, "p99_ms": p99}
+
+
+def bench_pca(size, n_queries):
+    from src.image.imageProcessing import PCAProcessor
+    images = synthetic_image_matrix(size)
+    start = time.perf_counter()
+    processor = PCAProcessor(n_components=50)
+    processor.fit(images)
+    elapsed = time.perf_counter() - start
+    result = {"fit_s": elapsed, "fit_rows_per_s": size / elapsed}
+    result.update(timed(processor.project, images[:n_queries]))
+    return result
+
+
+def bench_similarity(size, n_queries):
+    from src.similarity import SimilarityCalculator
+    data = synthetic_projections(size + n_queries)
+    projections, queries = data[:size], data[size:]
+    # Norms are cached once per index, as ImageRetriever.similarity_engine does.
+    engine = SimilarityCalculator(projections)
+    return timed(lambda query: engine.rank(engine.scores(query)[None, :], 10), queries)
+
+
+def bench_image(size, n_queries):
+    from src.image.imageRetriever import ImageRetriever
+    folder = tempfile.mkdtemp(prefix="bench_image_")
+    try:
+        paths = write_synthetic_images(folder, size, size=(160, 120), fmt="png")
+        retriever = ImageRetriever(n_components=min(50, size))
+        start = time.perf_counter()
+        retriever.fit(folder)
+        elapsed = time.perf_counter() - start
+        result = {"fit_s": elapsed, "fit_images_per_s": size / elapsed}
+        queries = [open(path, "rb").read() for path in paths[:n_queries]]
+        result.update(timed(retriever.predict, queries))
+
+        # A removed image must never come back from a batch, even with the
+        # default (unbounded) max_distance and a result_limit above the live rows.
+        removed = os.path.basename(paths[0])
+        retriever.remove([removed])
+        batch, _ = retriever.predict_batch(queries, result_limit=size)
+        returned = {name for results in batch for name, _ in results}
+        assert removed not in returned, f"removed image {removed} returned by predict_batch"
+        return result
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+def midi_bytes(notes):
+    from src.audio.audioProcessing import AudioProcessor
+    with tempfile.NamedTemporaryFile(suffix=".mid") as tmp:
+        AudioProcessor().write_midi(notes, tmp.name)
+        return open(tmp.name, "rb").read()
+
+
+def bench_midi(size, n_queries):
+    from src.audio.audioRetriever import AudioRetriever
+    folder = tempfile.mkdtemp(prefix="bench_midi_")
+    try:
+        songs = synthetic_melodies(size)
+        write_synthetic_midis(folder, songs)
+        retriever = AudioRetriever(workers=1)
+        start = time.perf_counter()
+        retriever.fit(folder)
+        elapsed = time.perf_counter() - start
+        result = {"fit_s": elapsed, "fit_songs_per_s": size / elapsed}
+        snippets, _ = hummed_snippets(songs, n_queries, length=64)
+        queries = [midi_bytes(snippet) for snippet in snippets]
+        histogram = timed(lambda data: retriever.predict(data, filename="query.mid"), queries)
+        ngram = timed(lambda data: retriever.predict(data, threshold=0.0, method="ngram", filename="query.mid"),
+                      queries)
+        result.update({f"histogram_{key}": value for key, value in histogram.items()})
+        result.update({f"ngram_{key}": value for key, value in ngram.items()})
+        return result
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+def bench_wav(size, n_queries):
+    from src.audio.audioRetriever import AudioRetriever
+    folder = tempfile.mkdtemp(prefix="bench_wav_")
+    try:
+        songs = synthetic_melodies(size, length=40)
+        write_synthetic_wavs(folder, songs)
+        retriever = AudioRetriever(workers=1)
+        start = time.perf_counter()
+        retriever.fit(folder)
+        elapsed = time.perf_counter() - start
+        result = {"fit_s": elapsed, "fit_songs_per_s": size / elapsed}
+        snippets, _ = hummed_snippets(songs, min(n_queries, 5), length=16)
+        queries = []
+        for snippet in snippets:
+            query_folder = os.path.join(folder, "query")
+            path = write_synthetic_wavs(query_folder, [snippet])[0]
+            queries.append(open(path, "rb").read())
+        result.update(timed(lambda data: retriever.predict(data, filename="query.wav"), queries))
+        return result
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+CASES = {
+    "pca": bench_pca,
+    "similarity": bench_similarity,
+    "image": bench_image,
+    "midi": bench_midi,
+    "wav": bench_wav,
+}
+
+
+def run_case(case, size, n_queries):
+    """Child-process entry point: one case at one size, with its peak RSS."""
+    result = CASES[case](size, n_queries)
+    result["peak_rss_bytes"] = peak_rss()
+    return result
+
+
+def run(preset, cases, n_queries):
+    results = {}
+    context = multiprocessing.get_context("spawn")
+    for case in cases:
+        for size in PRESETS[preset][case]:
+            name = f"{case}@{size}"
+            print(f"Running {name}...", flush=True)
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                results[name] = executor.submit(run_case, case, size, n_queries).result()
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def report(results):
+    print(f"{'case':<18} {'metric':<22} {'value':>14}")
+    for name, metrics in results.items():
+        for metric, value in metrics.items():
+            print(f"{name:<18} {metric:<22} {value:>14.3f}")
+
+
+def compare(results, baseline, tolerance):
+    """
+    Print each metric against the baseline and return the regressions:
+    metrics worse than the baseline by more than tolerance (a fraction).
+    """
+    regressions = []
+    print(f"{'case':<18} {'metric':<22} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name, metrics in results.items():
+        for metric, value in metrics.items():
+            reference = baseline.get(name, {}).get(metric)
+            if reference is None or reference == 0:
+                continue
+            change = value / reference - 1
+            worse = -change if metric.endswith(HIGHER_IS_BETTER) else change
+            flag = ""
+            if worse > tolerance:
+                flag = "  REGRESSION"
+                regressions.append((name, metric))
+            print(f"{name:<18} {metric:<22} {reference:>12.3f} {value:>12.3f} {change:>+8.1%}{flag}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--preset", choices=sorted(PRESETS), default="small")
+    parser.add_argument("--cases", nargs="+", choices=list(CASES), default=list(CASES))
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--output", help="Results JSON (default: results/bench_<preset>_<timestamp>.json)")
+    parser.add_argument("--baseline", help="Baseline JSON to compare against")
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="Also store the results as benchmarks/baseline_<preset>.json")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Allowed relative slowdown before a metric counts as a regression")
+    args = parser.parse_args()
+
+    results = run(args.preset, args.cases, args.queries)
+    report(results)
+
+    document = {
+        "meta": {
+            "preset": args.preset,
+            "queries": args.queries,
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "results": results,
+    }
+    output = args.output or os.path.join(
+        "results", f"bench_{args.preset}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(document, f, indent=2)
+    print(f"Results written to {output}")
+
+    if args.save_baseline:
+        baseline_path = os.path.join("benchmarks", f"baseline_{args.preset}.json")
+        with open(baseline_path, "w") as f:
+            json.dump(document, f, indent=2)
+        print(f"Baseline stored in {baseline_path}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline["results"], args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} metric(s) regressed by more than {args.tolerance:.0%}")
+            sys.exit(1)
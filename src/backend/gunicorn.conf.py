@@ -0,0 +1,21 @@
+# Multi-process serving: gunicorn -c gunicorn.conf.py main:app
+#
+# Every worker imports main.py on its own and opens the same memory-mapped
+# index generations (data/image_index, data/audio_index), so N workers use
+# about the memory of one index. A rebuild runs as a job in the worker that
+# received the upload; the others notice the new generation marker and
+# reload within SERVING_CONFIG.reload_interval seconds. The mapper and job
+# records live in SERVING_CONFIG.store_path.
+import multiprocessing
+import os
+
+bind = os.environ.get("BIND", "0.0.0.0:5000")
+workers = int(os.environ.get("WEB_CONCURRENCY", min(4, multiprocessing.cpu_count())))
+# Threads let a worker keep answering queries while its rebuild job runs.
+worker_class = "gthread"
+threads = int(os.environ.get("THREADS", 4))
+# Uploads with wait=true block until the rebuild has finished.
+timeout = 600
+# Load the app in each worker, not in the master: background job threads
+# and process pools must not be forked half-initialized.
+preload_app = False
@@ -1,28 +1,318 @@
-from flask import Flask, request, jsonify, send_file, send_from_directory
+from flask import Flask, request, jsonify, send_file, send_from_directory, g, Response
 from flask_cors import CORS
 from models.image_model import ImageModel
 from models.audio_model import AudioModel
+from src.metrics import metrics
+from src.jobs import JobManager
+from src.settings import load_settings
+from src.sharedStore import SharedStore, SharedMapping
+from src.similarity import SimilarityCalculator
+from src.audio.audioProcessing import error_message
 import os
+import time
+import uuid
+import threading
 import json
 import zipfile
 import shutil
 import patoolib
 
-mapper = {}
-attributes = {}
+settings = load_settings()
+serving_config = settings.get("SERVING_CONFIG", {})
 
-try:
-    with open('settings.json', 'r') as f:
-        settings = json.load(f)
-except FileNotFoundError:
-    raise FileNotFoundError("settings.json file is missing. Please provide a valid configuration file.")
+metrics.enabled = settings.get("METRICS_CONFIG", {}).get("enabled", True)
+
+# State shared by every server process (see gunicorn.conf.py): the mapper,
+# the job records and the reset epochs live in one SQLite file, the models
+# in memory-mapped index generations on disk. Metrics and result caches
+# stay per process.
+store = SharedStore(serving_config.get("store_path", "./data/shared.db"))
+mapper = SharedMapping(store, "mapper")
+attributes = SharedMapping(store, "attributes")
 
 image_model = ImageModel(settings["IMAGE_CONFIG"])
 audio_model = AudioModel(settings["AUDIO_CONFIG"])
 
+# Rebuilds run as background jobs; /reset bumps the epoch so a job that was
+# already running cannot swap its model in afterwards.
+jobs = JobManager(store=store, lock_folder=serving_config.get("lock_folder", "./data/locks"))
+swap_lock = threading.Lock()
+sync_lock = threading.Lock()
+last_sync = [0.0]
+RELOAD_INTERVAL = serving_config.get("reload_interval", 1.0)
+
+# Image metric used when a request does not pass method.
+IMAGE_METRIC = settings.get("DISTANCE_CONFIG", {}).get("metric", "euclidean")
+
+COPY_CHUNK_SIZE = 1024 * 1024
+
 app = Flask(__name__)
 CORS(app)
 
+def warm_up_models():
+    """Load the audio stack and page in the image index ahead of the first queries."""
+    start = time.perf_counter()
+    image_model.warm_up()
+    audio_model.warm_up()
+    print(f"Models warmed up in {time.perf_counter() - start:.2f} s")
+
+# Heavy modules load on first use; STARTUP_CONFIG.warm_up loads them in the
+# background right away instead, without delaying startup.
+if settings.get("STARTUP_CONFIG", {}).get("warm_up", False):
+    threading.Thread(target=warm_up_models, name="warm-up", daemon=True).start()
+
+def reset_epoch(kind):
+    return store.get("epochs", kind, 0)
+
+def sync_models():
+    """
+    Swap in index generations published by other server processes (a
+    rebuild job or a /reset that ran there). Checks the generation markers
+    at most every RELOAD_INTERVAL seconds; loading is cheap because the new
+    generation is memory-mapped rather than read.
+    """
+    global image_model, audio_model
+    if time.monotonic() - last_sync[0] < RELOAD_INTERVAL or not sync_lock.acquire(blocking=False):
+        return
+    try:
+        last_sync[0] = time.monotonic()
+        for kind in ("image", "audio"):
+            model = image_model if kind == "image" else audio_model
+            if model.current_generation() == model.generation:
+                continue
+            if kind == "image":
+                new_model = ImageModel(settings["IMAGE_CONFIG"])
+            else:
+                new_model = AudioModel(settings["AUDIO_CONFIG"])
+            if not new_model.is_fit() and new_model.index_exists():
+                # Unreadable index: keep serving the current model until the next generation.
+                model.generation = new_model.generation
+                continue
+            with swap_lock:
+                if kind == "image" and image_model is model:
+                    image_model = new_model
+                elif kind == "audio" and audio_model is model:
+                    audio_model = new_model
+            print(f"Loaded {kind} index generation {new_model.generation}")
+    finally:
+        sync_lock.release()
+
+@app.before_request
+def start_request_timer():
+    if metrics.enabled:
+        g.request_start = time.perf_counter()
+    sync_models()
+
+@app.after_request
+def record_request_metrics(response):
+    if metrics.enabled and "request_start" in g:
+        endpoint = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        metrics.inc("http_requests_total", endpoint=endpoint, method=request.method, status=response.status_code)
+        metrics.observe("http_request_duration_seconds", time.perf_counter() - g.request_start, endpoint=endpoint)
+    return response
+
+def collect_query_files(files, extensions):
+    """
+    Flatten uploaded query files into a list of (filename, bytes), expanding
+    .zip uploads into their members with a matching extension.
+    """
+    queries = []
+    for file in files:
+        extension = os.path.splitext(file.filename)[1].lower()
+        if extension == ".zip":
+            with zipfile.ZipFile(file) as zip_file:
+                for zip_info in zip_file.infolist():
+                    if zip_info.is_dir():
+                        continue
+                    if os.path.splitext(zip_info.filename)[1].lower() in extensions:
+                        queries.append((os.path.basename(zip_info.filename), zip_file.read(zip_info)))
+        elif extension in extensions:
+            queries.append((file.filename, file.read()))
+    return queries
+
+def clear_folder(folder):
+    """Delete every file and sub folder inside folder."""
+    for existing_file in os.listdir(folder):
+        file_path = os.path.join(folder, existing_file)
+        if os.path.isdir(file_path):
+            shutil.rmtree(file_path)
+        else:
+            os.remove(file_path)
+
+def staging_folder(folder):
+    """Fresh, empty folder next to folder where a replace upload is unpacked until it is swapped in."""
+    staging = os.path.normpath(folder) + ".staging"
+    if os.path.isdir(staging):
+        shutil.rmtree(staging)
+    os.makedirs(staging)
+    return staging
+
+def replace_folder(staging, folder):
+    """Move a fully written staging folder into the place of folder and delete the old contents."""
+    folder = os.path.normpath(folder)
+    old_folder = folder + ".old"
+    if os.path.isdir(old_folder):
+        shutil.rmtree(old_folder)
+    if os.path.isdir(folder):
+        os.rename(folder, old_folder)
+    os.rename(staging, folder)
+    shutil.rmtree(old_folder, ignore_errors=True)
+
+def spool_uploads(files):
+    """
+    Save uploaded files to a fresh folder under temp/uploads so a background
+    job can read them after the request has finished.
+    Returns ([(filename, path)], folder).
+    """
+    spool_folder = os.path.join("temp", "uploads", uuid.uuid4().hex)
+    os.makedirs(spool_folder)
+    uploads = []
+    for file in files:
+        filename = os.path.basename(file.filename)
+        path = os.path.join(spool_folder, f"{len(uploads)}_{filename}")
+        file.save(path)
+        uploads.append((filename, path))
+    return uploads, spool_folder
+
+def flat_name(member_path, prefix=None):
+    """Flatten an archive member path to one file name: "a/b/c.png" -> "a_b_c.png"."""
+    parts = [part for part in member_path.replace("\\", "/").split("/") if part not in ("", ".", "..")]
+    if prefix:
+        parts.insert(0, prefix)
+    return "_".join(parts)
+
+def publish(source, filename, backend_folder, frontend_folder):
+    """
+    Stream source (a file object) into backend_folder/filename in bounded
+    chunks, then expose the same file in frontend_folder as a hardlink
+    (a copy only where hardlinks are unsupported). Returns the backend path.
+    """
+    path_backend = os.path.join(backend_folder, filename)
+    path_frontend = os.path.join(frontend_folder, filename)
+    with metrics.timer("upload.save"):
+        with open(path_backend + ".part", "wb") as output_file:
+            shutil.copyfileobj(source, output_file, COPY_CHUNK_SIZE)
+        os.replace(path_backend + ".part", path_backend)
+        link_frontend(path_backend, path_frontend)
+    return path_backend
+
+def link_frontend(path_backend, path_frontend):
+    """Hardlink a stored file into the frontend folder, replacing any older copy."""
+    try:
+        os.link(path_backend, path_frontend + ".part")
+    except OSError:
+        shutil.copyfile(path_backend, path_frontend + ".part")
+    os.replace(path_frontend + ".part", path_frontend)
+
+def ingest_uploads(uploads, extensions, backend_folder, frontend_folder):
+    """
+    Unpack spooled uploads into a single content store and yield each stored
+    path as soon as it is written, so feature extraction can start while the
+    rest is still being unpacked. Plain files keep their name; archive
+    members are streamed out of .zip files (or unpacked once from .rar
+    files) and flattened to one name on the way, "<folder>_<file>".
+    """
+    for filename, path in uploads:
+        extension = os.path.splitext(filename)[1].lower()
+
+        if extension == ".zip":
+            with zipfile.ZipFile(path) as zip_file:
+                for zip_info in zip_file.infolist():
+                    if zip_info.is_dir() or os.path.splitext(zip_info.filename)[1].lower() not in extensions:
+                        continue
+                    with zip_file.open(zip_info) as member:
+                        yield publish(member, flat_name(zip_info.filename), backend_folder, frontend_folder)
+
+        elif extension == ".rar":
+            # patool can only unpack to disk: unpack once next to the spooled
+            # archive and move the members into place.
+            outdir = path + ".extracted"
+            os.makedirs(outdir, exist_ok=True)
+            patoolib.extract_archive(path, outdir=outdir)
+            for root, dirs, files in os.walk(outdir):
+                dirs.sort()
+                for file in sorted(files):
+                    if os.path.splitext(file)[1].lower() not in extensions:
+                        continue
+                    member_path = os.path.join(root, file)
+                    name = flat_name(os.path.relpath(member_path, outdir), prefix=filename.split('.')[0])
+                    path_backend = os.path.join(backend_folder, name)
+                    with metrics.timer("upload.save"):
+                        shutil.move(member_path, path_backend)
+                        link_frontend(path_backend, os.path.join(frontend_folder, name))
+                    yield path_backend
+
+        elif extension in extensions:
+            # The spooled upload already is the file: move it into place.
+            path_backend = os.path.join(backend_folder, filename)
+            with metrics.timer("upload.save"):
+                shutil.move(path, path_backend)
+                link_frontend(path_backend, os.path.join(frontend_folder, filename))
+            yield path_backend
+
+def swap_model(kind, new_model, epoch, staging=()):
+    """
+    Publish a rebuilt model. Rebinding the global is atomic, so a request sees
+    either the old or the new model, never a half-built one. A rebuild that
+    started before a /reset is discarded. Other server processes pick the
+    new index generation up in sync_models.
+
+    staging lists (staging_folder, folder) pairs of a replace upload that
+    was fitted without saving: the folders are swapped in and the model's
+    paths moved to them before its index is published, so the old corpus
+    stays on disk for the serving model until this point.
+    """
+    global image_model, audio_model
+    with swap_lock:
+        if reset_epoch(kind) != epoch and staging:
+            for staged, _ in staging:
+                shutil.rmtree(staged, ignore_errors=True)
+            raise RuntimeError("The API was reset while this job was running; its result was discarded.")
+        if reset_epoch(kind) != epoch:
+            # Undo what the job wrote after the reset had already cleared it.
+            new_model.clear_index()
+            if kind == "image":
+                folders = (settings["IMAGE_CONFIG"]["database_folder"], os.path.join('..', 'frontend', 'public', 'images'))
+            else:
+                folders = (settings["AUDIO_CONFIG"]["database_folder"], os.path.join('..', 'frontend', 'public', 'audio'))
+            for folder in folders:
+                if os.path.isdir(folder):
+                    clear_folder(folder)
+            raise RuntimeError("The API was reset while this job was running; its result was discarded.")
+        if staging:
+            for staged, folder in staging:
+                replace_folder(staged, folder)
+                new_model.relocate(staged, os.path.normpath(folder))
+            new_model.save_index()
+        if kind == "image":
+            image_model = new_model
+        else:
+            audio_model = new_model
+
+def image_metric():
+    """The method form field of an image query, or None if it names no known metric."""
+    method = request.form.get('method', IMAGE_METRIC)
+    return method if method in SimilarityCalculator.METRICS else None
+
+def audio_tier():
+    """The tier form field of an audio query, or None if it names no known transcription tier."""
+    tier = request.form.get('tier', audio_model.model.tier)
+    return tier if tier in audio_model.model.TIERS else None
+
+def job_response(job_id):
+    """202 with the job id, or the finished job's result when the form asks to wait=true."""
+    if request.form.get('wait', 'false').lower() != 'true':
+        return jsonify({
+            "message": "Upload accepted, the model is being rebuilt in the background.",
+            "job": job_id,
+            "status_url": f"/jobs/{job_id}",
+        }), 202
+
+    job = jobs.wait(job_id)
+    if job["status"] == "failed":
+        return jsonify({"error": job["error"], "job": job_id}), 500
+    return jsonify({**job["result"], "job": job_id}), 201
+
 @app.route('/get/images', methods=['GET'])
 def get_images():
     """Endpoint to retrieve all image file names from the public/images directory."""
@@ -56,8 +346,9 @@ def get_songs():
 @app.route('/get/mapper', methods=['GET'])
 def get_mapper():
     """Endpoint to retrieve the mapper."""
-    print("Mapper content:", mapper)
-    return jsonify(mapper, attributes), 200
+    mapping = mapper.to_dict()
+    print("Mapper content:", mapping)
+    return jsonify(mapping, attributes.to_dict()), 200
 
 @app.route('/upload/mapper', methods=['POST'])
 def upload_mapper():
@@ -76,15 +367,20 @@ def upload_mapper():
         except json.JSONDecodeError as e:
             return jsonify({"error": "Invalid JSON format"}), 400
 
+        mapping = {}
+        song_attributes = {}
         for item in json_data:
-            mapper[item["audio_file"]] = item.get("pic_name", "Unknown")
-            mapper[item["pic_name"]] = item.get("audio_file", "Unknown")
-            attributes[item["audio_file"]] = {
+            mapping[item["audio_file"]] = item.get("pic_name", "Unknown")
+            mapping[item["pic_name"]] = item.get("audio_file", "Unknown")
+            song_attributes[item["audio_file"]] = {
                 "artist": item.get("artist", "Unknown Artist"),
                 "title": item.get("title", "Unknown Title"),
                 "album": item.get("album", "Unknown Album"),
                 "year": item.get("year", "Unknown Year"),
             }
+        # One transaction each, so other server processes never see half a mapper.
+        mapper.update(mapping)
+        attributes.update(song_attributes)
         
         return jsonify({"message": "Mapper uploaded successfully."}), 200
     
@@ -96,9 +392,14 @@ def upload_mapper():
 @app.route('/reset', methods=['GET'])
 def reset():
     """Reset the API."""
-    global mapper, audio_model, image_model, attributes
-    mapper = {}
-    attributes = {}
+    global audio_model, image_model
+    mapper.clear()
+    attributes.clear()
+    with swap_lock:
+        store.increment("epochs", "image")
+        store.increment("epochs", "audio")
+    image_model.clear_index()
+    audio_model.clear_index()
     audio_model = AudioModel(settings["AUDIO_CONFIG"])
     image_model = ImageModel(settings["IMAGE_CONFIG"])
 
@@ -174,15 +475,75 @@ def predict_audio():
         if audio_model.is_fit() == False:
             return jsonify({"error": "Model is not trained yet."}), 400
         
-        result = audio_model.predict(audio_file)
+        method = request.form.get('method', 'histogram')
+        if method not in ('histogram', 'ngram', 'cascade'):
+            return jsonify({"error": "Invalid method. Use 'histogram', 'ngram' or 'cascade'."}), 400
+        tier = audio_tier()
+        if tier is None:
+            return jsonify({"error": "Invalid tier. Use 'accurate' or 'fast'."}), 400
+
+        result = audio_model.predict(audio_file, method=method, tier=tier)
         return jsonify(result), 200
 
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return jsonify({"error": error_message(e)}), 500
+
+@app.route('/predict/audio/batch', methods=['POST'])
+def predict_audio_batch():
+    """Endpoint to predict similar audio for many queries (multi-file or zip upload)."""
+    try:
+        files = request.files.getlist('audio')
+        if not files:
+            return jsonify({"error": "No audio file provided."}), 400
+
+        if audio_model.is_fit() == False:
+            return jsonify({"error": "Model is not trained yet."}), 400
+
+        queries = collect_query_files(files, [".wav", ".midi", ".mid", ".mp3", ".m4a"])
+        if not queries:
+            return jsonify({"error": "No supported audio files found."}), 400
+        tier = audio_tier()
+        if tier is None:
+            return jsonify({"error": "Invalid tier. Use 'accurate' or 'fast'."}), 400
+
+        result = audio_model.predict_batch(queries, tier=tier)
+        return jsonify(result), 200
+
+    except Exception as e:
+        return jsonify({"error": error_message(e)}), 500
+
+def rebuild_audio_model(uploads, spool_folder, epoch):
+    """
+    Background job: unpack an audio upload into staging folders, fit a new
+    model on them and swap folders and model in together. The serving model
+    and its files are untouched until then, also when the fit fails.
+    """
+    staging = []
+    try:
+        audio_extensions = [".wav", ".mp3", ".m4a", ".mid"]
+
+        backend_audio_folder = settings["AUDIO_CONFIG"]["database_folder"]
+        frontend_audio_folder = os.path.join('..', 'frontend', 'public', 'audio')
+        staging = [(staging_folder(folder), folder) for folder in (backend_audio_folder, frontend_audio_folder)]
+
+        new_model = AudioModel(settings["AUDIO_CONFIG"])
+        with metrics.timer("audio.fit"):
+            cache_stats = new_model.fit_paths(ingest_uploads(
+                uploads, audio_extensions, staging[0][0], staging[1][0]), save=False)
+        swap_model("audio", new_model, epoch, staging)
+        return {"message": "Files uploaded successfully", "cache": cache_stats}
+    finally:
+        for staged, _ in staging:
+            shutil.rmtree(staged, ignore_errors=True)
+        shutil.rmtree(spool_folder, ignore_errors=True)
 
 @app.route('/upload/audio', methods=['POST'])
 def upload_audio():
-    global audio_model
+    """
+    Endpoint for audio upload. The files are spooled to disk and the model is
+    rebuilt by a background job while the current model keeps serving; pass
+    wait=true to block until the job has finished.
+    """
     try:
         if 'file' not in request.files:
             return jsonify({"error": "No file part"}), 400
@@ -191,89 +552,16 @@ def upload_audio():
         if not files:
             return jsonify({"error": "No selected files"}), 400
 
-        audio_extensions = [".wav", ".mp3", ".m4a", ".mid"]
-        
-        backend_audio_folder = settings["AUDIO_CONFIG"]["database_folder"]
-        frontend_audio_folder = os.path.join('..', 'frontend', 'public', 'audio')
-
-        os.makedirs(backend_audio_folder, exist_ok=True)
-        os.makedirs(frontend_audio_folder, exist_ok=True)
-
-        for existing_file in os.listdir(backend_audio_folder):
-            file_path = os.path.join(backend_audio_folder, existing_file)
-            if os.path.isdir(file_path):
-                shutil.rmtree(file_path)
-            else:
-                os.remove(file_path)
-        
-        for existing_file in os.listdir(frontend_audio_folder):
-            file_path = os.path.join(frontend_audio_folder, existing_file)
-            if os.path.isdir(file_path):
-                shutil.rmtree(file_path)
-            else:
-                os.remove(file_path)
-
-        for file in files:
-            filename = file.filename
-            extension = os.path.splitext(filename)[1].lower()
-
-            if extension == ".zip":
-                with zipfile.ZipFile(file) as zip_file:
-                    print(zip_file.namelist())
-                    for zip_info in zip_file.infolist():
-                        if zip_info.is_dir():
-                            continue
-                        zip_filename = zip_info.filename
-                        zip_extension = os.path.splitext(zip_filename)[1].lower()
-                        if zip_extension in audio_extensions:
-                            with zip_file.open(zip_info) as audio_file:
-                                audio_path_backend = os.path.join(backend_audio_folder, zip_filename)
-                                audio_path_frontend = os.path.join(frontend_audio_folder, zip_filename)
-                                os.makedirs(os.path.dirname(audio_path_backend), exist_ok=True)
-                                os.makedirs(os.path.dirname(audio_path_frontend), exist_ok=True)
-                                with open(audio_path_backend, 'wb') as output_file_backend, open(audio_path_frontend, 'wb') as output_file_frontend:
-                                    data = audio_file.read()
-                                    output_file_backend.write(data)
-                                    output_file_frontend.write(data)
-                                    
-            elif extension == ".rar":
-                file_path_backend = os.path.join(backend_audio_folder, filename)
-                file_path_frontend = os.path.join(frontend_audio_folder, filename)
-                file.save(file_path_backend)
-                file.save(file_path_frontend)
-                os.makedirs(os.path.join(backend_audio_folder, filename.split('.')[0]), exist_ok=True)
-                os.makedirs(os.path.join(frontend_audio_folder, filename.split('.')[0]), exist_ok=True)
-                patoolib.extract_archive(file_path_backend, outdir=os.path.join(backend_audio_folder, filename.split('.')[0]))
-                patoolib.extract_archive(file_path_frontend, outdir=os.path.join(frontend_audio_folder, filename.split('.')[0]))
-                os.remove(file_path_backend)
-                os.remove(file_path_frontend)
-                
-            elif extension in audio_extensions:
-                file_path_backend = os.path.join(backend_audio_folder, filename)
-                file_path_frontend = os.path.join(frontend_audio_folder, filename)
-                file.save(file_path_backend)
-                file.save(file_path_frontend)
-            
-        for folder in os.listdir(backend_audio_folder):
-            if os.path.isdir(os.path.join(backend_audio_folder, folder)):
-                folder_path = os.path.join(backend_audio_folder, folder)
-                for file in os.listdir(folder_path):
-                    file_path = os.path.join(folder_path, file)
-                    file_new = "_".join([folder, file])
-                    new_file_path = os.path.join(backend_audio_folder, file_new)
-                    shutil.move(file_path, new_file_path)
-                shutil.rmtree(folder_path)
-        
-        audio_model = AudioModel(settings["AUDIO_CONFIG"])
-        audio_model.fit(settings["AUDIO_CONFIG"]["database_folder"])
-        return jsonify({"message": "Files uploaded successfully"}), 201
+        uploads, spool_folder = spool_uploads(files)
+        job_id = jobs.submit("audio", rebuild_audio_model, uploads, spool_folder, reset_epoch("audio"))
+        return job_response(job_id)
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
     
 @app.route('/predict/image', methods=['POST'])
 def predict_image():
-    """Endpoint to predict similar images."""
+    """Endpoint to predict similar images (optional method=euclidean|sqeuclidean|cosine|inner_product)."""
     try:
         if 'image' not in request.files:
             return jsonify({"error": "No image file provided."}), 400
@@ -282,17 +570,106 @@ def predict_image():
         
         if image_model.is_fit() == False:
             return jsonify({"error": "Model is not trained yet."}), 400
+
+        method = image_metric()
+        if method is None:
+            return jsonify({"error": f"Invalid method. Use one of {', '.join(SimilarityCalculator.METRICS)}."}), 400
         
-        result = image_model.predict(image_file)
+        result = image_model.predict(image_file, method=method)
         return jsonify(result), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+
+@app.route('/predict/image/batch', methods=['POST'])
+def predict_image_batch():
+    """Endpoint to predict similar images for many queries (multi-file or zip upload, optional method)."""
+    try:
+        files = request.files.getlist('image')
+        if not files:
+            return jsonify({"error": "No image file provided."}), 400
+
+        if image_model.is_fit() == False:
+            return jsonify({"error": "Model is not trained yet."}), 400
+
+        method = image_metric()
+        if method is None:
+            return jsonify({"error": f"Invalid method. Use one of {', '.join(SimilarityCalculator.METRICS)}."}), 400
+
+        queries = collect_query_files(files, [".png", ".jpg"])
+        if not queries:
+            return jsonify({"error": "No supported image files found."}), 400
+
+        result = image_model.predict_batch(queries, method=method)
+        return jsonify(result), 200
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
     
+def rebuild_image_model(uploads, spool_folder, mode, epoch):
+    """
+    Background job: unpack an image upload, then fit a new model (replace)
+    or extend a copy of the saved index (append), and swap it in. A replace
+    upload is unpacked into staging folders that only replace the image
+    folders once the fit has succeeded, so the serving model keeps its files.
+    """
+    staging = []
+    try:
+        # The new model opens its own copy of the latest saved index (possibly
+        # published by another server process), so the serving model is never
+        # modified while queries may be using it.
+        new_model = ImageModel(settings["IMAGE_CONFIG"])
+        append = mode == 'append' and new_model.is_fit()
+
+        image_extensions = [".jpg", ".jpeg", ".png", ".bmp", ".gif"]
+
+        backend_image_folder = settings["IMAGE_CONFIG"]["database_folder"]
+        frontend_image_folder = os.path.join('..', 'frontend', 'public', 'images')
+
+        os.makedirs(backend_image_folder, exist_ok=True)
+        os.makedirs(frontend_image_folder, exist_ok=True)
+
+        if append:
+            target_folders = (backend_image_folder, frontend_image_folder)
+        else:
+            staging = [(staging_folder(folder), folder) for folder in (backend_image_folder, frontend_image_folder)]
+            target_folders = (staging[0][0], staging[1][0])
+
+        stored_files = (
+            path for path in ingest_uploads(uploads, image_extensions, *target_folders)
+            if path.endswith(('.png', '.jpg'))
+        )
+
+        if append:
+            changed_files = list(stored_files)
+            with metrics.timer("image.add"):
+                failures = new_model.add(changed_files)
+            message = f"{len(changed_files) - len(failures)} files added successfully"
+        else:
+            # Images are decoded while the archive is still being unpacked.
+            with metrics.timer("image.fit"):
+                failures = new_model.fit_paths(stored_files, save=False)
+            message = "Files uploaded successfully"
+
+        swap_model("image", new_model, epoch, staging)
+        return {
+            "message": message,
+            "failed": [{"file": os.path.basename(path), "error": error} for path, error in failures],
+        }
+    finally:
+        for staged, _ in staging:
+            shutil.rmtree(staged, ignore_errors=True)
+        shutil.rmtree(spool_folder, ignore_errors=True)
+
 @app.route('/upload/image', methods=['POST'])
 def upload_image():
-    """Endpoint for image upload."""
-    global image_model
+    """
+    Endpoint for image upload. mode=replace (default) refits on the uploaded
+    images, mode=append adds them to the current index. The model is rebuilt
+    by a background job while the current model keeps serving; pass
+    wait=true to block until the job has finished.
+    """
     try:
         if 'file' not in request.files:
             return jsonify({"error": "No file part in the request."}), 400
@@ -301,84 +678,87 @@ def upload_image():
         if not files:
             return jsonify({"error": "No selected files"}), 400
 
-        image_extensions = [".jpg", ".jpeg", ".png", ".bmp", ".gif"]
-        
-        backend_image_folder = settings["IMAGE_CONFIG"]["database_folder"]
-        frontend_image_folder = os.path.join('..', 'frontend', 'public', 'images')
+        mode = request.form.get('mode', 'replace')
+        if mode not in ('replace', 'append'):
+            return jsonify({"error": "Invalid mode. Use 'replace' or 'append'."}), 400
 
-        os.makedirs(backend_image_folder, exist_ok=True)
-        os.makedirs(frontend_image_folder, exist_ok=True)
+        uploads, spool_folder = spool_uploads(files)
+        job_id = jobs.submit("image", rebuild_image_model, uploads, spool_folder, mode, reset_epoch("image"))
+        return job_response(job_id)
 
-        for existing_file in os.listdir(backend_image_folder):
-            file_path = os.path.join(backend_image_folder, existing_file)
-            if os.path.isdir(file_path):
-                shutil.rmtree(file_path)
-            else:
-                os.remove(file_path)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
-        for existing_file in os.listdir(frontend_image_folder):
-            file_path = os.path.join(frontend_image_folder, existing_file)
-            if os.path.isdir(file_path):
-                shutil.rmtree(file_path)
-            else:
+
+def remove_images(filenames, epoch):
+    """Image job: tombstone images in a copy of the saved index and swap it in."""
+    new_model = ImageModel(settings["IMAGE_CONFIG"])
+    removed = new_model.remove(filenames)
+
+    backend_image_folder = settings["IMAGE_CONFIG"]["database_folder"]
+    frontend_image_folder = os.path.join('..', 'frontend', 'public', 'images')
+    for filename in filenames:
+        for folder in (backend_image_folder, frontend_image_folder):
+            file_path = os.path.join(folder, filename)
+            if os.path.isfile(file_path):
                 os.remove(file_path)
 
-        for file in files:
-            filename = file.filename
-            extension = os.path.splitext(filename)[1].lower()
-
-            if extension == ".zip":
-                with zipfile.ZipFile(file) as zip_file:
-                    for zip_info in zip_file.infolist():
-                        if zip_info.is_dir():
-                            continue
-                        zip_filename = zip_info.filename
-                        zip_extension = os.path.splitext(zip_filename)[1].lower()
-                        if zip_extension in image_extensions:
-                            with zip_file.open(zip_info) as image_file:
-                                image_path_backend = os.path.join(backend_image_folder, zip_filename)
-                                image_path_frontend = os.path.join(frontend_image_folder, zip_filename)
-                                os.makedirs(os.path.dirname(image_path_backend), exist_ok=True)
-                                os.makedirs(os.path.dirname(image_path_frontend), exist_ok=True)
-                                with open(image_path_backend, 'wb') as output_file_backend, open(image_path_frontend, 'wb') as output_file_frontend:
-                                    data = image_file.read()
-                                    output_file_backend.write(data)
-                                    output_file_frontend.write(data)
-                                    
-            elif extension == ".rar":
-                file_path_backend = os.path.join(backend_image_folder, filename)
-                file_path_frontend = os.path.join(frontend_image_folder, filename)
-                file.save(file_path_backend)
-                file.save(file_path_frontend)
-                os.makedirs(os.path.join(backend_image_folder, filename.split('.')[0]), exist_ok=True)
-                os.makedirs(os.path.join(frontend_image_folder, filename.split('.')[0]), exist_ok=True)
-                patoolib.extract_archive(file_path_backend, outdir=os.path.join(backend_image_folder, filename.split('.')[0]))
-                patoolib.extract_archive(file_path_frontend, outdir=os.path.join(frontend_image_folder, filename.split('.')[0]))
-                os.remove(file_path_backend)
-                os.remove(file_path_frontend)
-                
-            elif extension in image_extensions:
-                file_path_backend = os.path.join(backend_image_folder, filename)
-                file_path_frontend = os.path.join(frontend_image_folder, filename)
-                print(file)
-                file.save(file_path_backend)
-                file.stream.seek(0)  # Reset file stream position to the beginning
-                file.save(file_path_frontend)
-        
-        for folder in os.listdir(backend_image_folder):
-            if os.path.isdir(os.path.join(backend_image_folder, folder)):
-                folder_path = os.path.join(backend_image_folder, folder)
-                for file in os.listdir(folder_path):
-                    file_path = os.path.join(folder_path, file)
-                    file_new = "_".join([folder, file])
-                    new_file_path = os.path.join(backend_image_folder, file_new)
-                    shutil.move(file_path, new_file_path)
-                shutil.rmtree(folder_path)
-        
-        image_model = ImageModel(settings["IMAGE_CONFIG"])
-        image_model.fit(backend_image_folder)
-        return jsonify({"message": "Files uploaded successfully"}), 201
+    swap_model("image", new_model, epoch)
+    return {"message": f"{removed} images removed."}
 
+@app.route('/delete/image', methods=['POST'])
+def delete_image():
+    """
+    Endpoint to remove images from the index without refitting. Runs on the
+    image job queue after any pending rebuild and waits for it.
+    """
+    try:
+        filenames = request.form.getlist('filename')
+        if not filenames:
+            return jsonify({"error": "No filename provided."}), 400
+
+        if image_model.is_fit() == False and not jobs.active("image"):
+            return jsonify({"error": "Model is not trained yet."}), 400
+
+        filenames = [os.path.basename(filename) for filename in filenames]
+        job = jobs.wait(jobs.submit("image", remove_images, filenames, reset_epoch("image")))
+        if job["status"] == "failed":
+            return jsonify({"error": job["error"]}), 500
+        return jsonify(job["result"]), 200
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/jobs', methods=['GET'])
+def list_jobs():
+    """Endpoint to list recent rebuild jobs, newest first (optional ?kind=image|audio)."""
+    return jsonify({"jobs": jobs.list(request.args.get('kind'))}), 200
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Endpoint to poll one rebuild job."""
+    job = jobs.status(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found."}), 404
+    return jsonify(job), 200
+
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Request counters, request latencies and per-stage timings in Prometheus text format."""
+    if not metrics.enabled:
+        return jsonify({"error": "Metrics are disabled."}), 404
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
+@app.route('/warmup', methods=['POST'])
+def warm_up():
+    """Endpoint to load the audio stack and page in the image index before traffic arrives."""
+    try:
+        start = time.perf_counter()
+        warm_up_models()
+        return jsonify({"message": "Models warmed up.", "seconds": time.perf_counter() - start}), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -2,6 +2,8 @@ import os
 import zipfile
 from datetime import datetime
 from src.audio.audioRetriever import AudioRetriever
+from src.audio.audioIndex import AudioIndex
+from src.resultCache import ResultCache
 import json
 from typing import List, Tuple, Dict
 
@@ -11,25 +13,134 @@ class AudioModel:
         self.audio_folder = config.get("audio_folder", "data/audio")
         self.audio_query = config.get("audio_query", "data/audio_query")
         self.audio_db = None
-        self.model = AudioRetriever()
+        self.workers = config.get("workers", 0)
+        self.cache_folder = config.get("cache_folder", "data/audio_cache")
+        self.ngram_size = config.get("ngram_size", 4)
+        self.ngram_threshold = config.get("ngram_threshold", 0.1)
+        self.cascade_candidates = config.get("cascade_candidates", 50)
+        self.cascade_threshold = config.get("cascade_threshold", 0.0)
+        self.index_folder = config.get("index_folder", "data/audio_index")
+        self.model = AudioRetriever(workers=self.workers, cache_folder=self.cache_folder, ngram_size=self.ngram_size,
+                                    spill_folder=self.audio_query, cascade_candidates=self.cascade_candidates,
+                                    alignment_length=config.get("alignment_length", 32),
+                                    alignment_band=config.get("alignment_band", 4),
+                                    block_seconds=config.get("stream_block_seconds", 30.0),
+                                    stream_min_seconds=config.get("stream_min_seconds", 120.0),
+                                    tier=config.get("transcription_tier", "accurate"))
+        # Results of repeated queries, keyed by query bytes, model version and parameters.
+        self.result_cache = ResultCache("audio", config.get("result_cache_size", 1024),
+                                        config.get("result_cache_ttl", 300))
+        self.version = 0
+        # Index generation this model was loaded from; see sync_models in main.py.
+        self.generation = None
         os.makedirs(self.audio_folder, exist_ok=True)
         os.makedirs(self.audio_query, exist_ok=True)
+        self.load_index()
     
     def fit(self, audio_folder):
         self.model.fit(audio_folder)
+        self.model_changed()
+        self.save_index()
+        return self.model.cache_stats
 
-    def predict(self, audio_file):
+    def fit_paths(self, audio_paths, save=True):
+        """
+        Fit on explicit paths; audio_paths may be a generator of files still
+        arriving. With save=False the index is only published by a later
+        save_index().
+        """
+        self.model.fit_paths(audio_paths)
+        self.model_changed()
+        if save:
+            self.save_index()
+        return self.model.cache_stats
+
+    def relocate(self, old_folder, new_folder):
+        """Point the song paths under old_folder at new_folder."""
+        self.model.relocate(old_folder, new_folder)
+
+    def save_index(self):
+        """Publish the database as a new generation and reopen it memory-mapped."""
+        self.model.save(self.index_folder)
+        self.load_index()
+
+    def load_index(self):
+        """Open the saved database, if any, so a restart does not need to transcribe again."""
+        self.generation = AudioIndex(self.index_folder).current_generation()
+        try:
+            return self.model.load(self.index_folder)
+        except Exception as e:
+            print(f"Warning: Failed to load audio index {self.index_folder}. Error: {e}")
+            return False
+
+    def clear_index(self):
+        AudioIndex(self.index_folder).clear()
+
+    def index_exists(self):
+        return AudioIndex(self.index_folder).exists()
+
+    def current_generation(self):
+        """Generation most recently published by any process."""
+        return AudioIndex(self.index_folder).current_generation()
+
+    def model_changed(self):
+        """Start a new model version so cached results of the old one are never served."""
+        self.version += 1
+        self.result_cache.clear()
+
+    def cache_key(self, data, filename, **params):
+        # The extension decides how the bytes are decoded (MIDI or audio, and the threshold).
+        return self.result_cache.key(data, self.version, extension=self.model.extension(filename), **params)
+
+    def predict(self, audio_file, method="histogram", threshold=0.55, result_limit=None, tier=None):
         if not audio_file.filename.lower().endswith((".wav", ".midi", ".mid", ".mp3", ".m4a")):
             raise ValueError("Invalid file type. Only WAV and MIDI are allowed.")
 
-        query_path = os.path.join(self.audio_query, audio_file.filename)
-        audio_file.save(query_path)
-
-        results = self.model.predict(query_path)
-        os.remove(query_path)
+        if method == "ngram":
+            threshold = self.ngram_threshold
+        elif method == "cascade":
+            threshold = self.cascade_threshold
+        tier = tier or self.model.tier
+        data = audio_file.read()
+        key = self.cache_key(data, audio_file.filename, method=method, threshold=threshold, result_limit=result_limit,
+                             tier=tier)
+        results = self.result_cache.get(key)
+        if results is None:
+            results = self.model.predict(data, threshold=threshold, result_limit=result_limit, method=method,
+                                         filename=audio_file.filename, tier=tier)
+            self.result_cache.put(key, results)
         
         return {"results": results}
 
+    def predict_batch(self, query_files, threshold=0.55, result_limit=None, tier=None):
+        """
+        query_files: list of (filename, bytes). Returns one entry per query with
+        either its results or the error that stopped it. Only queries missing
+        from the result cache are transcribed and scored.
+        """
+        tier = tier or self.model.tier
+        keys = [self.cache_key(data, filename, method="histogram", threshold=threshold, result_limit=result_limit,
+                               tier=tier)
+                for filename, data in query_files]
+        results = [self.result_cache.get(key) for key in keys]
+        pending = [i for i, cached in enumerate(results) if cached is None]
+
+        computed, failures = self.model.predict_batch([query_files[i][1] for i in pending], threshold=threshold,
+                                                      result_limit=result_limit,
+                                                      filenames=[query_files[i][0] for i in pending], tier=tier)
+        failures = [(pending[j], error) for j, error in failures]
+        failed = {i for i, _ in failures}
+        for i, query_results in zip(pending, computed):
+            results[i] = query_results
+            if i not in failed:
+                self.result_cache.put(keys[i], query_results)
+
+        errors = dict(failures)
+        return {"results": [
+            {"query": filename, "error": errors[i]} if i in errors else {"query": filename, "results": results[i]}
+            for i, (filename, _) in enumerate(query_files)
+        ]}
+
     def upload(self, zip_file):
         if not zip_file.filename.lower().endswith(".zip"):
             raise ValueError("Only ZIP files are allowed.")
@@ -57,6 +168,9 @@ class AudioModel:
         
         return result
 
+    def warm_up(self):
+        self.model.warm_up()
+
     def is_fit(self):
         return self.model.is_fit()
         
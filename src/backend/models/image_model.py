@@ -2,6 +2,8 @@ import os
 import zipfile
 from datetime import datetime
 from src.image.imageRetriever import ImageRetriever
+from src.image.imageIndex import ImageIndex
+from src.resultCache import ResultCache
 import json
 from typing import List, Tuple, Dict
 
@@ -11,25 +13,152 @@ class ImageModel:
         self.image_query = config.get("image_query", "data/image_query") 
         self.n_components = config.get("n_components", 50)
         self.resize_shape = tuple(config.get("resize_shape", (64, 64)))
-        self.model = ImageRetriever(n_components=self.n_components, resize_shape=self.resize_shape)
+        self.pca_solver = config.get("pca_solver", "auto")
+        self.index_folder = config.get("index_folder", "data/image_index")
+        self.rebuild_threshold = config.get("rebuild_threshold", 0.25)
+        self.workers = config.get("workers", 0)
+        self.ann_min_size = config.get("ann_min_size", 20000)
+        self.nprobe = config.get("nprobe", 8)
+        self.storage = config.get("storage", "float64")
+        self.rerank_factor = config.get("rerank_factor", 10)
+        self.preprocessing = config.get("preprocessing", "fast")
+        self.hash_distance = config.get("hash_distance")
+        self.model = ImageRetriever(n_components=self.n_components, resize_shape=self.resize_shape,
+                                    pca_solver=self.pca_solver, workers=self.workers,
+                                    ann_min_size=self.ann_min_size, nprobe=self.nprobe,
+                                    storage=self.storage, rerank_factor=self.rerank_factor,
+                                    preprocessing=self.preprocessing, hash_distance=self.hash_distance)
+        # Results of repeated queries, keyed by query bytes, model version and parameters.
+        self.result_cache = ResultCache("image", config.get("result_cache_size", 1024),
+                                        config.get("result_cache_ttl", 300))
+        self.version = 0
+        # Index generation this model was loaded from; see sync_models in main.py.
+        self.generation = None
         os.makedirs(self.image_folder, exist_ok=True)
         os.makedirs(self.image_query, exist_ok=True)
-    
+        self.load_index()
+
+    def model_changed(self):
+        """Start a new model version so cached results of the old one are never served."""
+        self.version += 1
+        self.result_cache.clear()
+
     def fit(self, image_folder):    
         self.model.fit(image_folder)
+        self.model_changed()
+        self.save_index()
+        return self.model.failures
+
+    def fit_paths(self, image_paths, save=True):
+        """
+        Fit on explicit paths; image_paths may be a generator of files still
+        arriving. With save=False the index is only published by a later
+        save_index(), e.g. once the files have been moved into place.
+        """
+        self.model.fit_paths(image_paths)
+        self.model_changed()
+        if save:
+            self.save_index()
+        return self.model.failures
+
+    def relocate(self, old_folder, new_folder):
+        """Point the indexed paths under old_folder at new_folder."""
+        self.model.relocate(old_folder, new_folder)
+
+    def add(self, image_paths):
+        """Index new images without refitting the whole corpus."""
+        self.model.add(image_paths)
+        failures = self.model.failures
+        self._rebuild_if_drifted()
+        self.model_changed()
+        self.save_index()
+        return failures
+
+    def remove(self, image_names):
+        """Tombstone images by file name. Returns the number removed."""
+        removed = self.model.remove(image_names)
+        if removed:
+            self._rebuild_if_drifted()
+            self.model_changed()
+            self.save_index()
+        return removed
+
+    def _rebuild_if_drifted(self):
+        if self.rebuild_threshold is not None and self.model.drift() > self.rebuild_threshold:
+            print(f"Image index drift {self.model.drift():.3f} exceeds {self.rebuild_threshold}, rebuilding...")
+            self.model.rebuild()
+
+    def save_index(self):
+        """
+        Publish the index as a new generation and reopen it memory-mapped, so
+        the arrays live in the page cache, shared by every serving process,
+        instead of the process heap.
+        """
+        self.model.save(self.index_folder)
+        self.load_index()
+
+    def load_index(self):
+        """Open the saved index, if any, so a restart does not need a refit."""
+        # Read the marker first: an index published meanwhile only causes one extra reload.
+        self.generation = ImageIndex(self.index_folder).current_generation()
+        try:
+            return self.model.load(self.index_folder)
+        except Exception as e:
+            print(f"Warning: Failed to load image index {self.index_folder}. Error: {e}")
+            return False
+
+    def clear_index(self):
+        ImageIndex(self.index_folder).clear()
 
-    def predict(self, image_file):
+    def index_exists(self):
+        return ImageIndex(self.index_folder).exists()
+
+    def current_generation(self):
+        """Generation most recently published by any process."""
+        return ImageIndex(self.index_folder).current_generation()
+
+    def predict(self, image_file, result_limit=5, max_distance=float('inf'), method="euclidean"):
         if not image_file.filename.lower().endswith((".png", ".jpg")):
             raise ValueError("Invalid file type. Only PNG and JPG are allowed.")
 
-        query_path = os.path.join(self.image_query, image_file.filename)
-        image_file.save(query_path)
-
-        results = self.model.predict(query_path)
-        os.remove(query_path)
+        data = image_file.read()
+        key = self.result_cache.key(data, self.version, result_limit=result_limit, max_distance=max_distance,
+                                    method=method)
+        results = self.result_cache.get(key)
+        if results is None:
+            results = self.model.predict(data, result_limit=result_limit, max_distance=max_distance, method=method)
+            self.result_cache.put(key, results)
         
         return {"results": results}
 
+    def predict_batch(self, query_files, result_limit=5, max_distance=float('inf'), method="euclidean"):
+        """
+        query_files: list of (filename, bytes). Returns one entry per query with
+        either its results or the error that stopped it. Only queries missing
+        from the result cache are decoded and scored.
+        """
+        keys = [self.result_cache.key(data, self.version, result_limit=result_limit, max_distance=max_distance,
+                                      method=method)
+                for _, data in query_files]
+        results = [self.result_cache.get(key) for key in keys]
+        pending = [i for i, cached in enumerate(results) if cached is None]
+
+        computed, failures = self.model.predict_batch([query_files[i][1] for i in pending],
+                                                      result_limit=result_limit, max_distance=max_distance,
+                                                      method=method)
+        failures = [(pending[j], error) for j, error in failures]
+        failed = {i for i, _ in failures}
+        for i, query_results in zip(pending, computed):
+            results[i] = query_results
+            if i not in failed:
+                self.result_cache.put(keys[i], query_results)
+
+        errors = dict(failures)
+        return {"results": [
+            {"query": filename, "error": errors[i]} if i in errors else {"query": filename, "results": results[i]}
+            for i, (filename, _) in enumerate(query_files)
+        ]}
+
     def upload(self, zip_file):
         if not zip_file.filename.lower().endswith(".zip"):
             raise ValueError("Only ZIP files are allowed.")
@@ -59,5 +188,8 @@ class ImageModel:
         
         return result
 
+    def warm_up(self):
+        self.model.warm_up()
+
     def is_fit(self):
         return self.model.is_fit()
\ No newline at end of file
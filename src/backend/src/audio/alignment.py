@@ -0,0 +1,96 @@
+from functools import lru_cache
+import numpy as np
+
+
+class SequenceAligner:
+    """
+    Order-aware similarity of note sequences by band-limited dynamic time
+    warping (DTW).
+
+    Both sides are resampled to a fixed length and shifted by their median
+    pitch, so the comparison ignores tempo and transposition. A query shorter
+    than a song is compared with every window of the song of the query's
+    length (hop of hop_fraction of it) and the song keeps its best window,
+    so hummed snippets match the passage they come from. All windows of all
+    songs are aligned at once: the DTW recurrence runs over the band cells
+    of the (length x length) grid, each step vectorized across windows.
+    """
+
+    def __init__(self, length=32, band=4, hop_fraction=0.125, max_cost=12.0):
+        self.length = length
+        self.band = band
+        self.hop_fraction = hop_fraction
+        self.max_cost = max_cost
+
+    @staticmethod
+    @lru_cache(maxsize=256)
+    def _resampling_matrix(n, length):
+        """(n x length) matrix that linearly interpolates a length-n sequence at length points."""
+        positions = np.linspace(0, n - 1, length)
+        lower = np.minimum(np.floor(positions).astype(np.intp), max(n - 2, 0))
+        fraction = positions - lower
+        matrix = np.zeros((n, length))
+        matrix[lower, np.arange(length)] += 1 - fraction
+        if n > 1:
+            matrix[lower + 1, np.arange(length)] += fraction
+        return matrix
+
+    def resample(self, sequences):
+        """Resample equal-length sequences (rows) to self.length and center each on its median."""
+        sequences = np.atleast_2d(np.asarray(sequences, dtype=np.float64))
+        resampled = sequences @ self._resampling_matrix(sequences.shape[1], self.length)
+        return resampled - np.median(resampled, axis=1, keepdims=True)
+
+    def windows(self, song, query_length):
+        """Resampled windows of song that are query_length notes long (the whole song if it is shorter)."""
+        song = np.asarray(song, dtype=np.float64)
+        if len(song) <= query_length:
+            return self.resample(song)
+        hop = max(1, int(query_length * self.hop_fraction))
+        starts = np.arange(0, len(song) - query_length + 1, hop)
+        if starts[-1] != len(song) - query_length:
+            starts = np.append(starts, len(song) - query_length)
+        return self.resample(np.lib.stride_tricks.sliding_window_view(song, query_length)[starts])
+
+    def distances(self, query, windows):
+        """
+        Banded DTW distance from one resampled query (length,) to every
+        resampled window (W x length), normalized by the sequence length.
+        """
+        n_windows, length = windows.shape
+        previous = np.full((n_windows, length + 1), np.inf)
+        previous[:, 0] = 0.0
+        for i in range(1, length + 1):
+            current = np.full((n_windows, length + 1), np.inf)
+            lo, hi = max(1, i - self.band), min(length, i + self.band)
+            costs = np.minimum(np.abs(windows[:, lo - 1:hi] - query[i - 1]), self.max_cost)
+            for j in range(lo, hi + 1):
+                current[:, j] = costs[:, j - lo] + np.minimum(np.minimum(previous[:, j - 1], previous[:, j]),
+                                                               current[:, j - 1])
+            previous = current
+        return previous[:, length] / length
+
+    def score(self, query_notes, songs):
+        """
+        Similarity in (0, 1] of the query to each song, 1 / (1 + distance)
+        of the best-aligned window; 0 for empty sequences.
+        """
+        scores = np.zeros(len(songs))
+        query_notes = np.asarray(query_notes)
+        if len(query_notes) == 0 or len(songs) == 0:
+            return scores
+
+        query = self.resample(query_notes)[0]
+        windows, owners = [], []
+        for song_id, song in enumerate(songs):
+            if len(song) == 0:
+                continue
+            song_windows = self.windows(song, len(query_notes))
+            windows.append(song_windows)
+            owners.append(np.full(len(song_windows), song_id))
+        if not windows:
+            return scores
+
+        similarities = 1.0 / (1.0 + self.distances(query, np.vstack(windows)))
+        np.maximum.at(scores, np.concatenate(owners), similarities)
+        return scores
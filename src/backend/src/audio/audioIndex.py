@@ -0,0 +1,21 @@
+from src.image.imageIndex import ImageIndex
+
+
+class AudioIndex(ImageIndex):
+    """
+    On-disk format for a fitted audio retriever, with the same layout,
+    atomic publishing and generation marker as the image index.
+
+    Layout of an index folder:
+        meta.json             format version, config hash and row count
+        paths.json            song path table, one entry per feature row
+        features.npy          L2-normalized feature histograms (songs x 128)
+        notes.npy             note sequences of all songs, concatenated
+        note_offsets.npy      start of every song in notes.npy, plus the end
+        ngram_*.npy           optional interval n-gram inverted index
+    """
+
+    NAME = "Audio index"
+    ARRAYS = ("features", "notes", "note_offsets")
+    OPTIONAL_ARRAYS = ("ngram_codes", "ngram_offsets", "ngram_postings", "ngram_counts", "ngram_idf")
+    ROWS_ARRAY = "features"
@@ -1,163 +1,307 @@
+import io
+import os
+import math
+import tempfile
 import numpy as np
-import librosa
-from mido import MidiFile, MidiTrack, Message
+from src.metrics import metrics
+
+# librosa and mido are imported inside the methods that use them, so that
+# importing this module (and starting an image-only backend) stays cheap.
+
+
+def error_message(error):
+    """
+    str(error), or a hint with the exception type when it carries no message,
+    as audioread's NoBackendError does for files no decoder can read.
+    """
+    return str(error) or f"could not decode audio ({type(error).__name__})"
+
 
 class AudioProcessor:
-    def __init__(self, reference_note=60):
+    MIDI_EXTENSIONS = ('.mid', '.midi')
+    AUDIO_EXTENSIONS = ('.wav', '.mp3', '.m4a', '.opus')
+    # Formats libsndfile decodes from a file object; others go through a temp file.
+    IN_MEMORY_EXTENSIONS = ('.wav', '.mp3', '.flac', '.ogg')
+    # STFT parameters librosa's harmonic() and piptrack() use by default.
+    HOP_LENGTH = 512
+    N_FFT = 2048
+    # Frames of context on each side of a streamed block: half the HPSS median
+    # filter (15 frames) plus the STFT windows of HPSS and piptrack.
+    CONTEXT_FRAMES = 24
+    # "accurate": HPSS, then piptrack at sample_rate. "fast": no HPSS, a plain
+    # STFT peak picker at FAST_SAMPLE_RATE with a shorter window, i.e. a quarter
+    # of the samples and frames of the same hop length.
+    TIERS = ("accurate", "fast")
+    FAST_SAMPLE_RATE = 11025
+    FAST_N_FFT = 1024
+
+    def __init__(self, reference_note=60, sample_rate=22050, fmin=50.0, fmax=2000.0, spill_folder=None,
+                 block_seconds=30.0, stream_min_seconds=120.0, tier="accurate"):
+        if tier not in self.TIERS:
+            raise ValueError(f"Invalid transcription tier '{tier}'. Choose one of {self.TIERS}.")
         self.reference_note = reference_note
+        self.sample_rate = sample_rate
+        self.fmin = fmin
+        self.fmax = fmax
+        self.spill_folder = spill_folder
+        # Files longer than stream_min_seconds are transcribed in blocks of block_seconds.
+        self.block_seconds = block_seconds
+        self.stream_min_seconds = stream_min_seconds
+        self.tier = tier
+        # MP3 input was always transcribed with a lower magnitude threshold.
+        self.default_threshold = 0.2
+        self.thresholds = {'.mp3': 0.1}
 
-    def opus2midi(self, opus_file, midi_file):
+    def tier_sample_rate(self, tier):
+        return min(self.sample_rate, self.FAST_SAMPLE_RATE) if tier == "fast" else self.sample_rate
+
+    def transcribe(self, audio_file, midi_file=None, threshold=None, filename=None, tier=None):
         """
-        Convert an Opus file to a MIDI file by estimating pitches.
+        Estimate the note sequence of any audio file librosa can decode.
+        audio_file may be a path, bytes or a file object; filename supplies the
+        extension when it is not a path. Returns the notes as an int64 array;
+        a MIDI file is only written when midi_file is given. tier picks
+        "accurate" or "fast" transcription (default: the processor's tier).
+
+        Long files that libsndfile can seek in are streamed block by block
+        (see stream_notes), so memory stays bounded by the block size.
         """
-        y, sr = librosa.load(opus_file, sr=22050)  
-        
-        y_harmonic = librosa.effects.harmonic(y)
-        
-        pitches, magnitudes = librosa.piptrack(y=y_harmonic, sr=sr, fmin=50.0, fmax=2000.0)
-        
-        midi = MidiFile()
-        track = MidiTrack()
-        midi.tracks.append(track)
+        tier = tier or self.tier
+        if threshold is None:
+            threshold = self.transcription_params(filename or audio_file, tier)["threshold"]
 
-        threshold = 0.2
-        last_note = None
-        time_step = 480
-        
-        for time_idx in range(pitches.shape[1]):
-            pitch = pitches[:, time_idx]
-            magnitude = magnitudes[:, time_idx]
-            
-            idx = magnitude.argmax()
-            if magnitude[idx] > threshold:
-                midi_note = librosa.hz_to_midi(pitch[idx])
-                midi_note = int(np.round(midi_note))
-                
-                if midi_note != last_note:
-                    track.append(Message('note_on', note=midi_note, velocity=64, time=0))
-                    track.append(Message('note_off', note=midi_note, velocity=64, time=time_step))
-                    last_note = midi_note
+        if not isinstance(audio_file, (str, os.PathLike, bytes)):
+            audio_file = audio_file.read()
+        if self.stream_min_seconds is not None and self.duration(audio_file) > self.stream_min_seconds:
+            notes = self.drop_repeats(np.concatenate(
+                [np.zeros(0, dtype=np.int64)] + list(self.stream_notes(audio_file, threshold, tier))))
+        else:
+            with metrics.timer("audio.load"):
+                y, sr = self.load_audio(audio_file, filename, sample_rate=self.tier_sample_rate(tier))
+            peak_pitches, peak_magnitudes = self.signal_peaks(y, sr, tier)
+            with metrics.timer("audio.notes"):
+                notes = self.peaks_to_notes(peak_pitches, peak_magnitudes, threshold)
 
-        midi.save(midi_file)
-    
-    def m4atomidi(self, m4a_file, midi_file):
+        if midi_file is not None:
+            self.write_midi(notes, midi_file)
+        return notes
+
+    def signal_peaks(self, y, sr, tier):
         """
-        Convert an M4A file to a MIDI file by estimating pitches.
+        Frequency and magnitude of the strongest peak in every frame of y,
+        on the frame grid of HOP_LENGTH. Magnitudes of the fast tier are
+        rescaled to the accurate tier's window length, so the same
+        thresholds apply to both.
         """
-        y, sr = librosa.load(m4a_file, sr=22050)  
-        
-        y_harmonic = librosa.effects.harmonic(y)
-        
-        pitches, magnitudes = librosa.piptrack(y=y_harmonic, sr=sr, fmin=50.0, fmax=2000.0)
-        
-        midi = MidiFile()
-        track = MidiTrack()
-        midi.tracks.append(track)
+        import librosa
+        if tier == "fast":
+            with metrics.timer("audio.pitch_fast"):
+                return self.spectral_peaks(y, sr)
+        with metrics.timer("audio.hpss"):
+            y_harmonic = librosa.effects.harmonic(y)
+        with metrics.timer("audio.piptrack"):
+            pitches, magnitudes = librosa.piptrack(y=y_harmonic, sr=sr, fmin=self.fmin, fmax=self.fmax)
+        return self.frame_peaks(pitches, magnitudes)
 
-        threshold = 0.2
-        last_note = None
-        time_step = 480
-        
-        for time_idx in range(pitches.shape[1]):
-            pitch = pitches[:, time_idx]
-            magnitude = magnitudes[:, time_idx]
-            
-            idx = magnitude.argmax()
-            if magnitude[idx] > threshold:
-                midi_note = librosa.hz_to_midi(pitch[idx])
-                midi_note = int(np.round(midi_note))
-                
-                if midi_note != last_note:
-                    track.append(Message('note_on', note=midi_note, velocity=64, time=0))
-                    track.append(Message('note_off', note=midi_note, velocity=64, time=time_step))
-                    last_note = midi_note
+    def spectral_peaks(self, y, sr):
+        """Cheaper pitch estimate: the largest STFT bin in [fmin, fmax), refined by parabolic interpolation."""
+        import librosa
+        n_fft = self.FAST_N_FFT
+        spectrum = np.abs(librosa.stft(y, n_fft=n_fft, hop_length=self.HOP_LENGTH))
+        frequencies = librosa.fft_frequencies(sr=sr, n_fft=n_fft)
+        bins = np.flatnonzero((frequencies >= self.fmin) & (frequencies < self.fmax))
+        band = spectrum[bins[0]:bins[-1] + 1]
 
-        midi.save(midi_file)
-        
-    def mp3tomidi(self, mp3_file, midi_file):
-            """
-            Convert an MP3 file to a MIDI file by estimating pitches.
-            """
-            # Load the MP3 file
-            y, sr = librosa.load(mp3_file, sr=22050)
-            
-            # Harmonic separation for pitch tracking
-            y_harmonic = librosa.effects.harmonic(y)
-            
-            pitches, magnitudes = librosa.piptrack(y=y_harmonic, sr=sr, fmin=50.0, fmax=2000.0)
-            
-            # Create MIDI file and track
-            midi = MidiFile()
-            track = MidiTrack()
-            midi.tracks.append(track)
-
-            threshold = 0.1  
-            last_note = None
-            hop_length = 512  
-            time_step = int((hop_length / sr) * 1000)  
-            
-            # Process each frame
-            for time_idx in range(pitches.shape[1]):
-                pitch = pitches[:, time_idx]
-                magnitude = magnitudes[:, time_idx]
-                
-                idx = magnitude.argmax()
-                if magnitude[idx] > threshold and pitch[idx] > 0: 
-                    midi_note = librosa.hz_to_midi(pitch[idx])
-                    midi_note = int(np.round(midi_note))
-                    
-                    if midi_note != last_note:
-                        velocity = int(np.clip(magnitude[idx] * 127, 0, 127)) 
-                        track.append(Message('note_on', note=midi_note, velocity=velocity, time=0))
-                        track.append(Message('note_off', note=midi_note, velocity=velocity, time=time_step))
-                        last_note = midi_note
-            
-            midi.save(midi_file)
-    
-    def wav2midi(self, wav_file, midi_file):
+        frames = np.arange(band.shape[1])
+        peaks = np.clip(band.argmax(axis=0), 1, max(len(band) - 2, 1))
+        left, center, right = band[peaks - 1, frames], band[peaks, frames], band[peaks + 1, frames]
+        curvature = left - 2 * center + right
+        shift = np.divide(0.5 * (left - right), curvature, out=np.zeros_like(center), where=curvature < 0)
+        peak_pitches = (bins[0] + peaks + shift) * sr / n_fft
+        peak_magnitudes = (center - 0.25 * (left - right) * shift) * (self.N_FFT / n_fft)
+        return peak_pitches, peak_magnitudes
+
+    @staticmethod
+    def _sound_file(source):
+        import soundfile
+        return soundfile.SoundFile(io.BytesIO(source) if isinstance(source, bytes) else source)
+
+    def duration(self, source):
+        """Length in seconds of a path or bytes libsndfile can open, 0 when it cannot."""
+        try:
+            with self._sound_file(source) as f:
+                return f.frames / f.samplerate if f.seekable() else 0.0
+        except Exception:
+            return 0.0
+
+    def stream_notes(self, source, threshold, tier=None):
         """
-        Convert a WAV file to a MIDI file by estimating pitches.
+        Transcribe a path or bytes in blocks of about block_seconds and yield
+        the notes of each block as soon as it is done (repeats are only
+        dropped within a block). Each block is decoded, resampled, separated
+        and pitch-tracked together with CONTEXT_FRAMES frames of audio on
+        both sides that are then discarded, and blocks start on the frame
+        grid of the whole signal, so every frame sees the same samples as in
+        a one-shot transcription and the notes match it.
         """
-        y, sr = librosa.load(wav_file, sr=22050)  
-        
-        y_harmonic = librosa.effects.harmonic(y)
-        
-        pitches, magnitudes = librosa.piptrack(y=y_harmonic, sr=sr, fmin=50.0, fmax=2000.0)
+        import librosa
+        tier = tier or self.tier
+        sample_rate = self.tier_sample_rate(tier)
+        hop = self.HOP_LENGTH
+        with self._sound_file(source) as f:
+            native_rate = f.samplerate
+            # Blocks must start on a frame that is also a whole native sample.
+            step = sample_rate // math.gcd(sample_rate, hop * native_rate)
+            context = math.ceil(self.CONTEXT_FRAMES / step) * step
+            block_frames = max(1, round(self.block_seconds * sample_rate / hop / step)) * step
+            n_samples = math.ceil(f.frames * sample_rate / native_rate)
+            n_frames = 1 + n_samples // hop
+
+            for first in range(0, n_frames, block_frames):
+                last = min(first + block_frames, n_frames)
+                start = max(0, first - context)
+                stop = last + context
+                native_start = start * hop * native_rate // sample_rate
+                native_stop = min(f.frames, math.ceil((stop * hop + self.N_FFT) * native_rate / sample_rate))
+                with metrics.timer("audio.load"):
+                    f.seek(native_start)
+                    y = f.read(native_stop - native_start, dtype="float32", always_2d=True).mean(axis=1)
+                    if native_rate != sample_rate:
+                        y = librosa.resample(y, orig_sr=native_rate, target_sr=sample_rate)
+                peak_pitches, peak_magnitudes = self.signal_peaks(y, sample_rate, tier)
+                with metrics.timer("audio.notes"):
+                    frames = slice(first - start, last - start)
+                    yield self.peaks_to_notes(peak_pitches[frames], peak_magnitudes[frames], threshold)
+
+    def warm_up(self):
+        """
+        Import librosa and mido and run the transcription path once on a
+        second of silence, so the first real query does not pay for module
+        loading and numba compilation.
+        """
+        import librosa
+        import mido
+        for tier in self.TIERS:
+            sample_rate = self.tier_sample_rate(tier)
+            silence = np.zeros(sample_rate, dtype=np.float32)
+            self.peaks_to_notes(*self.signal_peaks(silence, sample_rate, tier), self.default_threshold)
+
+    def load_audio(self, source, filename=None, sample_rate=None):
+        """
+        Decode audio from a path, bytes or a file object at sample_rate (the
+        working sample rate by default). In-memory input is decoded without
+        touching disk when libsndfile supports the format, and spilled to a
+        temporary file otherwise.
+        """
+        import librosa
+        sample_rate = sample_rate or self.sample_rate
+        if isinstance(source, (str, os.PathLike)):
+            return librosa.load(source, sr=sample_rate)
+
+        data = source if isinstance(source, bytes) else source.read()
+        extension = self.extension(filename)
+        if extension in self.IN_MEMORY_EXTENSIONS:
+            try:
+                return librosa.load(io.BytesIO(data), sr=sample_rate)
+            except Exception:
+                pass
+
+        with tempfile.NamedTemporaryFile(suffix=extension, dir=self.spill_folder, delete=False) as f:
+            f.write(data)
+        try:
+            return librosa.load(f.name, sr=sample_rate)
+        finally:
+            os.remove(f.name)
+
+    @staticmethod
+    def extension(filename):
+        return os.path.splitext(str(filename or ""))[1].lower()
+
+    def transcription_params(self, audio_file, tier=None):
+        """Everything that affects the notes transcribe() returns for audio_file."""
+        extension = self.extension(audio_file)
+        tier = tier or self.tier
+        return {
+            "tier": tier,
+            "sample_rate": self.tier_sample_rate(tier),
+            "fmin": self.fmin,
+            "fmax": self.fmax,
+            "threshold": self.thresholds.get(extension, self.default_threshold),
+        }
+
+    def frame_peaks(self, pitches, magnitudes):
+        """Frequency and magnitude of the strongest piptrack bin of every frame."""
+        frames = np.arange(magnitudes.shape[1])
+        peaks = magnitudes.argmax(axis=0)
+        return pitches[peaks, frames], magnitudes[peaks, frames]
+
+    def peaks_to_notes(self, peak_pitches, peak_magnitudes, threshold):
+        """
+        Keep frames whose peak is above threshold, round them to MIDI note
+        numbers and drop consecutive repeats.
+        """
+        import librosa
+        voiced = (peak_magnitudes > threshold) & (peak_pitches > 0)
+        notes = np.round(librosa.hz_to_midi(peak_pitches[voiced])).astype(np.int64)
+        return self.drop_repeats(notes)
+
+    @staticmethod
+    def drop_repeats(notes):
+        """Keep the first note of every run of equal consecutive notes."""
+        if len(notes) == 0:
+            return notes
+        changes = np.empty(len(notes), dtype=bool)
+        changes[0] = True
+        np.not_equal(notes[1:], notes[:-1], out=changes[1:])
+        return notes[changes]
+
+    def write_midi(self, notes, midi_file, time_step=480):
+        """Write a note sequence as a single-track MIDI file."""
+        from mido import MidiFile, MidiTrack, Message
         midi = MidiFile()
         track = MidiTrack()
         midi.tracks.append(track)
+        for note in notes:
+            track.append(Message('note_on', note=int(note), velocity=64, time=0))
+            track.append(Message('note_off', note=int(note), velocity=64, time=time_step))
+        midi.save(midi_file)
 
-        threshold = 0.2
-        last_note = None
-        time_step = 480
-        
-        for time_idx in range(pitches.shape[1]):
-            pitch = pitches[:, time_idx]
-            magnitude = magnitudes[:, time_idx]
-            
-            idx = magnitude.argmax()
-            if magnitude[idx] > threshold:
-                midi_note = librosa.hz_to_midi(pitch[idx])
-                midi_note = int(np.round(midi_note))
-                
-                if midi_note != last_note:
-                    track.append(Message('note_on', note=midi_note, velocity=64, time=0))
-                    track.append(Message('note_off', note=midi_note, velocity=64, time=time_step))
-                    last_note = midi_note
+    def audio2midi(self, audio_file, midi_file):
+        """
+        Convert an audio file to a MIDI file by estimating pitches.
+        """
+        self.transcribe(audio_file, midi_file)
 
-        midi.save(midi_file)
+    def load_notes(self, file, filename=None, tier=None):
+        """
+        Note sequence of a MIDI file (parsed) or an audio file (transcribed
+        with the given tier).
+        file may be a path, bytes or a file object; filename supplies the
+        extension when it is not a path.
+        """
+        extension = self.extension(filename or file)
+        if extension in self.MIDI_EXTENSIONS:
+            return np.asarray(self.extract_midi_notes(file), dtype=np.int64)
+        if extension in self.AUDIO_EXTENSIONS:
+            return self.transcribe(file, filename=filename, tier=tier)
+        raise ValueError(f"Unsupported file format '{extension}'.")
 
     def extract_midi_notes(self, midi_file):
         """
         Extract MIDI notes from a MIDI file
         """
-        midi = MidiFile(midi_file)
-        notes = []
-        for track in midi.tracks:
-            for msg in track:
-                if msg.type == 'note_on' and msg.velocity > 0:
-                    notes.append(msg.note)
-        return notes
+        from mido import MidiFile
+        with metrics.timer("audio.midi_parse"):
+            if isinstance(midi_file, (str, os.PathLike)):
+                midi = MidiFile(midi_file)
+            else:
+                midi = MidiFile(file=io.BytesIO(midi_file) if isinstance(midi_file, bytes) else midi_file)
+            notes = []
+            for track in midi.tracks:
+                for msg in track:
+                    if msg.type == 'note_on' and msg.velocity > 0:
+                        notes.append(msg.note)
+            return notes
 
     def atb(self, midi_notes):
         """
@@ -176,7 +320,7 @@ class AudioProcessor:
         """
         First Tone Based (FTB) feature extraction.
         """
-        if not midi_notes:
+        if len(midi_notes) == 0:
             return []
 
         first_note = midi_notes[0]
@@ -189,6 +333,23 @@ class AudioProcessor:
         """
         return np.histogram(data, bins=128, range=(0, 127))[0]
     
+    def feature_vector(self, midi_notes):
+        """
+        Histogram of the combined ATB, RTB and FTB features of a note sequence.
+        """
+        combined_features = np.concatenate([self.atb(midi_notes), self.rtb(midi_notes), self.ftb(midi_notes)])
+        return self.histogram(combined_features).astype(np.float64)
+
+    @staticmethod
+    def normalize_rows(features):
+        """
+        L2-normalize each row so cosine similarity becomes a dot product.
+        All-zero rows stay zero.
+        """
+        features = np.atleast_2d(np.asarray(features, dtype=np.float64))
+        norms = np.linalg.norm(features, axis=1, keepdims=True)
+        return features / np.where(norms > 0, norms, 1)
+
     def similarity(self, hist1, hist2, method='cosine'):
         """
         Calculate similarity between two histograms.
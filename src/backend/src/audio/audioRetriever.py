@@ -1,108 +1,334 @@
-from src.audio.audioProcessing import AudioProcessor
+from src.audio.audioProcessing import AudioProcessor, error_message
+from src.audio.transcriptionCache import TranscriptionCache
+from src.audio.ngramIndex import NGramIndex
+from src.audio.audioIndex import AudioIndex
+from src.audio.alignment import SequenceAligner
+from src.metrics import metrics
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import numpy as np
 import os
-import json
 
-with open("settings.json", "r") as f:
-    settings = json.load(f)
+def _transcribe_worker(task):
+    """Pool entry point: returns (notes, None) or (None, error)."""
+    audio_file, filename, sample_rate, fmin, fmax, spill_folder, block_seconds, stream_min_seconds, tier = task
+    try:
+        processor = AudioProcessor(sample_rate=sample_rate, fmin=fmin, fmax=fmax, spill_folder=spill_folder,
+                                   block_seconds=block_seconds, stream_min_seconds=stream_min_seconds, tier=tier)
+        return processor.transcribe(audio_file, filename=filename), None
+    except Exception as e:
+        return None, error_message(e)
+
 
 class AudioRetriever(AudioProcessor):
-    def __init__(self):
-        super().__init__()
+    METHODS = ("histogram", "ngram", "cascade")
+
+    def __init__(self, workers=1, cache_folder=None, ngram_size=4, spill_folder=None, cascade_candidates=50,
+                 alignment_length=32, alignment_band=4, block_seconds=30.0, stream_min_seconds=120.0,
+                 tier="accurate"):
+        super().__init__(spill_folder=spill_folder, block_seconds=block_seconds, stream_min_seconds=stream_min_seconds,
+                         tier=tier)
+        self.workers = workers
+        self.ngram_index = NGramIndex(n=ngram_size)
+        self.cascade_candidates = cascade_candidates
+        self.aligner = SequenceAligner(length=alignment_length, band=alignment_band)
+        self.cache = TranscriptionCache(cache_folder) if cache_folder else None
+        self.cache_stats = {}
         self.database = {}
+        self.song_paths = []
+        self.features = None
         self.is_fitted = False
         
     def fit(self, folder_path):
         """
         Build a database of MIDI notes from a folder containing MIDI and WAV files.
         """
-        import os
-        print("Building database...")
+        paths = []
         for root, dirs, files in os.walk(folder_path):
             for file in files:
-                if file.endswith(('.mid', '.midi')):
-                    midi_file = os.path.join(root, file)
-                    print(midi_file)
-                    midi_notes = self.extract_midi_notes(midi_file)
-                    self.database[midi_file] = midi_notes
-                elif file.endswith('.mp3'):
-                    audio_file = os.path.join(root, file)
-                    midi_file = audio_file.replace('.mp3', '.mid')
-                    self.mp3tomidi(audio_file, midi_file)
-                    midi_notes = self.extract_midi_notes(midi_file)
-                    self.database[midi_file] = midi_notes
-                elif file.endswith('.m4a'):
-                    audio_file = os.path.join(root, file)
-                    midi_file = audio_file.replace('.m4a', '.mid')
-                    self.m4atomidi(audio_file, midi_file)
-                    midi_notes = self.extract_midi_notes(midi_file)
-                    self.database[midi_file] = midi_notes
-                elif file.endswith('.wav'):
-                    print("Processing file: ", file)
-                    audio_file = os.path.join(root, file)
-                    midi_file = audio_file.replace('.wav', '.mid')
-                    self.wav2midi(audio_file, midi_file)
-                    midi_notes = self.extract_midi_notes(midi_file)
-                    self.database[midi_file] = midi_notes
+                paths.append(os.path.join(root, file))
+        self.fit_paths(paths)
+
+    def fit_paths(self, paths):
+        """
+        Build the database from explicit MIDI and audio file paths; other
+        files are ignored. Audio files are keyed by their .mid name so they
+        line up with the mapper. paths may be a generator of files still
+        arriving: each one is transcribed as soon as it is yielded.
+        """
+        print("Building database...")
+        self.database = {}
+        entries = []
+
+        def sources():
+            for path in paths:
+                if path.endswith(self.MIDI_EXTENSIONS):
+                    entries.append((path, path))
+                elif path.endswith(self.AUDIO_EXTENSIONS):
+                    entries.append((os.path.splitext(path)[0] + '.mid', path))
+                else:
+                    continue
+                yield path
+
+        notes = self.load_many(sources())
+        for (midi_file, _), midi_notes in zip(entries, notes):
+            self.database[midi_file] = midi_notes
+        self.build_features()
         self.is_fitted = True
 
-    def predict(self, audio_file, threshold=0.55):
+    def relocate(self, old_folder, new_folder):
+        """Point the song paths under old_folder at new_folder, after the files were moved there."""
+        def move(path):
+            return AudioIndex.relocate_path(path, old_folder, new_folder)
+
+        self.database = {move(path): notes for path, notes in self.database.items()}
+        self.song_paths = [move(path) for path in self.song_paths]
+
+    def load_many(self, files, filenames=None, use_cache=True, errors=None, tier=None, threads=False):
+        """
+        Note sequences for many MIDI/audio files, in order. Files may be paths,
+        bytes or file objects (with their names in filenames), and may come
+        from a generator. Audio paths are looked up in the transcription cache
+        first; each miss is submitted to a process pool (with the given tier)
+        as soon as it is read, so transcription overlaps with the files still
+        arriving, and written back to the cache. threads=True uses a thread
+        pool instead, for request handlers, where forking a process pool per
+        request is slow and unsafe.
+
+        A file that cannot be read raises, unless an errors list is given:
+        then (index, message) is appended to it and its slot is None.
+        """
+        cache = self.cache if use_cache else None
+        tier = tier or self.tier
+        if cache is not None:
+            cache.reset_stats()
+        filenames = list(filenames) if filenames is not None else None
+        names = []
+
+        def fail(i, error):
+            if errors is None:
+                raise ValueError(f"Error processing audio file {names[i]}: {error}")
+            errors.append((i, error))
+
+        workers = self.workers if self.workers and self.workers > 0 else os.cpu_count() or 1
+        notes = []
+        # (index, cache key, task) of a miss not submitted yet: the pool is only
+        # started once a second miss shows up, a single one is transcribed inline.
+        held = []
+        submitted = []
+        executor = None
+        try:
+            with metrics.timer("audio.transcribe_batch"):
+                for i, file in enumerate(files):
+                    if not isinstance(file, (str, bytes, os.PathLike)):
+                        file = file.read()
+                    names.append(filenames[i] if filenames is not None else str(file))
+                    notes.append(None)
+                    if names[i].endswith(self.MIDI_EXTENSIONS):
+                        try:
+                            notes[i] = self.load_notes(file, filename=names[i])
+                        except Exception as e:
+                            fail(i, error_message(e))
+                        continue
+                    key = None
+                    if cache is not None and isinstance(file, (str, os.PathLike)):
+                        key = cache.key(file, self.transcription_params(file, tier))
+                        notes[i] = cache.get(key)
+                    if notes[i] is not None:
+                        continue
+                    held.append((i, key, (file, names[i], self.sample_rate, self.fmin, self.fmax, self.spill_folder,
+                                          self.block_seconds, self.stream_min_seconds, tier)))
+                    if workers > 1 and len(held) + len(submitted) > 1:
+                        if executor is None:
+                            executor = (ThreadPoolExecutor if threads else ProcessPoolExecutor)(max_workers=workers)
+                        submitted.extend((i, key, executor.submit(_transcribe_worker, task)) for i, key, task in held)
+                        held = []
+
+                transcribed = [(i, key, _transcribe_worker(task)) for i, key, task in held]
+                transcribed += [(i, key, future.result()) for i, key, future in submitted]
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+
+        for i, key, (midi_notes, error) in sorted(transcribed, key=lambda item: item[0]):
+            if error is not None:
+                fail(i, error)
+                continue
+            notes[i] = midi_notes
+            if key is not None:
+                cache.put(key, midi_notes)
+
+        if cache is not None:
+            self.cache_stats = cache.stats()
+            print(f"Transcription cache: {self.cache_stats['hits']} hits, "
+                  f"{self.cache_stats['misses']} misses ({self.cache_stats['hit_rate']:.0%} hit rate)")
+        return notes
+
+    def build_features(self):
+        """
+        Stack the L2-normalized feature histogram of every song into a
+        (songs x 128) matrix, so scoring a query is one matrix-vector product,
+        and index the songs' interval n-grams for snippet lookup.
+        """
+        self.song_paths = list(self.database.keys())
+        self.ngram_index.build(list(self.database.values()))
+        if not self.song_paths:
+            self.features = np.zeros((0, 128))
+            return
+        self.features = self.normalize_rows([self.feature_vector(notes) for notes in self.database.values()])
+
+    def score(self, query_features):
+        """
+        Cosine similarity of one query histogram (128,) or many (Q x 128)
+        against every song. Returns (songs,) or (Q x songs).
+        """
+        with metrics.timer("audio.score"):
+            query_features = np.asarray(query_features, dtype=np.float64)
+            queries = self.normalize_rows(query_features)
+            scores = np.dot(queries, self.features.T)
+        return scores[0] if query_features.ndim == 1 else scores
+
+    def rank(self, scores, threshold=0.55, result_limit=None):
+        """Songs scoring at least threshold, best first, optionally top-k only."""
+        with metrics.timer("audio.sort"):
+            candidates = np.flatnonzero(scores >= threshold)
+            if result_limit is not None and len(candidates) > result_limit:
+                top = np.argpartition(-scores[candidates], result_limit - 1)[:result_limit]
+                candidates = candidates[top]
+            candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [(os.path.basename(self.song_paths[i]), scores[i]) for i in candidates]
+
+    def predict(self, audio_file, threshold=0.55, result_limit=None, method="histogram", filename=None, tier=None):
         """
         Predict the similarity of the input audio file against the database.
-        Supports both WAV and MIDI files as input.
-        Considers ATB, RTB, and FTB for similarity calculation.
-        """
-        if audio_file.endswith('.wav'):
-            # Convert WAV to MIDI
-            midi_file = audio_file.replace('.wav', '.mid')
-            self.wav2midi(audio_file, midi_file)
-        elif audio_file.endswith('.mp3'):
-            # convert mp3 to midi
-            midi_file = audio_file.replace('.mp3', '.mid')
-            self.mp3tomidi(audio_file, midi_file)
-        elif audio_file.endswith('.m4a'):
-            # convert m4a to midi
-            midi_file = audio_file.replace('.m4a', '.mid')
-            self.m4atomidi(audio_file, midi_file)     
-        elif audio_file.endswith('.opus'):
-            # convert opus to midi
-            midi_file = audio_file.replace('.opus', '.mid')
-            self.opustomidi(audio_file, midi_file)
-        elif audio_file.endswith(('.mid', '.midi')):
-            midi_file = audio_file
-        else:
+        Supports both WAV and MIDI files as input, given as a path or as bytes
+        or a file object together with its filename.
+        method="histogram" compares ATB, RTB and FTB histograms with every
+        song; method="ngram" looks the query's interval n-grams up in the
+        inverted index, which suits short hummed snippets; method="cascade"
+        re-ranks the best histogram matches by note-order alignment.
+        tier selects "accurate" or "fast" transcription of audio queries.
+        """
+        filename = filename or str(audio_file)
+        if not filename.lower().endswith(self.MIDI_EXTENSIONS + self.AUDIO_EXTENSIONS):
             raise ValueError("Unsupported file format. Please provide a .wav or .mid file.")
         
-        # Extract MIDI notes
-        midi_notes = self.extract_midi_notes(midi_file)
-        
-        atb_features = self.atb(midi_notes)
-        rtb_features = self.rtb(midi_notes)
-        ftb_features = self.ftb(midi_notes)
-        
-        combined_features = np.concatenate([atb_features, rtb_features, ftb_features])
-        
-        hist1 = self.histogram(combined_features)
-        
-        similarities = {}
-        for midi_file, midi_notes_db in self.database.items():
-            atb_features_db = self.atb(midi_notes_db)
-            rtb_features_db = self.rtb(midi_notes_db)
-            ftb_features_db = self.ftb(midi_notes_db)
-            
-            combined_features_db = np.concatenate([atb_features_db, rtb_features_db, ftb_features_db])
-            
-            hist2 = self.histogram(combined_features_db)
-            
-            similarities[midi_file] = self.similarity(hist1, hist2)
-        
-        result = [(k, v) for k, v in similarities.items() if v >= threshold]
-        result.sort(key=lambda x: x[1], reverse=True)
-        
-        result = [(os.path.basename(k), v) for k, v in result]
-        
-        return result
+        midi_notes = self.load_notes(audio_file, filename=filename, tier=tier)
+
+        if method == "ngram":
+            return self.search_snippet(midi_notes, threshold=threshold, result_limit=result_limit)
+        if method not in self.METHODS:
+            raise ValueError(f"Invalid audio matching method '{method}'.")
+        with metrics.timer("audio.features"):
+            query_features = self.feature_vector(midi_notes)
+        scores = self.score(query_features)
+        if method == "cascade":
+            return self.rerank(midi_notes, scores, threshold=threshold, result_limit=result_limit)
+        return self.rank(scores, threshold=threshold, result_limit=result_limit)
+
+    def rerank(self, midi_notes, scores, candidates=None, threshold=0.0, result_limit=None):
+        """
+        Second stage of method="cascade": keep the top candidates songs
+        (cascade_candidates by default) by histogram score and rank them by
+        their alignment score with the query notes instead.
+        """
+        candidates = min(candidates or self.cascade_candidates, len(scores))
+        if candidates <= 0:
+            return []
+        with metrics.timer("audio.prefilter"):
+            top = np.argpartition(-scores, candidates - 1)[:candidates]
+        with metrics.timer("audio.align"):
+            aligned = self.aligner.score(midi_notes, [self.database[self.song_paths[i]] for i in top])
+        with metrics.timer("audio.sort"):
+            order = np.argsort(-aligned, kind="stable")
+            order = order[aligned[order] >= threshold][:result_limit]
+        return [(os.path.basename(self.song_paths[top[i]]), float(aligned[i])) for i in order]
+
+    def search_snippet(self, midi_notes, threshold=0.0, result_limit=None):
+        """Songs sharing interval n-grams with the query notes, best first."""
+        with metrics.timer("audio.ngram_search"):
+            matches = self.ngram_index.search(midi_notes, result_limit=result_limit, min_score=threshold)
+        return [(os.path.basename(self.song_paths[song_id]), score) for song_id, score in matches]
     
+    def predict_batch(self, audio_files, threshold=0.55, result_limit=None, filenames=None, tier=None):
+        """
+        Score many queries with one matrix-matrix product. Queries are paths,
+        or bytes/file objects with their names in filenames.
+
+        Returns (results, failures): one result list per query (empty for
+        queries that could not be transcribed) and a list of (index, error).
+        """
+        audio_files = list(audio_files)
+        filenames = list(filenames) if filenames is not None else [str(file) for file in audio_files]
+        failures = []
+        supported = []
+        for i, filename in enumerate(filenames):
+            if filename.lower().endswith(self.MIDI_EXTENSIONS + self.AUDIO_EXTENSIONS):
+                supported.append(i)
+            else:
+                failures.append((i, "Unsupported file format."))
+
+        results = [[] for _ in audio_files]
+        errors = []
+        notes = self.load_many([audio_files[i] for i in supported], filenames=[filenames[i] for i in supported],
+                               use_cache=False, errors=errors, tier=tier, threads=True)
+        failures.extend((supported[j], error) for j, error in errors)
+        failures.sort()
+        loaded = [(i, midi_notes) for i, midi_notes in zip(supported, notes) if midi_notes is not None]
+        if not loaded:
+            return results, failures
+
+        scores = self.score(np.array([self.feature_vector(midi_notes) for _, midi_notes in loaded]))
+        for row, (i, _) in enumerate(loaded):
+            results[i] = self.rank(scores[row], threshold=threshold, result_limit=result_limit)
+        return results, failures
+
+    def config(self):
+        """Parameters that must match for a saved index to be reusable."""
+        return {
+            "ngram_size": self.ngram_index.n,
+            "sample_rate": self.sample_rate,
+            "fmin": self.fmin,
+            "fmax": self.fmax,
+            "tier": self.tier,
+        }
+
+    def save(self, index_folder):
+        """Persist the note sequences, feature matrix and n-gram index. Returns the generation id."""
+        if not self.is_fitted:
+            raise ValueError("Model is not trained yet.")
+        notes = [np.asarray(midi_notes, dtype=np.int64) for midi_notes in self.database.values()]
+        arrays = {
+            "features": self.features,
+            "notes": np.concatenate(notes) if notes else np.zeros(0, dtype=np.int64),
+            "note_offsets": np.cumsum([0] + [len(midi_notes) for midi_notes in notes], dtype=np.int64),
+        }
+        arrays.update(self.ngram_index.arrays())
+        state = {"n_songs": self.ngram_index.n_songs}
+        return AudioIndex(index_folder).save(arrays, self.song_paths, self.config(), state)
+
+    def load(self, index_folder, mmap=True):
+        """
+        Restore a saved database without transcribing anything. Arrays are
+        memory-mapped read-only by default and every song's notes are a view
+        into the shared notes array. Returns False if no compatible index exists.
+        """
+        loaded = AudioIndex(index_folder).load(self.config(), mmap=mmap)
+        if loaded is None:
+            return False
+
+        arrays, paths, state = loaded
+        offsets = arrays["note_offsets"]
+        notes = arrays["notes"]
+        self.database = {path: notes[offsets[i]:offsets[i + 1]] for i, path in enumerate(paths)}
+        self.song_paths = list(paths)
+        self.features = arrays["features"]
+        if "ngram_codes" in arrays:
+            self.ngram_index = NGramIndex.from_arrays(arrays, self.ngram_index.n, state.get("n_songs", len(paths)))
+        else:
+            self.ngram_index.build(list(self.database.values()))
+        self.is_fitted = True
+        return True
+
     def is_fit(self):
         return self.is_fitted
 
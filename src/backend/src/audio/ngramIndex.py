@@ -0,0 +1,116 @@
+import numpy as np
+
+
+class NGramIndex:
+    """
+    Inverted index of melodic interval n-grams.
+
+    Each song is reduced to the sequence of intervals between consecutive
+    notes, which is transposition-invariant like the FTB/RTB features. Every
+    run of n intervals is packed into one int64 code and the index maps each
+    code to the songs containing it. A query only touches the posting lists
+    of its own n-grams, so its cost grows with the query length rather than
+    with the corpus size.
+    """
+
+    INTERVAL_RANGE = 127
+
+    def __init__(self, n=4):
+        self.n = n
+        self.n_songs = 0
+        self.codes = np.zeros(0, dtype=np.int64)
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.postings = np.zeros(0, dtype=np.int64)
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.idf = np.zeros(0)
+
+    def encode(self, midi_notes):
+        """Packed interval n-gram codes of a note sequence (with repeats)."""
+        notes = np.asarray(midi_notes, dtype=np.int64)
+        if len(notes) <= self.n:
+            return np.zeros(0, dtype=np.int64)
+        intervals = np.clip(np.diff(notes), -self.INTERVAL_RANGE, self.INTERVAL_RANGE) + self.INTERVAL_RANGE
+        windows = np.lib.stride_tricks.sliding_window_view(intervals, self.n)
+        weights = (2 * self.INTERVAL_RANGE + 1) ** np.arange(self.n, dtype=np.int64)
+        return windows @ weights
+
+    def build(self, songs):
+        """Index a list of note sequences; song ids are their list positions."""
+        all_codes, all_songs, all_counts = [], [], []
+        for song_id, midi_notes in enumerate(songs):
+            codes, counts = np.unique(self.encode(midi_notes), return_counts=True)
+            all_codes.append(codes)
+            all_songs.append(np.full(len(codes), song_id, dtype=np.int64))
+            all_counts.append(counts)
+
+        self.n_songs = len(songs)
+        if not all_codes or sum(len(codes) for codes in all_codes) == 0:
+            return self
+
+        codes = np.concatenate(all_codes)
+        order = np.argsort(codes, kind="stable")
+        codes = codes[order]
+        self.postings = np.concatenate(all_songs)[order]
+        self.counts = np.concatenate(all_counts)[order]
+
+        self.codes, starts, document_frequency = np.unique(codes, return_index=True, return_counts=True)
+        self.offsets = np.append(starts, len(codes))
+        self.idf = np.log1p(self.n_songs / document_frequency)
+        return self
+
+    def arrays(self):
+        """The index as named arrays, for saving next to the audio features."""
+        return {
+            "ngram_codes": self.codes,
+            "ngram_offsets": self.offsets,
+            "ngram_postings": self.postings,
+            "ngram_counts": self.counts,
+            "ngram_idf": self.idf,
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays, n, n_songs):
+        index = cls(n=n)
+        index.n_songs = n_songs
+        index.codes = arrays["ngram_codes"]
+        index.offsets = arrays["ngram_offsets"]
+        index.postings = arrays["ngram_postings"]
+        index.counts = arrays["ngram_counts"]
+        index.idf = arrays["ngram_idf"]
+        return index
+
+    def search(self, midi_notes, result_limit=None, min_score=0.0):
+        """
+        Songs sharing n-grams with the query as (song_id, score), best first.
+        The score is the IDF-weighted share of the query's n-grams found in
+        the song (counting each at most as often as it occurs in both), so it
+        lies in [0, 1].
+        """
+        query_codes, query_counts = np.unique(self.encode(midi_notes), return_counts=True)
+        if len(query_codes) == 0 or len(self.codes) == 0:
+            return []
+
+        positions = np.searchsorted(self.codes, query_codes)
+        positions = np.minimum(positions, len(self.codes) - 1)
+        found = self.codes[positions] == query_codes
+        total_weight = np.sum(query_counts * self.idf[positions] * found) + np.sum(~found) * np.log1p(self.n_songs)
+        positions, query_counts = positions[found], query_counts[found]
+        if len(positions) == 0:
+            return []
+
+        starts, ends = self.offsets[positions], self.offsets[positions + 1]
+        lengths = ends - starts
+        posting_index = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        songs = self.postings[posting_index]
+        weights = (np.minimum(self.counts[posting_index], np.repeat(query_counts, lengths))
+                   * np.repeat(self.idf[positions], lengths))
+
+        candidates, inverse = np.unique(songs, return_inverse=True)
+        scores = np.bincount(inverse, weights=weights) / total_weight
+
+        keep = scores >= min_score
+        candidates, scores = candidates[keep], scores[keep]
+        order = np.argsort(-scores, kind="stable")
+        if result_limit is not None:
+            order = order[:result_limit]
+        return [(int(candidates[i]), float(scores[i])) for i in order]
@@ -0,0 +1,66 @@
+import os
+import json
+import hashlib
+import numpy as np
+
+
+class TranscriptionCache:
+    """
+    Content-addressed store of transcribed note sequences.
+
+    Entries are keyed by the SHA-256 of the audio bytes together with the
+    transcription parameters, so a renamed file still hits and a changed
+    file or a changed setting misses. Each entry is one .npy file.
+    """
+
+    def __init__(self, cache_folder):
+        self.cache_folder = cache_folder
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(cache_folder, exist_ok=True)
+
+    @staticmethod
+    def file_hash(path, chunk_size=1 << 20):
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def key(self, path, params):
+        payload = json.dumps(params, sort_keys=True)
+        return hashlib.sha256((self.file_hash(path) + payload).encode("utf-8")).hexdigest()
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_folder, key[:2], f"{key}.npy")
+
+    def get(self, key):
+        """Cached notes for key, or None. Updates the hit/miss counters."""
+        entry_path = self._entry_path(key)
+        try:
+            notes = np.load(entry_path)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return notes
+
+    def put(self, key, notes):
+        entry_path = self._entry_path(key)
+        os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+        tmp_path = f"{entry_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, np.asarray(notes, dtype=np.int64))
+        os.replace(tmp_path, entry_path)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
@@ -0,0 +1,158 @@
+import os
+import json
+import shutil
+import uuid
+import hashlib
+import numpy as np
+
+INDEX_VERSION = 5
+
+
+class ImageIndex:
+    """
+    Versioned on-disk format for a fitted image retriever.
+
+    Layout of an index folder:
+        meta.json             format version, config hash, row count and
+                              incremental-update state
+        paths.json            image path table, one entry per projection row
+        mean.npy              PCA mean image
+        components.npy        PCA components (n_components x d)
+        singular_values.npy   singular values, needed for incremental updates
+        projections.npy       projected dataset (N x n_components)
+        deleted.npy           tombstone mask (N,) of removed rows
+        ivf_*.npy             optional ANN index (centroids, list assignments)
+        code*.npy             optional int8 projection codes and their scales
+        hashes.npy,           optional perceptual hash and 8 x 9 uint8
+        thumbnails.npy        thumbnail of every row; the paths of
+                              duplicates collapsed into a row are kept in
+                              the "aliases" entry of the meta.json state
+
+    The arrays are stored as plain .npy files so they can be opened with
+    memory mapping and shared between processes through the page cache.
+
+    Every save is a new generation with a random id, recorded in meta.json
+    and in a small marker file next to the folder (<index_folder>.generation).
+    Serving processes poll the marker to notice that another process has
+    published a new index.
+    """
+
+    NAME = "Image index"
+    ARRAYS = ("mean", "components", "singular_values", "projections", "deleted")
+    OPTIONAL_ARRAYS = ("ivf_centroids", "ivf_assignments", "code_offset", "code_scale", "codes", "code_norms",
+                      "hashes", "thumbnails")
+    # Array whose first dimension must match the number of paths.
+    ROWS_ARRAY = "projections"
+
+    def __init__(self, index_folder):
+        self.index_folder = index_folder
+        self.marker_path = os.path.normpath(index_folder) + ".generation"
+        self.generation = None
+
+    @staticmethod
+    def config_hash(config):
+        """Hash the parameters that make an index incompatible when changed."""
+        payload = json.dumps(dict(config, version=INDEX_VERSION), sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+    @staticmethod
+    def relocate_path(path, old_folder, new_folder):
+        """path with its old_folder prefix replaced by new_folder; paths outside old_folder are kept."""
+        relative = os.path.relpath(path, old_folder)
+        if relative == os.pardir or relative.startswith(os.pardir + os.sep):
+            return path
+        return os.path.join(new_folder, relative)
+
+    def exists(self):
+        return os.path.isfile(os.path.join(self.index_folder, "meta.json"))
+
+    def current_generation(self):
+        """Generation id of the most recently published index (or clear), None if there is none."""
+        try:
+            with open(self.marker_path, "r") as f:
+                return f.read().strip() or None
+        except OSError:
+            return None
+
+    def _publish_generation(self, generation):
+        tmp_path = f"{self.marker_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(generation)
+        os.replace(tmp_path, self.marker_path)
+        self.generation = generation
+
+    def save(self, arrays, paths, config, state=None):
+        """
+        Write the index to a temporary folder and move it into place,
+        so readers never observe a half-written index. Returns the new
+        generation id.
+        """
+        generation = uuid.uuid4().hex
+        tmp_folder = self.index_folder + ".tmp"
+        old_folder = self.index_folder + ".old"
+        for folder in (tmp_folder, old_folder):
+            if os.path.isdir(folder):
+                shutil.rmtree(folder)
+        os.makedirs(tmp_folder)
+
+        names = [name for name in self.ARRAYS + self.OPTIONAL_ARRAYS if arrays.get(name) is not None]
+        for name in names:
+            np.save(os.path.join(tmp_folder, f"{name}.npy"), np.ascontiguousarray(arrays[name]))
+
+        with open(os.path.join(tmp_folder, "paths.json"), "w") as f:
+            json.dump(list(paths), f)
+
+        meta = {
+            "version": INDEX_VERSION,
+            "config_hash": self.config_hash(config),
+            "config": config,
+            "count": len(paths),
+            "generation": generation,
+            "arrays": names,
+            "state": state or {},
+        }
+        with open(os.path.join(tmp_folder, "meta.json"), "w") as f:
+            json.dump(meta, f)
+
+        if os.path.isdir(self.index_folder):
+            os.rename(self.index_folder, old_folder)
+        os.rename(tmp_folder, self.index_folder)
+        if os.path.isdir(old_folder):
+            shutil.rmtree(old_folder)
+        self._publish_generation(generation)
+        return generation
+
+    def load(self, config, mmap=True):
+        """
+        Open the index. Returns (arrays, paths, state), or None when the index is
+        missing, from another format version or built with another config.
+        """
+        if not self.exists():
+            return None
+
+        with open(os.path.join(self.index_folder, "meta.json"), "r") as f:
+            meta = json.load(f)
+        if meta.get("version") != INDEX_VERSION or meta.get("config_hash") != self.config_hash(config):
+            return None
+
+        mmap_mode = "r" if mmap else None
+        arrays = {
+            name: np.load(os.path.join(self.index_folder, f"{name}.npy"), mmap_mode=mmap_mode)
+            for name in meta["arrays"]
+        }
+        with open(os.path.join(self.index_folder, "paths.json"), "r") as f:
+            paths = json.load(f)
+
+        if (any(name not in arrays for name in self.ARRAYS) or len(paths) != meta["count"]
+                or arrays[self.ROWS_ARRAY].shape[0] != meta["count"]):
+            raise ValueError(f"{self.NAME} at {self.index_folder} is corrupted.")
+
+        self.generation = meta.get("generation")
+        return arrays, paths, meta.get("state", {})
+
+    def clear(self):
+        """Remove the index from disk and publish an empty generation."""
+        if os.path.isdir(self.index_folder):
+            shutil.rmtree(self.index_folder)
+        os.makedirs(os.path.dirname(self.marker_path) or ".", exist_ok=True)
+        self._publish_generation(uuid.uuid4().hex)
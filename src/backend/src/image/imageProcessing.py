@@ -1,15 +1,37 @@
+import io
 import os
 import numpy as np
 from PIL import Image
 from numpy.linalg import svd
-import json
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from src.metrics import metrics
+from src.settings import load_settings
 
-with open("settings.json", "r") as file:
-    settings = json.load(file)
-    
 class ImageProcessor:
-    def __init__(self, resize_shape=(50, 50)):
+    """
+    Turns images into flattened uint8 grayscale rows of resize_shape.
+
+    preprocessing="fast" lets PIL do the work on 8-bit data: JPEGs are
+    decoded at a reduced scale (draft mode, luminance only), other images
+    are converted with PIL's native "L" conversion, and the resize first
+    shrinks by an integer factor (reducing_gap) before the bicubic filter.
+    preprocessing="exact" converts the full-resolution RGB array to float64
+    grayscale with numpy before resizing, as the first version of the
+    pipeline did. Both use the same ITU-R 601 luma weights; their rows
+    differ by a few gray levels at most.
+    """
+
+    PREPROCESSING_MODES = ("fast", "exact")
+    # Decode and reduce to no less than this multiple of the target size
+    # before the final bicubic resize; 3 keeps the result close to a plain resize.
+    REDUCING_GAP = 3.0
+
+    def __init__(self, resize_shape=(50, 50), preprocessing="fast"):
+        if preprocessing not in self.PREPROCESSING_MODES:
+            raise ValueError(f"Invalid preprocessing mode '{preprocessing}'. "
+                             f"Choose one of {self.PREPROCESSING_MODES}.")
         self.resize_shape = resize_shape
+        self.preprocessing = preprocessing
 
     def load_and_preprocess(self, image_dir):
         """
@@ -19,7 +41,7 @@ class ImageProcessor:
         image_paths = [
             os.path.join(image_dir, fname)
             for fname in os.listdir(image_dir)
-            if fname.lower().endswith(settings["IMAGE_CONFIG"]["supported_formats"])
+            if fname.lower().endswith(tuple(load_settings()["IMAGE_CONFIG"]["supported_formats"]))
         ]
         if not image_paths:
             raise ValueError("No images found in the directory.")
@@ -40,6 +62,129 @@ class ImageProcessor:
         
         return np.array(images), image_paths
 
+    def load_image(self, source):
+        """
+        Decode one image (path, bytes or file object) into a flattened uint8
+        grayscale row.
+        """
+        if isinstance(source, bytes):
+            source = io.BytesIO(source)
+        if self.preprocessing == "fast":
+            return self.load_image_fast(source)
+        with metrics.timer("image.decode"):
+            image = np.array(Image.open(source).convert("RGB"))
+        with metrics.timer("image.grayscale"):
+            grayscale = self.rgb_to_grayscale(image)
+        with metrics.timer("image.resize"):
+            resized = self.resize_image(grayscale)
+        return np.clip(np.rint(resized), 0, 255).astype(np.uint8).ravel()
+
+    def load_image_fast(self, source):
+        """load_image for preprocessing="fast"; never materializes a full-resolution array."""
+        with metrics.timer("image.decode"):
+            image = Image.open(source)
+            if image.format == "JPEG":
+                # libjpeg scales by 1/2, 1/4 or 1/8 while decoding, and skips the chroma planes.
+                image.draft("L", (int(self.resize_shape[0] * self.REDUCING_GAP),
+                                  int(self.resize_shape[1] * self.REDUCING_GAP)))
+            image.load()
+        with metrics.timer("image.grayscale"):
+            grayscale = self.to_luminance(image)
+        with metrics.timer("image.resize"):
+            resized = grayscale.resize(tuple(self.resize_shape), Image.BICUBIC, reducing_gap=self.REDUCING_GAP)
+        return np.asarray(resized, dtype=np.uint8).ravel()
+
+    @staticmethod
+    def to_luminance(image):
+        """8-bit grayscale PIL image; modes without a direct conversion go through RGB."""
+        if image.mode == "L":
+            return image
+        try:
+            return image.convert("L")
+        except ValueError:
+            return image.convert("RGB").convert("L")
+
+    def load_images(self, image_paths, workers=1, chunksize=16):
+        """
+        Decode many images into a preallocated (N x d) uint8 matrix whose rows
+        follow the order of image_paths. Files that fail are skipped.
+        image_paths may be a generator, e.g. of files still being extracted.
+
+        Returns (images, loaded_paths, failures) where failures is a list of
+        (path, error message).
+        """
+        seen = []
+
+        def track(paths):
+            for path in paths:
+                seen.append(path)
+                yield path
+
+        if hasattr(image_paths, "__len__"):
+            seen = list(image_paths)
+            sources = seen
+        else:
+            sources = track(image_paths)
+        images, loaded, failures = self.decode_images(sources, workers=workers, chunksize=chunksize)
+        return images, [seen[i] for i in loaded], [(seen[i], error) for i, error in failures]
+
+    def decode_images(self, sources, workers=1, chunksize=16, threads=False):
+        """
+        Decode paths, bytes or file objects into a preallocated uint8 matrix
+        in input order. With workers > 1 decoding runs on a process pool
+        (workers=None uses every core) and each worker returns raw uint8 bytes.
+        threads=True uses a thread pool instead, for request handlers: PIL
+        releases the GIL while decoding, and forking a pool per request from
+        a threaded server is both slow and unsafe.
+        sources may be an iterator: tasks are then submitted as its items
+        arrive and the matrix grows as needed.
+
+        Returns (images, loaded_indices, failures) where failures is a list of
+        (index, error message).
+        """
+        sized = hasattr(sources, "__len__")
+        n_features = self.resize_shape[0] * self.resize_shape[1]
+        images = np.empty((len(sources) if sized else 256, n_features), dtype=np.uint8)
+        loaded = []
+        failures = []
+        labels = []
+
+        def tasks():
+            for i, source in enumerate(sources):
+                if not isinstance(source, (str, bytes, os.PathLike)):
+                    source = source.read()
+                labels.append(source if isinstance(source, str) else f"#{i}")
+                yield source, tuple(self.resize_shape), self.preprocessing
+
+        if workers is None or workers <= 0:
+            workers = os.cpu_count() or 1
+        executor = None
+        # A process pool only pays off for larger batches; threads start cheaply.
+        min_batch = 2 if threads else 2 * chunksize
+        if workers > 1 and (not sized or len(sources) >= min_batch):
+            executor = (ThreadPoolExecutor if threads else ProcessPoolExecutor)(max_workers=workers)
+        with metrics.timer("image.decode_batch"):
+            try:
+                if executor is not None:
+                    results = executor.map(_decode_worker, tasks(), chunksize=chunksize)
+                else:
+                    results = map(_decode_worker, tasks())
+
+                for i, (row, error) in enumerate(results):
+                    if error is not None:
+                        print(f"Warning: Failed to process image {labels[i]}. Error: {error}")
+                        failures.append((i, error))
+                        continue
+                    if len(loaded) == len(images):
+                        images = np.concatenate([images, np.empty_like(images)])
+                    images[len(loaded)] = np.frombuffer(row, dtype=np.uint8)
+                    loaded.append(i)
+            finally:
+                if executor is not None:
+                    executor.shutdown()
+
+        return images[:len(loaded)], loaded, failures
+
     def rgb_to_grayscale(self, image):
         """Convert RGB image to grayscale."""
         return np.dot(image[..., :3], [0.2989, 0.5870, 0.1140])
@@ -49,23 +194,179 @@ class ImageProcessor:
         return np.array(Image.fromarray(image).resize(self.resize_shape))
 
 
+def _decode_worker(task):
+    """Pool entry point: returns (uint8 row bytes, None) or (None, error)."""
+    source, resize_shape, preprocessing = task
+    try:
+        return ImageProcessor(resize_shape=resize_shape, preprocessing=preprocessing).load_image(source).tobytes(), None
+    except Exception as e:
+        return None, str(e)
+
+
 class PCAProcessor:
-    def __init__(self, n_components=50):
+    SOLVERS = ("auto", "full", "gram", "randomized")
+
+    def __init__(self, n_components=50, solver="auto", random_state=0, n_oversamples=50, n_iter=4, max_iter=30,
+                 tolerance=1e-4):
+        if solver not in self.SOLVERS:
+            raise ValueError(f"Invalid PCA solver '{solver}'. Choose one of {self.SOLVERS}.")
         self.n_components = n_components
+        self.solver = solver
+        self.random_state = random_state
+        # Randomized solver: at least n_iter and at most max_iter power
+        # iterations, until the estimated subspace error is below tolerance.
+        self.n_oversamples = n_oversamples
+        self.n_iter = n_iter
+        self.max_iter = max_iter
+        self.tolerance = tolerance
+        # Solver the last fit actually ran ("gram" when randomized fell back).
+        self.fitted_solver = None
         self.mean_image = None
         self.components = None
+        self.singular_values = None
+        self.n_samples_seen = 0
 
     def fit(self, images):
-        """Fit PCA to the image dataset using SVD."""
+        """Fit PCA to the image dataset with the configured solver."""
+        images = np.asarray(images, dtype=np.float64)
         self.mean_image = np.mean(images, axis=0)
         centered_data = images - self.mean_image
-        U, _, Vt = svd(centered_data, full_matrices=False)
-        self.components = Vt[:self.n_components]
+        n_components = min(self.n_components, *centered_data.shape)
+
+        solver = self.resolve_solver(centered_data.shape, n_components)
+        with metrics.timer("pca.fit"):
+            if solver == "full":
+                S, Vt = self._fit_full(centered_data)
+            elif solver == "gram":
+                S, Vt = self._fit_gram(centered_data, n_components)
+            else:
+                S, Vt = self._fit_randomized(centered_data, n_components)
+                if S is None:
+                    print(f"Warning: randomized PCA did not converge in {self.max_iter} iterations; "
+                          f"using the exact Gram solver.")
+                    solver = "gram"
+                    S, Vt = self._fit_gram(centered_data, n_components)
+        self.fitted_solver = solver
+
+        Vt = self._flip_signs(Vt[:n_components])
+        self.singular_values = S[:n_components]
+        self.components = Vt
+        self.n_samples_seen = images.shape[0]
+
+    def partial_fit(self, images):
+        """
+        Update the mean and basis with a batch of new images (incremental PCA,
+        Ross et al. 2008) without revisiting the images seen so far.
+        """
+        images = np.asarray(images, dtype=np.float64)
+        if self.components is None:
+            self.fit(images)
+            return
+
+        n_seen, n_new = self.n_samples_seen, images.shape[0]
+        n_total = n_seen + n_new
+        batch_mean = np.mean(images, axis=0)
+        updated_mean = (n_seen * self.mean_image + n_new * batch_mean) / n_total
+        mean_correction = np.sqrt(n_seen * n_new / n_total) * (self.mean_image - batch_mean)
+
+        stacked = np.vstack([
+            self.singular_values[:, None] * self.components,
+            images - batch_mean,
+            mean_correction,
+        ])
+        with metrics.timer("pca.partial_fit"):
+            _, S, Vt = svd(stacked, full_matrices=False)
+
+        n_components = min(self.n_components, *stacked.shape)
+        self.components = self._flip_signs(Vt[:n_components])
+        self.singular_values = S[:n_components]
+        self.mean_image = updated_mean
+        self.n_samples_seen = n_total
+
+    def resolve_solver(self, shape, n_components):
+        """
+        Pick an exact solver for "auto": SVD for small inputs, Gram
+        eigendecomposition otherwise. The randomized solver is approximate
+        (its error grows as the spectrum flattens), so it is only used when
+        asked for explicitly.
+        """
+        if self.solver != "auto":
+            return self.solver
+        n_samples, n_features = shape
+        if n_samples * n_features <= 1_000_000:
+            return "full"
+        return "gram"
+
+    def _fit_full(self, centered_data):
+        _, S, Vt = svd(centered_data, full_matrices=False)
+        return S, Vt
+
+    def _fit_gram(self, centered_data, n_components):
+        """
+        Eigendecompose the smaller of X X^T (N x N) and X^T X (d x d)
+        instead of running an SVD over the whole data matrix.
+        """
+        n_samples, n_features = centered_data.shape
+        if n_samples < n_features:
+            eigvals, eigvecs = np.linalg.eigh(centered_data @ centered_data.T)
+            order = np.argsort(eigvals)[::-1][:n_components]
+            S = np.sqrt(np.clip(eigvals[order], 0, None))
+            U = eigvecs[:, order]
+            Vt = (U.T @ centered_data) / np.where(S > 0, S, 1)[:, None]
+        else:
+            eigvals, eigvecs = np.linalg.eigh(centered_data.T @ centered_data)
+            order = np.argsort(eigvals)[::-1][:n_components]
+            S = np.sqrt(np.clip(eigvals[order], 0, None))
+            Vt = eigvecs[:, order].T
+        return S, Vt
+
+    def _fit_randomized(self, centered_data, n_components):
+        """
+        Randomized truncated SVD (Halko et al.) with a fixed seed and as many
+        power iterations as the spectrum needs. Each iteration shrinks the
+        error by a roughly constant rate, which stays close to 1 when the
+        tail decays slowly. After n_iter iterations, the rate is estimated
+        from the movement of the top n_components subspace in consecutive
+        iterations. The iteration stops once the remaining error, movement *
+        rate / (1 - rate), is below tolerance. Returns (None, None) when that
+        takes more than max_iter iterations.
+        """
+        n_samples, n_features = centered_data.shape
+        n_random = min(n_components + self.n_oversamples, n_samples, n_features)
+        rng = np.random.default_rng(self.random_state)
+
+        Q = centered_data @ rng.standard_normal((n_features, n_random))
+        Q, _ = np.linalg.qr(Q)
+        previous, movement = None, None
+        for iteration in range(1, self.max_iter + 1):
+            Z, _ = np.linalg.qr(centered_data.T @ Q)
+            Q, _ = np.linalg.qr(centered_data @ Z)
+            if iteration < self.n_iter:
+                continue
+
+            _, S, Vt = svd(Q.T @ centered_data, full_matrices=False)
+            current = Vt[:n_components]
+            if previous is not None:
+                cosines = svd(previous @ current.T, compute_uv=False)
+                last_movement, movement = movement, float(np.sqrt(max(0.0, 1.0 - np.min(cosines) ** 2)))
+                rate = min(movement / last_movement, 0.99) if last_movement else 0.5
+                if movement * rate / (1.0 - rate) < self.tolerance:
+                    return S, Vt
+            previous = current
+        return None, None
+
+    @staticmethod
+    def _flip_signs(Vt):
+        """Make the largest coefficient of each component positive so every solver yields the same signs."""
+        signs = np.sign(Vt[np.arange(Vt.shape[0]), np.argmax(np.abs(Vt), axis=1)])
+        signs[signs == 0] = 1
+        return Vt * signs[:, None]
 
     def transform(self, images):
         """Transform images to PCA space."""
-        centered_images = images - self.mean_image
-        return np.dot(centered_images, self.components.T)
+        with metrics.timer("pca.transform"):
+            centered_images = images - self.mean_image
+            return np.dot(centered_images, self.components.T)
     
     def fit_transform(self, images):
         """Fit PCA and transform the images."""
@@ -74,4 +375,5 @@ class PCAProcessor:
 
     def project(self, image):
         """Project a single image into PCA space."""
-        return np.dot(image - self.mean_image, self.components.T)
\ No newline at end of file
+        with metrics.timer("pca.project"):
+            return np.dot(image - self.mean_image, self.components.T)
\ No newline at end of file
@@ -1,61 +1,456 @@
 from src.image.imageProcessing import ImageProcessor, PCAProcessor
+from src.image.imageIndex import ImageIndex
+from src.image.ivfIndex import IVFIndex
+from src.image.quantization import ScalarQuantizer
+from src.image.perceptualHash import PerceptualHashTable
 from src.similarity import SimilarityCalculator
-from PIL import Image
+from src.metrics import metrics
 import os
 import numpy as np
 
 
 class ImageRetriever:
-    def __init__(self, n_components=100, resize_shape=(64, 64)):
-        self.pca_processor = PCAProcessor(n_components=n_components)
-        self.image_processor = ImageProcessor(resize_shape=resize_shape)
-        self.images = []
+    STORAGE_MODES = ("float64", "float32", "int8")
+
+    def __init__(self, n_components=100, resize_shape=(64, 64), pca_solver="auto", workers=1,
+                 ann_min_size=20000, nprobe=8, storage="float64", rerank_factor=10, preprocessing="fast",
+                 hash_distance=None):
+        if storage not in self.STORAGE_MODES:
+            raise ValueError(f"Invalid storage mode '{storage}'. Choose one of {self.STORAGE_MODES}.")
+        self.pca_processor = PCAProcessor(n_components=n_components, solver=pca_solver)
+        self.image_processor = ImageProcessor(resize_shape=resize_shape, preprocessing=preprocessing)
+        self.workers = workers
+        self.ann_min_size = ann_min_size
+        self.nprobe = nprobe
+        self.ann_index = None
+        self.storage = storage
+        self.rerank_factor = rerank_factor
+        self.quantizer = None
+        # Images whose perceptual hashes differ in at most hash_distance bits (and
+        # whose preprocessed pixels match) share one row; None, the default, indexes every
+        # image on its own row.
+        self.hash_distance = hash_distance
+        self.hash_table = None
+        self.aliases = {}
+        self.similarity = SimilarityCalculator()
         self.image_paths = []
+        self.failures = []
         self.projections = None
+        self.deleted = np.zeros(0, dtype=bool)
+        self.basis_drift = 0.0
         self.fit_status = False
 
     def fit(self, folder_path):
         """Load, preprocess, and fit the dataset."""
-        import os
+        image_paths = []
         for root, dirs, files in os.walk(folder_path):
-            for file in files:
+            for file in sorted(files):
                 if file.endswith('.png') or file.endswith('.jpg'):
-                    image_file = os.path.join(root, file)
-                    image = Image.open(image_file).convert("RGB")
-                    grayscale_image = self.image_processor.rgb_to_grayscale(
-                        np.array(image))
-                    resized_image = self.image_processor.resize_image(
-                        grayscale_image).flatten().astype(np.float64)
-                    self.images.append(resized_image)
-                    self.image_paths.append(image_file)
-
-        self.projections = self.pca_processor.fit_transform(self.images)
+                    image_paths.append(os.path.join(root, file))
+        self.fit_paths(image_paths)
+
+    def fit_paths(self, image_paths):
+        """
+        Fit the dataset from explicit image paths. image_paths may be a
+        generator, so files can be decoded while an upload is still being
+        unpacked. Near-duplicate images are collapsed into one row.
+        """
+        images, loaded_paths, self.failures = self.image_processor.load_images(
+            image_paths, workers=self.workers)
+        if not loaded_paths:
+            raise ValueError("All images failed to process. Please check the dataset.")
+
+        self.deleted = np.zeros(0, dtype=bool)
+        self.aliases = {}
+        self.hash_table = PerceptualHashTable(self.hash_distance) if self.hash_distance is not None else None
+        images, loaded_paths = self.collapse_duplicates(images, loaded_paths)
+        self.image_paths = loaded_paths
+        # The decoded pixels are dropped once projected; only the projections are kept.
+        self.projections = self.pca_processor.fit_transform(images)
+        self.deleted = np.zeros(len(self.image_paths), dtype=bool)
+        self.basis_drift = 0.0
+        self.compact()
+        self.build_ann_index()
         self.fit_status = True
 
-    def predict(self, query_image_path, result_limit=5, max_distance=float('inf'), method="euclidean"):
-        """Find similar images."""
+    def compact(self):
+        """
+        Apply the storage mode: float32 halves the projections and the PCA
+        basis; int8 additionally encodes the projections as scalar-quantized
+        codes that are scanned first, with a shortlist re-ranked on the
+        full-precision rows.
+        """
+        if self.storage == "float64":
+            return
+        self.projections = np.asarray(self.projections, dtype=np.float32)
+        self.pca_processor.mean_image = np.asarray(self.pca_processor.mean_image, dtype=np.float32)
+        self.pca_processor.components = np.asarray(self.pca_processor.components, dtype=np.float32)
+        if self.storage == "int8":
+            self.quantizer = ScalarQuantizer().fit(self.projections)
+
+    def collapse_duplicates(self, images, paths):
+        """
+        Hash decoded images and match them against the live rows and each
+        other. Duplicates are recorded as aliases of the row they match;
+        returns the images and paths that need rows of their own.
+        """
+        if self.hash_table is None:
+            return images, paths
+        n_rows = len(self.hash_table.hashes)
+        with metrics.timer("image.hash"):
+            hashes, thumbnails = self.hash_table.compute(images, self.image_processor.resize_shape)
+            rows = self.hash_table.assign(hashes, thumbnails, images, self.stored_pixels, live=~self.deleted)
+        new = []
+        for i, row in enumerate(rows):
+            if row == n_rows + len(new):
+                new.append(i)
+            else:
+                self.aliases.setdefault(int(row), []).append(paths[i])
+        return images[new], [paths[i] for i in new]
+
+    def stored_pixels(self, row):
+        """
+        Preprocessed pixels of an indexed row, re-read from its image or one
+        of its aliases (the index keeps no pixels); None if none can be read.
+        """
+        for path in [self.image_paths[row]] + self.aliases.get(int(row), []):
+            try:
+                return self.image_processor.load_image(path)
+            except Exception:
+                continue
+        return None
+
+    def named_results(self, matches, result_limit=5):
+        """File names of the matched (row, score) pairs followed by their aliases, at most result_limit of them."""
+        results = []
+        for row, score in matches:
+            for path in [self.image_paths[row]] + self.aliases.get(int(row), []):
+                results.append((os.path.basename(path), score))
+        return results[:result_limit]
+
+    def memory_usage(self):
+        """Bytes held by the index arrays, split into heap and memory-mapped."""
+        arrays = [self.projections, self.pca_processor.mean_image, self.pca_processor.components]
+        if self.quantizer is not None:
+            arrays += [self.quantizer.codes, self.quantizer.code_norms]
+        if self.hash_table is not None:
+            arrays += [self.hash_table.hashes, self.hash_table.thumbnails]
+        usage = {"heap": 0, "mapped": 0}
+        for array in arrays:
+            if array is None:
+                continue
+            mapped = isinstance(array, np.memmap) or isinstance(getattr(array, "base", None), np.memmap)
+            usage["mapped" if mapped else "heap"] += array.nbytes
+        return usage
+
+    def build_ann_index(self):
+        """
+        Build the IVF index over the projections when the corpus is large
+        enough for it to pay off; small corpora use brute force.
+        """
+        if self.ann_min_size is not None and len(self.projections) >= self.ann_min_size:
+            self.ann_index = IVFIndex(nprobe=self.nprobe).build(self.projections)
+        else:
+            self.ann_index = None
+
+    def load_image(self, image_file):
+        """Decode one image (path, bytes or file object) into a flattened grayscale vector."""
+        return self.image_processor.load_image(image_file).astype(np.float64)
+
+    def add(self, image_paths):
+        """
+        Append images to a fitted index. The new images update the PCA basis
+        incrementally, the existing projections are rotated into the new basis
+        and the new images are projected right away. Paths that are already
+        indexed are replaced, and duplicates of indexed images only become
+        aliases of their rows.
+        """
+        if not self.fit_status:
+            self.fit_paths(image_paths)
+            return
+
+        image_paths = list(image_paths)
+        self.remove(image_paths)
+        new_images, image_paths, self.failures = self.image_processor.load_images(
+            image_paths, workers=self.workers)
+        new_images, image_paths = self.collapse_duplicates(new_images, image_paths)
+        if not image_paths:
+            return
+
+        old_mean = self.pca_processor.mean_image
+        old_components = self.pca_processor.components
+        self.pca_processor.partial_fit(new_images)
+        new_components = self.pca_processor.components
+
+        # Reconstruct the stored rows from the old basis and re-project them,
+        # which avoids touching the original pixels.
+        offset = np.dot(old_mean - self.pca_processor.mean_image, new_components.T)
+        rotation = np.dot(old_components, new_components.T)
+        rotated = np.dot(self.projections, rotation) + offset
+
+        new_projections = self.pca_processor.transform(new_images)
+        self.projections = np.vstack([rotated, new_projections])
+        if self.ann_index is not None:
+            self.ann_index.transform(rotation, offset)
+            self.ann_index.add(new_projections)
+        elif self.ann_min_size is not None and len(self.projections) >= self.ann_min_size:
+            self.ann_index = IVFIndex(nprobe=self.nprobe).build(self.projections)
+        self.image_paths.extend(image_paths)
+        self.deleted = np.concatenate([self.deleted, np.zeros(len(image_paths), dtype=bool)])
+        self.compact()
+        self.basis_drift += self._basis_drift(old_components, new_components)
+
+    def remove(self, image_names):
+        """
+        Remove indexed images by path or file name. A row whose image has
+        aliases passes to the first remaining alias; other rows are
+        tombstoned and stay in place until the next full rebuild. Returns the
+        number of images removed.
+        """
+        names = set(image_names) | {os.path.basename(name) for name in image_names}
+
+        def matches(path):
+            return path in names or os.path.basename(path) in names
+
+        removed = 0
+        for i, path in enumerate(self.image_paths):
+            if self.deleted[i]:
+                continue
+            aliases = self.aliases.pop(i, [])
+            kept = [alias for alias in aliases if not matches(alias)]
+            removed += len(aliases) - len(kept)
+            if matches(path):
+                removed += 1
+                if kept:
+                    self.image_paths[i] = kept.pop(0)
+                else:
+                    self.deleted[i] = True
+            if kept:
+                self.aliases[i] = kept
+        return removed
+
+    def relocate(self, old_folder, new_folder):
+        """Point the indexed paths (and aliases) under old_folder at new_folder, after the files were moved there."""
+        def move(path):
+            return ImageIndex.relocate_path(path, old_folder, new_folder)
+
+        self.image_paths = [move(path) for path in self.image_paths]
+        self.aliases = {row: [move(path) for path in aliases] for row, aliases in self.aliases.items()}
+
+    def drift(self):
+        """
+        How far the index has moved since the last full fit: the larger of the
+        accumulated basis rotation and the fraction of tombstoned rows.
+        """
+        if not self.fit_status or len(self.deleted) == 0:
+            return 0.0
+        return max(min(1.0, self.basis_drift), float(np.mean(self.deleted)))
+
+    def rebuild(self):
+        """Refit from the live images only, dropping tombstoned rows."""
+        live_paths = []
+        for i, path in enumerate(self.image_paths):
+            if not self.deleted[i]:
+                live_paths += [path] + self.aliases.get(i, [])
+        live_paths = [path for path in live_paths if os.path.exists(path)]
+        if not live_paths:
+            raise ValueError("No images left to rebuild the index from.")
+        self.fit_paths(live_paths)
+
+    def _basis_drift(self, old_components, new_components):
+        """
+        Share of the new basis' variance that falls outside the old subspace,
+        weighted by the squared singular values so noisy trailing components
+        do not dominate.
+        """
+        weights = self.pca_processor.singular_values ** 2
+        captured = np.sum(np.dot(new_components, old_components.T) ** 2, axis=1)
+        return float(np.sum(weights * (1.0 - captured)) / max(np.sum(weights), 1e-12))
+
+    def predict(self, query_image, result_limit=5, max_distance=float('inf'), method="euclidean",
+                min_similarity=-float('inf')):
+        """
+        Find similar images. query_image is a path, bytes or a file object.
+        method is one of SimilarityCalculator.METRICS; results carry distances
+        (filtered by max_distance) or similarities (filtered by min_similarity).
+        Deduplication is index-side only: a query that duplicates an indexed
+        image is projected and searched like any other, and the images
+        collapsed into a matched row are listed after it.
+        """
+        SimilarityCalculator.check_metric(method)
         try:
-            query_image = Image.open(query_image_path).convert("RGB")
-            query_grayscale = self.image_processor.rgb_to_grayscale(
-                np.array(query_image))
-            query_resized = self.image_processor.resize_image(
-                query_grayscale).flatten().astype(float)
+            query_resized = self.load_image(query_image)
         except Exception as e:
             raise ValueError(f"Error processing query image: {e}")
 
         query_projection = self.pca_processor.project(query_resized)
+        return self.named_results(self.search(query_projection, result_limit, max_distance, metric=method,
+                                              min_similarity=min_similarity), result_limit)
+
+    def similarity_engine(self):
+        """SimilarityCalculator fitted on the current projections; norms are computed once per projection matrix."""
+        if self.similarity.vectors is not self.projections:
+            self.similarity = SimilarityCalculator(self.projections)
+        return self.similarity
+
+    def search(self, query_projection, result_limit=5, max_distance=float('inf'), nprobe=None, metric="euclidean",
+               min_similarity=-float('inf')):
+        """
+        Best rows for one projected query as (row, score), best first.
+        Scans only the probed IVF lists when an ANN index exists and the
+        metric is one of IVFIndex.METRICS, otherwise every row.
+        """
+        largest = SimilarityCalculator.is_similarity(metric)
+        similarity = self.similarity_engine()
+        with metrics.timer("image.candidates"):
+            if self.ann_index is not None and metric in IVFIndex.METRICS:
+                rows = self.ann_index.candidates(query_projection, nprobe)
+                rows = rows[~self.deleted[rows]]
+            elif self.deleted.any():
+                rows = np.flatnonzero(~self.deleted)
+            else:
+                # Every row: score the matrix in place instead of gathering a copy.
+                rows = None
+
+        if self.quantizer is not None:
+            with metrics.timer("image.quantized_scan"):
+                approximate = similarity.scores(query_projection, metric, rows=rows,
+                                                dots=self.quantizer.inner_products(query_projection, rows))
+                shortlist = SimilarityCalculator.top_k(approximate[None, :], result_limit * self.rerank_factor,
+                                                       largest=largest)[0]
+                rows = np.sort(shortlist if rows is None else rows[shortlist])
+
+        with metrics.timer("image.distance"):
+            scores = similarity.scores(query_projection, metric, rows=rows)
+            keep = scores >= min_similarity if largest else scores <= max_distance
+            if rows is None:
+                rows = np.flatnonzero(keep)
+                scores = scores[rows]
+            else:
+                rows, scores = rows[keep], scores[keep]
+
+        with metrics.timer("image.sort"):
+            nearest = SimilarityCalculator.top_k(scores[None, :], result_limit, largest=largest)[0]
+        return [(rows[i], scores[i]) for i in nearest]
 
-        distances = SimilarityCalculator.euclidean_distance(
-            query_projection, self.projections)
-        distances = np.squeeze(distances)
+    def predict_batch(self, query_images, result_limit=5, max_distance=float('inf'), method="euclidean",
+                      min_similarity=-float('inf')):
+        """
+        Find similar images for many queries (paths, bytes or file objects)
+        at once: all scores come from one matrix product and each row keeps
+        its top-k via argpartition.
 
-        result = [(self.image_paths[i], distances[i])
-                  for i in range(len(distances)) if distances[i] <= max_distance]
-        result.sort(key=lambda x: x[1])
-        result = result[:result_limit]
-        result = [(os.path.basename(k), v) for k, v in result]
+        Returns (results, failures): one result list per query (empty for
+        queries that could not be decoded) and a list of (index, error).
+        Like predict(), duplicate queries are not answered from the hash table.
+        """
+        SimilarityCalculator.check_metric(method)
+        query_images = list(query_images)
+        queries, loaded_rows, failures = self.image_processor.decode_images(
+            query_images, workers=self.workers, threads=True)
+
+        results = [[] for _ in query_images]
+        if not loaded_rows:
+            return results, failures
+
+        query_projections = self.pca_processor.transform(queries)
+
+        if (self.ann_index is not None and method in IVFIndex.METRICS) or self.quantizer is not None:
+            for row, i in enumerate(loaded_rows):
+                results[i] = self.named_results(self.search(query_projections[row], result_limit, max_distance,
+                                                            metric=method, min_similarity=min_similarity),
+                                                result_limit)
+            return results, failures
+
+        largest = SimilarityCalculator.is_similarity(method)
+        similarity = self.similarity_engine()
+        with metrics.timer("image.distance"):
+            scores = similarity.pairwise(query_projections, method)
+            scores[:, self.deleted] = -np.inf if largest else np.inf
+        with metrics.timer("image.sort"):
+            nearest = similarity.rank(scores, result_limit, method)
+        for row, i in enumerate(loaded_rows):
+            # Tombstoned rows rank last with an infinite score; drop them so
+            # they are never returned, even without a distance cut-off.
+            results[i] = self.named_results(
+                [(j, scores[row, j]) for j in nearest[row]
+                 if not self.deleted[j]
+                 and (scores[row, j] >= min_similarity if largest else scores[row, j] <= max_distance)],
+                result_limit)
+        return results, failures
+
+    def config(self):
+        """Parameters that must match for a saved index to be reusable."""
+        return {
+            "n_components": self.pca_processor.n_components,
+            "resize_shape": list(self.image_processor.resize_shape),
+            "preprocessing": self.image_processor.preprocessing,
+            "storage": self.storage,
+            "hash_distance": self.hash_distance,
+        }
+
+    def save(self, index_folder):
+        """Persist the fitted PCA basis, projections and path table. Returns the generation id."""
+        if not self.fit_status:
+            raise ValueError("Model is not trained yet.")
+        arrays = {
+            "mean": self.pca_processor.mean_image,
+            "components": self.pca_processor.components,
+            "singular_values": self.pca_processor.singular_values,
+            "projections": self.projections,
+            "deleted": self.deleted,
+        }
+        if self.ann_index is not None:
+            arrays.update(self.ann_index.arrays())
+        if self.quantizer is not None:
+            arrays.update(self.quantizer.arrays())
+        if self.hash_table is not None:
+            arrays.update(self.hash_table.arrays())
+        state = {
+            "n_samples_seen": self.pca_processor.n_samples_seen,
+            "basis_drift": self.basis_drift,
+            "aliases": {str(row): paths for row, paths in self.aliases.items()},
+        }
+        return ImageIndex(index_folder).save(arrays, self.image_paths, self.config(), state)
+
+    def load(self, index_folder, mmap=True):
+        """
+        Restore a saved index without refitting. Arrays are memory-mapped
+        read-only by default. Returns False if no compatible index exists.
+        """
+        loaded = ImageIndex(index_folder).load(self.config(), mmap=mmap)
+        if loaded is None:
+            return False
+
+        arrays, paths, state = loaded
+        self.pca_processor.mean_image = arrays["mean"]
+        self.pca_processor.components = arrays["components"]
+        self.pca_processor.singular_values = arrays["singular_values"]
+        self.pca_processor.n_samples_seen = state.get("n_samples_seen", len(paths))
+        self.projections = arrays["projections"]
+        self.deleted = np.array(arrays["deleted"], dtype=bool)
+        self.basis_drift = state.get("basis_drift", 0.0)
+        self.ann_index = IVFIndex.from_arrays(arrays, nprobe=self.nprobe) if "ivf_centroids" in arrays else None
+        self.quantizer = ScalarQuantizer.from_arrays(arrays) if "codes" in arrays else None
+        self.hash_table = (PerceptualHashTable.from_arrays(arrays, self.hash_distance)
+                           if "thumbnails" in arrays and self.hash_distance is not None else None)
+        self.aliases = {int(row): aliases for row, aliases in state.get("aliases", {}).items()}
+        self.image_paths = paths
+        self.fit_status = True
+        return True
 
-        return result
+    def warm_up(self):
+        """
+        Read the (memory-mapped) index arrays once so they are in the page
+        cache, and run one projection and search before the first query.
+        """
+        if not self.fit_status:
+            return
+        for array in (self.projections, self.pca_processor.components, self.pca_processor.mean_image):
+            float(np.sum(array))
+        if self.quantizer is not None:
+            int(np.sum(self.quantizer.codes, dtype=np.int64))
+        self.search(self.pca_processor.project(np.asarray(self.pca_processor.mean_image, dtype=np.float64)))
 
     def is_fit(self):
         return self.fit_status
@@ -0,0 +1,104 @@
+import numpy as np
+
+
+class IVFIndex:
+    """
+    Inverted-file index over PCA projections.
+
+    A k-means coarse quantizer splits the projection space into n_lists
+    cells; every row is stored in the inverted list of its nearest centroid.
+    A query only scans the lists of its nprobe nearest centroids. The cells
+    are Euclidean, so they only hold the nearest neighbours under the
+    metrics in METRICS; cosine and inner-product rankings need other rows.
+    """
+
+    METRICS = ("euclidean", "sqeuclidean")
+
+    def __init__(self, n_lists=None, nprobe=8, n_iter=20, random_state=0):
+        self.n_lists = n_lists
+        self.nprobe = nprobe
+        self.n_iter = n_iter
+        self.random_state = random_state
+        self.centroids = None
+        self.assignments = None
+        self.list_order = None
+        self.list_offsets = None
+
+    def build(self, vectors):
+        """Train the coarse quantizer on vectors and fill the inverted lists."""
+        vectors = np.asarray(vectors, dtype=np.float64)
+        n_lists = self.n_lists or max(1, int(round(np.sqrt(len(vectors)))))
+        n_lists = min(n_lists, len(vectors))
+        rng = np.random.default_rng(self.random_state)
+
+        # k-means on a bounded sample is enough to place the centroids.
+        sample_size = min(len(vectors), 256 * n_lists)
+        sample = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+        centroids = sample[rng.choice(sample_size, n_lists, replace=False)].copy()
+        for _ in range(self.n_iter):
+            labels = self._nearest(sample, centroids, 1)[:, 0]
+            counts = np.bincount(labels, minlength=n_lists)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            empty = counts == 0
+            centroids[~empty] = sums[~empty] / counts[~empty, None]
+            if np.any(empty):
+                centroids[empty] = sample[rng.choice(sample_size, int(np.sum(empty)), replace=False)]
+
+        self.centroids = centroids
+        self.assignments = self._nearest(vectors, centroids, 1)[:, 0]
+        self._rebuild_lists()
+        return self
+
+    def add(self, vectors):
+        """Append vectors (row ids continue after the existing ones)."""
+        labels = self._nearest(np.asarray(vectors, dtype=np.float64), self.centroids, 1)[:, 0]
+        self.assignments = np.concatenate([self.assignments, labels])
+        self._rebuild_lists()
+
+    def transform(self, rotation, offset):
+        """
+        Apply the affine map used to move projections into an updated PCA
+        basis to the centroids, keeping the existing list assignments.
+        """
+        self.centroids = np.dot(self.centroids, rotation) + offset
+
+    def candidates(self, query, nprobe=None):
+        """Row ids stored in the nprobe lists closest to query."""
+        nprobe = min(nprobe or self.nprobe, len(self.centroids))
+        lists = self._nearest(np.atleast_2d(query), self.centroids, nprobe)[0]
+        return np.concatenate([
+            self.list_order[self.list_offsets[i]:self.list_offsets[i + 1]] for i in lists
+        ])
+
+    def _rebuild_lists(self):
+        self.list_order = np.argsort(self.assignments, kind="stable")
+        counts = np.bincount(self.assignments, minlength=len(self.centroids))
+        self.list_offsets = np.concatenate([[0], np.cumsum(counts)])
+
+    @staticmethod
+    def _nearest(vectors, centroids, k, chunk_size=65536):
+        """Indices of the k nearest centroids of every vector, processed in chunks."""
+        centroid_norms = np.sum(centroids ** 2, axis=1)
+        result = np.empty((len(vectors), k), dtype=np.intp)
+        for start in range(0, len(vectors), chunk_size):
+            chunk = vectors[start:start + chunk_size]
+            distances = centroid_norms[None, :] - 2 * np.dot(chunk, centroids.T)
+            if k == 1:
+                result[start:start + chunk_size, 0] = np.argmin(distances, axis=1)
+            else:
+                part = np.argpartition(distances, k - 1, axis=1)[:, :k]
+                order = np.argsort(np.take_along_axis(distances, part, axis=1), axis=1)
+                result[start:start + chunk_size] = np.take_along_axis(part, order, axis=1)
+        return result
+
+    def arrays(self):
+        return {"ivf_centroids": self.centroids, "ivf_assignments": self.assignments}
+
+    @classmethod
+    def from_arrays(cls, arrays, nprobe=8):
+        index = cls(n_lists=len(arrays["ivf_centroids"]), nprobe=nprobe)
+        index.centroids = np.asarray(arrays["ivf_centroids"])
+        index.assignments = np.asarray(arrays["ivf_assignments"])
+        index._rebuild_lists()
+        return index
@@ -0,0 +1,153 @@
+import numpy as np
+
+
+class PerceptualHashTable:
+    """
+    64-bit difference hashes (dHash) of indexed images, one per projection row.
+
+    An image is shrunk to 8 x 9 block means of its preprocessed grayscale
+    row and every bit says whether a block is darker than its right
+    neighbour, so re-encodes and small resizes keep the hash (almost)
+    unchanged. The block means are kept as a 72-byte uint8 thumbnail next
+    to the hash, 80 bytes per row in total.
+
+    Two images are the same picture when no pixel of their preprocessed
+    rows differs by more than max_difference gray levels. Re-encoded or
+    resized photos stay within two gray levels, while distinct images on a
+    shared background, such as different words on the same canvas, differ
+    by far more where they differ. The pixels are not stored: a row whose
+    hash is within max_distance bits and whose thumbnail is within
+    max_difference (plus rounding) in every block is only a candidate, and
+    is confirmed by re-reading its source image through load_pixels. Detail
+    that all but disappears at the preprocessed resolution (small text on a
+    large canvas) cannot be told apart reliably, which is why deduplication
+    is opt-in.
+
+    assign() groups new images with the rows they match. It finds
+    candidates through max_distance + 1 band tables: by the pigeonhole
+    principle two hashes within max_distance bits agree exactly on at least
+    one band. Queries are not looked up: confirming a match would cost a
+    decode, more than the projection it saves, so a duplicate query is
+    searched like any other.
+    """
+
+    GRID = (8, 9)
+
+    def __init__(self, max_distance=4, max_difference=4):
+        self.max_distance = max_distance
+        self.max_difference = max_difference
+        self.hashes = np.zeros(0, dtype=np.uint64)
+        self.thumbnails = np.zeros((0, self.GRID[0] * self.GRID[1]), dtype=np.uint8)
+        self.bands = None
+
+    @classmethod
+    def compute(cls, images, shape):
+        """
+        (hashes, thumbnails) of every flattened grayscale row of images,
+        whose pixels are laid out as shape (width, height).
+        """
+        width, height = shape
+        pixels = np.asarray(images, dtype=np.float64).reshape(-1, height, width)
+        rows, columns = cls.GRID
+        row_edges = np.linspace(0, height, rows + 1).astype(np.intp)
+        column_edges = np.linspace(0, width, columns + 1).astype(np.intp)
+        blocks = np.add.reduceat(np.add.reduceat(pixels, row_edges[:-1], axis=1), column_edges[:-1], axis=2)
+        blocks /= np.maximum(np.diff(row_edges), 1)[:, None] * np.maximum(np.diff(column_edges), 1)[None, :]
+        bits = (blocks[:, :, :-1] < blocks[:, :, 1:]).reshape(len(pixels), -1)
+        hashes = np.packbits(bits, axis=1).view(">u8").ravel().astype(np.uint64)
+        thumbnails = np.clip(np.rint(blocks), 0, 255).astype(np.uint8).reshape(len(pixels), -1)
+        return hashes, thumbnails
+
+    def _band_masks(self):
+        edges = np.linspace(0, 64, self.max_distance + 2).astype(int)
+        return [np.uint64(((1 << int(stop - start)) - 1) << int(start)) for start, stop in zip(edges, edges[1:])]
+
+    def _build_bands(self):
+        self.bands = [{} for _ in self._band_masks()]
+        for row, value in enumerate(self.hashes):
+            self._insert(row, value)
+
+    def _insert(self, row, value):
+        for band, mask in zip(self.bands, self._band_masks()):
+            band.setdefault(int(value & mask), []).append(row)
+
+    @staticmethod
+    def _differences(a, b):
+        return np.max(np.abs(np.asarray(b, dtype=np.int16) - np.asarray(a, dtype=np.int16)), axis=-1)
+
+    def _shortlist(self, thumbnail, thumbnails):
+        """Positions of the thumbnails close enough to thumbnail, closest first."""
+        # A block mean differs by at most the largest pixel difference, plus one for rounding.
+        differences = self._differences(thumbnail, thumbnails)
+        close = np.flatnonzero(differences <= self.max_difference + 1)
+        return close[np.argsort(differences[close], kind="stable")]
+
+    def _same(self, pixels, other):
+        return other is not None and self._differences(pixels, other) <= self.max_difference
+
+    def assign(self, values, thumbnails, pixels, load_pixels, live=None):
+        """
+        Match each image, in order, to a live row, or append it as a new
+        row. Rows appended earlier in the same call are candidates too, so
+        duplicates within values collapse onto their first occurrence; their
+        pixels are at hand, existing rows are re-read through load_pixels.
+        Returns the row of every image.
+        """
+        if self.bands is None:
+            self._build_bands()
+        masks = self._band_masks()
+        values = np.asarray(values, dtype=np.uint64)
+        thumbnails = np.asarray(thumbnails, dtype=np.uint8)
+        n_rows = len(self.hashes)
+        # Existing rows and the new images in one pool; positions maps a row to its pool entry.
+        pool_hashes = np.concatenate([self.hashes, values])
+        pool_thumbnails = np.vstack([self.thumbnails, thumbnails])
+        positions = np.arange(n_rows + len(values))
+        alive = np.ones(n_rows + len(values), dtype=bool)
+        if live is not None:
+            alive[:len(live)] = live
+        loaded = {}
+
+        def row_pixels(row):
+            if row >= n_rows:
+                return pixels[positions[row] - n_rows]
+            if row not in loaded:
+                loaded[row] = load_pixels(row)
+            return loaded[row]
+
+        rows = np.empty(len(values), dtype=np.intp)
+        new = []
+        for i, value in enumerate(values):
+            candidates = set()
+            for band, mask in zip(self.bands, masks):
+                candidates.update(band.get(int(value & mask), ()))
+            best = None
+            if candidates:
+                candidates = np.sort(np.fromiter(candidates, dtype=np.intp, count=len(candidates)))
+                candidates = candidates[alive[candidates]]
+                pool = positions[candidates]
+                close = np.bitwise_count(pool_hashes[pool] ^ value) <= self.max_distance
+                candidates, pool = candidates[close], pool[close]
+                for position in self._shortlist(thumbnails[i], pool_thumbnails[pool]):
+                    if self._same(pixels[i], row_pixels(int(candidates[position]))):
+                        best = int(candidates[position])
+                        break
+            if best is None:
+                best = n_rows + len(new)
+                positions[best] = n_rows + i
+                new.append(i)
+                self._insert(best, value)
+            rows[i] = best
+        self.hashes = np.concatenate([self.hashes, values[new]])
+        self.thumbnails = np.vstack([self.thumbnails, thumbnails[new]])
+        return rows
+
+    def arrays(self):
+        return {"hashes": self.hashes, "thumbnails": self.thumbnails}
+
+    @classmethod
+    def from_arrays(cls, arrays, max_distance=4, max_difference=4):
+        table = cls(max_distance=max_distance, max_difference=max_difference)
+        table.hashes = arrays["hashes"]
+        table.thumbnails = arrays["thumbnails"]
+        return table
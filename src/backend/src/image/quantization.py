@@ -0,0 +1,93 @@
+import numpy as np
+
+
+class ScalarQuantizer:
+    """
+    Per-dimension int8 scalar quantization of projection rows.
+
+    Each dimension is mapped linearly from its [min, max] range onto
+    [-127, 127]. Approximate distances are computed directly on the codes,
+    in chunks, so only a (chunk x n_components) float32 buffer is ever
+    materialized.
+    """
+
+    def __init__(self, chunk_size=65536):
+        self.chunk_size = chunk_size
+        self.offset = None
+        self.scale = None
+        self.codes = None
+        self.code_norms = None
+
+    def fit(self, vectors):
+        """Choose the per-dimension ranges from vectors and encode them."""
+        vectors = np.asarray(vectors)
+        low, high = vectors.min(axis=0), vectors.max(axis=0)
+        self.offset = ((high + low) / 2).astype(np.float32)
+        self.scale = np.maximum((high - low) / 254, 1e-12).astype(np.float32)
+        self.codes = self.encode(vectors)
+        self.code_norms = self._norms(self.codes)
+        return self
+
+    def encode(self, vectors):
+        codes = np.rint((np.asarray(vectors) - self.offset) / self.scale)
+        return np.clip(codes, -127, 127).astype(np.int8)
+
+    def decode(self, codes):
+        return codes.astype(np.float32) * self.scale + self.offset
+
+    def _norms(self, codes):
+        weights = self.scale ** 2
+        norms = np.empty(len(codes), dtype=np.float32)
+        for start in range(0, len(codes), self.chunk_size):
+            chunk = codes[start:start + self.chunk_size].astype(np.float32)
+            norms[start:start + self.chunk_size] = (chunk ** 2) @ weights
+        return norms
+
+    def distances(self, query, rows=None):
+        """Approximate Euclidean distances from query to the encoded rows (all rows by default)."""
+        weights = self.scale ** 2
+        query_codes = ((np.asarray(query, dtype=np.float32) - self.offset) / self.scale).astype(np.float32)
+        weighted_query = weights * query_codes
+        query_norm = float(query_codes @ weighted_query)
+
+        n_rows = len(self.codes) if rows is None else len(rows)
+        squared = np.empty(n_rows, dtype=np.float32)
+        for start in range(0, n_rows, self.chunk_size):
+            stop = min(start + self.chunk_size, n_rows)
+            if rows is None:
+                chunk, norms = self.codes[start:stop], self.code_norms[start:stop]
+            else:
+                chunk, norms = self.codes[rows[start:stop]], self.code_norms[rows[start:stop]]
+            squared[start:stop] = norms - 2 * (chunk.astype(np.float32) @ weighted_query) + query_norm
+        return np.sqrt(np.clip(squared, 0, None))
+
+    def inner_products(self, query, rows=None):
+        """Approximate inner products of query with the encoded rows (all rows by default)."""
+        query = np.asarray(query, dtype=np.float32)
+        scaled_query = self.scale * query
+        bias = float(self.offset @ query)
+
+        n_rows = len(self.codes) if rows is None else len(rows)
+        dots = np.empty(n_rows, dtype=np.float32)
+        for start in range(0, n_rows, self.chunk_size):
+            stop = min(start + self.chunk_size, n_rows)
+            chunk = self.codes[start:stop] if rows is None else self.codes[rows[start:stop]]
+            dots[start:stop] = chunk.astype(np.float32) @ scaled_query + bias
+        return dots
+
+    def arrays(self):
+        return {
+            "code_offset": self.offset,
+            "code_scale": self.scale,
+            "codes": self.codes,
+            "code_norms": self.code_norms,
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        quantizer = cls()
+        quantizer.offset = np.asarray(arrays["code_offset"])
+        quantizer.scale = np.asarray(arrays["code_scale"])
+        quantizer.codes = np.asarray(arrays["codes"])
+        quantizer.code_norms = np.asarray(arrays["code_norms"])
+        return quantizer
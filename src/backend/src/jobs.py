@@ -0,0 +1,129 @@
+import os
+import threading
+import time
+import traceback
+import uuid
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import fcntl
+except ImportError:  # Windows: jobs are only serialized within one process.
+    fcntl = None
+
+class JobManager:
+    """
+    Runs model rebuilds in the background.
+
+    Each kind of job ("image", "audio") has its own single-thread queue, so
+    rebuilds of one model run one after another in submission order while
+    the two models can rebuild in parallel. A job is a plain callable; its
+    return value becomes the job result and an exception marks it failed.
+    Finished jobs are kept (up to max_jobs) so clients can poll them.
+
+    When several server processes run side by side, pass a SharedStore so
+    any of them can report on a job, and a lock_folder so rebuilds of one
+    kind also run one at a time across processes.
+    """
+
+    def __init__(self, max_jobs=100, store=None, lock_folder=None):
+        self.max_jobs = max_jobs
+        self.store = store
+        self.lock_folder = lock_folder
+        self.jobs = {}
+        self.futures = {}
+        self.queues = {}
+        self.lock = threading.Lock()
+        if lock_folder:
+            os.makedirs(lock_folder, exist_ok=True)
+
+    def submit(self, kind, fn, *args, **kwargs):
+        """Queue fn(*args, **kwargs) behind earlier jobs of the same kind. Returns the job id."""
+        job_id = uuid.uuid4().hex
+        job = {
+            "id": job_id,
+            "kind": kind,
+            "status": "queued",
+            "submitted": time.time(),
+            "started": None,
+            "finished": None,
+            "result": None,
+            "error": None,
+        }
+        self._record(job)
+        with self.lock:
+            self.jobs[job_id] = job
+            queue = self.queues.get(kind)
+            if queue is None:
+                queue = self.queues[kind] = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"{kind}-jobs")
+            self.futures[job_id] = queue.submit(self._run, job, fn, args, kwargs)
+            self._prune()
+        return job_id
+
+    def _run(self, job, fn, args, kwargs):
+        with self._kind_lock(job["kind"]):
+            job["status"] = "running"
+            job["started"] = time.time()
+            self._record(job)
+            try:
+                job["result"] = fn(*args, **kwargs)
+                job["status"] = "succeeded"
+            except Exception as e:
+                traceback.print_exc()
+                job["error"] = str(e)
+                job["status"] = "failed"
+            finally:
+                job["finished"] = time.time()
+                self._record(job)
+        return job
+
+    @contextmanager
+    def _kind_lock(self, kind):
+        """Exclusive lock on <lock_folder>/<kind>.lock, held while a job of that kind runs."""
+        if not self.lock_folder or fcntl is None:
+            yield
+            return
+        with open(os.path.join(self.lock_folder, f"{kind}.lock"), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _record(self, job):
+        if self.store is not None:
+            self.store.set("jobs", job["id"], job)
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job["status"] in ("succeeded", "failed")]
+        for job_id in finished[:max(0, len(self.jobs) - self.max_jobs)]:
+            del self.jobs[job_id]
+            del self.futures[job_id]
+            if self.store is not None:
+                self.store.delete("jobs", job_id)
+
+    def wait(self, job_id, timeout=None):
+        """Block until the job has finished and return its status."""
+        future = self.futures.get(job_id)
+        if future is not None:
+            future.result(timeout=timeout)
+        return self.status(job_id)
+
+    def status(self, job_id):
+        job = self.jobs.get(job_id)
+        if job is None and self.store is not None:
+            # Submitted by another server process.
+            return self.store.get("jobs", job_id)
+        return dict(job) if job is not None else None
+
+    def list(self, kind=None):
+        if self.store is not None:
+            jobs = [job for _, job in self.store.items("jobs") if kind is None or job["kind"] == kind]
+        else:
+            with self.lock:
+                jobs = [dict(job) for job in self.jobs.values() if kind is None or job["kind"] == kind]
+        return sorted(jobs, key=lambda job: job["submitted"], reverse=True)
+
+    def active(self, kind):
+        """True while a job of this kind is queued or running."""
+        return any(job["status"] in ("queued", "running") for job in self.list(kind))
@@ -0,0 +1,128 @@
+import threading
+import time
+from contextlib import nullcontext
+
+class Metrics:
+    """
+    In-process counters and latency histograms rendered in the Prometheus
+    text exposition format.
+
+    Stage timers share one histogram family, stage_duration_seconds, labelled
+    by stage name (e.g. "image.decode", "audio.piptrack"). When disabled,
+    timer() hands back a shared no-op context manager and inc()/observe()
+    return immediately, so instrumented code pays one attribute check.
+
+    Timings recorded inside process-pool workers stay in those workers; the
+    pooled stage as a whole is timed in the parent.
+    """
+
+    BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+    HELP = {
+        "stage_duration_seconds": "Time spent in one stage of the image or audio pipeline.",
+        "http_requests_total": "HTTP requests handled, by endpoint, method and status.",
+        "http_request_duration_seconds": "HTTP request latency, by endpoint.",
+        "result_cache_lookups_total": "Query result cache lookups, by cache and hit or miss.",
+    }
+
+    def __init__(self, enabled=True, buckets=BUCKETS):
+        self.enabled = enabled
+        self.buckets = tuple(buckets)
+        self.counters = {}
+        self.histograms = {}
+        self.lock = threading.Lock()
+        self._null = nullcontext()
+
+    def inc(self, name, amount=1, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram[0][i] += 1
+                    break
+            histogram[1] += value
+            histogram[2] += 1
+
+    def timer(self, stage):
+        """Context manager that records its duration under stage_duration_seconds{stage=...}."""
+        if not self.enabled:
+            return self._null
+        return _Timer(self, stage)
+
+    def reset(self):
+        with self.lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    def render(self):
+        """All metrics in the Prometheus text format (version 0.0.4)."""
+        with self.lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted((key, (list(value[0]), value[1], value[2])) for key, value in self.histograms.items())
+
+        lines = []
+        described = set()
+
+        def describe(name, kind):
+            if name not in described:
+                described.add(name)
+                if name in self.HELP:
+                    lines.append(f"# HELP {name} {self.HELP[name]}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), value in counters:
+            describe(name, "counter")
+            lines.append(f"{name}{_labels(labels)} {_number(value)}")
+
+        for (name, labels), (counts, total, count) in histograms:
+            describe(name, "histogram")
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f"{name}_bucket{_labels(labels + (('le', _number(bound)),))} {cumulative}")
+            lines.append(f"{name}_bucket{_labels(labels + (('le', '+Inf'),))} {count}")
+            lines.append(f"{name}_sum{_labels(labels)} {_number(total)}")
+            lines.append(f"{name}_count{_labels(labels)} {count}")
+
+        return "\n".join(lines) + "\n"
+
+
+class _Timer:
+    __slots__ = ("metrics", "stage", "start")
+
+    def __init__(self, metrics, stage):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.observe("stage_duration_seconds", time.perf_counter() - self.start, stage=self.stage)
+        return False
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, value in labels)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + "}"
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+metrics = Metrics()
@@ -0,0 +1,85 @@
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from src.metrics import metrics
+
+
+class ResultCache:
+    """
+    In-memory LRU cache of query results with a time-to-live.
+
+    Entries are keyed by the SHA-256 of the query bytes together with the
+    model version and the request parameters, so a repeated query is
+    answered without decoding, projecting or transcribing it again, and a
+    refitted model never serves stale results. max_entries=0 disables it.
+    """
+
+    def __init__(self, name, max_entries=1024, ttl=300.0):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    @staticmethod
+    def key(data, version, **params):
+        payload = json.dumps({"version": version, **params}, sort_keys=True, default=str)
+        digest = hashlib.sha256(data)
+        digest.update(payload.encode("utf-8"))
+        return digest.hexdigest()
+
+    def get(self, key):
+        """Cached results for key, or None. Updates the hit/miss counters."""
+        if not self.enabled:
+            return None
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or (self.ttl and time.monotonic() - entry[0] > self.ttl):
+                if entry is not None:
+                    del self.entries[key]
+                self.misses += 1
+                result = None
+            else:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                result = entry[1]
+        metrics.inc("result_cache_lookups_total", cache=self.name, result="miss" if result is None else "hit")
+        return result
+
+    def put(self, key, results):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.entries[key] = (time.monotonic(), results)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self.entries),
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
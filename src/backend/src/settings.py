@@ -0,0 +1,16 @@
+import json
+
+_settings = {}
+
+def load_settings(path="settings.json"):
+    """
+    Parse the settings file once per process; later calls return the same
+    dict instead of re-reading the file.
+    """
+    if path not in _settings:
+        try:
+            with open(path, "r") as f:
+                _settings[path] = json.load(f)
+        except FileNotFoundError:
+            raise FileNotFoundError(f"{path} file is missing. Please provide a valid configuration file.")
+    return _settings[path]
@@ -0,0 +1,136 @@
+import os
+import json
+import sqlite3
+from collections.abc import MutableMapping
+
+
+class SharedStore:
+    """
+    Small JSON key-value store in one SQLite file, shared by every serving
+    process on the host.
+
+    Values are grouped in namespaces ("mapper", "jobs", ...). Each operation
+    opens its own connection, so the store can be used from any thread and
+    from forked workers; the database runs in WAL mode so readers never wait
+    for a writer.
+    """
+
+    def __init__(self, path, timeout=30.0):
+        self.path = path
+        self.timeout = timeout
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, "
+                "PRIMARY KEY (namespace, key))"
+            )
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+        return _Connection(connection)
+
+    def get(self, namespace, key, default=None):
+        with self._connect() as connection:
+            row = connection.execute("SELECT value FROM entries WHERE namespace = ? AND key = ?",
+                                     (namespace, key)).fetchone()
+        return json.loads(row[0]) if row is not None else default
+
+    def set(self, namespace, key, value):
+        self.update(namespace, {key: value})
+
+    def update(self, namespace, values):
+        """Write many keys in one transaction."""
+        rows = [(namespace, key, json.dumps(value)) for key, value in values.items()]
+        with self._connect() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            connection.executemany("INSERT OR REPLACE INTO entries (namespace, key, value) VALUES (?, ?, ?)", rows)
+            connection.execute("COMMIT")
+
+    def increment(self, namespace, key, amount=1):
+        """Atomically add amount to an integer value (missing counts as 0) and return the result."""
+        with self._connect() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            row = connection.execute("SELECT value FROM entries WHERE namespace = ? AND key = ?",
+                                     (namespace, key)).fetchone()
+            value = (json.loads(row[0]) if row is not None else 0) + amount
+            connection.execute("INSERT OR REPLACE INTO entries (namespace, key, value) VALUES (?, ?, ?)",
+                               (namespace, key, json.dumps(value)))
+            connection.execute("COMMIT")
+        return value
+
+    def delete(self, namespace, key):
+        with self._connect() as connection:
+            connection.execute("DELETE FROM entries WHERE namespace = ? AND key = ?", (namespace, key))
+
+    def items(self, namespace):
+        with self._connect() as connection:
+            rows = connection.execute("SELECT key, value FROM entries WHERE namespace = ? ORDER BY rowid",
+                                      (namespace,)).fetchall()
+        return [(key, json.loads(value)) for key, value in rows]
+
+    def count(self, namespace):
+        with self._connect() as connection:
+            return connection.execute("SELECT COUNT(*) FROM entries WHERE namespace = ?", (namespace,)).fetchone()[0]
+
+    def clear(self, namespace):
+        with self._connect() as connection:
+            connection.execute("DELETE FROM entries WHERE namespace = ?", (namespace,))
+
+
+class SharedMapping(MutableMapping):
+    """A dict-like view of one SharedStore namespace."""
+
+    def __init__(self, store, namespace):
+        self.store = store
+        self.namespace = namespace
+
+    def __getitem__(self, key):
+        missing = object()
+        value = self.store.get(self.namespace, key, missing)
+        if value is missing:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.store.set(self.namespace, key, value)
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        self.store.delete(self.namespace, key)
+
+    def __iter__(self):
+        return iter([key for key, _ in self.store.items(self.namespace)])
+
+    def __len__(self):
+        return self.store.count(self.namespace)
+
+    def update(self, values=(), **kwargs):
+        """Bulk write in one transaction instead of one per key."""
+        values = dict(values, **kwargs)
+        if values:
+            self.store.update(self.namespace, values)
+
+    def clear(self):
+        self.store.clear(self.namespace)
+
+    def to_dict(self):
+        return dict(self.store.items(self.namespace))
+
+
+class _Connection:
+    """Context manager that closes the connection (sqlite3's own only ends the transaction)."""
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        return self.connection
+
+    def __exit__(self, exc_type, *exc_info):
+        if exc_type is not None and self.connection.in_transaction:
+            self.connection.execute("ROLLBACK")
+        self.connection.close()
+        return False
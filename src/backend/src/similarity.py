@@ -1,22 +1,127 @@
 import numpy as np
 
 class SimilarityCalculator:
-    @staticmethod 
+    """
+    Scores queries against a fixed set of vectors with one of several metrics.
+
+    fit() caches the squared row norms once, so every metric reduces to one
+    matrix-vector product per query (one matrix product per batch):
+        euclidean      sqrt(|x|^2 - 2 x.q + |q|^2)   smaller is better
+        sqeuclidean    |x|^2 - 2 x.q + |q|^2         smaller is better
+        cosine         x.q / (|x| |q|)               larger is better
+        inner_product  x.q                           larger is better
+    Dot products are always taken in float64, also for float32 vectors:
+    with float32 products the expansion cancels badly, so an indexed
+    vector would not be at distance 0 from itself. The static helpers
+    below work without a fitted instance.
+    """
+
+    METRICS = ("euclidean", "sqeuclidean", "cosine", "inner_product")
+    # Rows upcast to float64 at a time when computing dot products; small
+    # enough for the copy to stay in cache.
+    CHUNK_ROWS = 2048
+    # Metrics whose scores are similarities (larger is better) rather than distances.
+    SIMILARITIES = ("cosine", "inner_product")
+
+    def __init__(self, vectors=None):
+        self.vectors = None
+        self.squared_norms = None
+        self.norms = None
+        if vectors is not None:
+            self.fit(vectors)
+
+    def fit(self, vectors):
+        """Remember vectors (not copied, may be memory-mapped) and cache their norms."""
+        self.vectors = vectors
+        self.squared_norms = np.einsum("ij,ij->i", vectors, vectors, dtype=np.float64)
+        self.norms = np.sqrt(self.squared_norms)
+        return self
+
+    @classmethod
+    def check_metric(cls, metric):
+        if metric not in cls.METRICS:
+            raise ValueError(f"Invalid metric '{metric}'. Choose one of {cls.METRICS}.")
+
+    @classmethod
+    def is_similarity(cls, metric):
+        return metric in cls.SIMILARITIES
+
+    def scores(self, query, metric="euclidean", rows=None, dots=None):
+        """
+        Scores of query (d,) against every fitted row, or only rows.
+        dots may supply precomputed (possibly approximate) inner products,
+        e.g. from quantized codes, in place of the matrix-vector product.
+        """
+        self.check_metric(metric)
+        if dots is None:
+            vectors = self.vectors if rows is None else self.vectors[rows]
+            dots = self._dots(vectors, np.asarray(query, dtype=np.float64))
+        dots = np.asarray(dots, dtype=np.float64)
+        return self._finish(dots, query, metric, rows)
+
+    def pairwise(self, queries, metric="euclidean"):
+        """Scores of every query row (Q x d) against every fitted row, as (Q x N)."""
+        self.check_metric(metric)
+        queries = np.asarray(queries, dtype=np.float64)
+        dots = self._dots(self.vectors, queries.T).T
+        return self._finish(dots, queries, metric, None)
+
+    def _dots(self, vectors, queries):
+        """vectors @ queries in float64, upcasting CHUNK_ROWS rows of vectors at a time."""
+        if vectors.dtype == np.float64:
+            return np.dot(vectors, queries)
+        dots = np.empty((len(vectors),) + queries.shape[1:])
+        for start in range(0, len(vectors), self.CHUNK_ROWS):
+            stop = start + self.CHUNK_ROWS
+            dots[start:stop] = np.dot(np.asarray(vectors[start:stop], dtype=np.float64), queries)
+        return dots
+
+    def _finish(self, dots, query, metric, rows):
+        if metric == "inner_product":
+            return dots
+        query = np.asarray(query, dtype=np.float64)
+        squared_norms = self.squared_norms if rows is None else self.squared_norms[rows]
+        query_squared = np.sum(query ** 2, axis=-1)
+        if np.ndim(query_squared):
+            query_squared = query_squared[:, None]
+        if metric == "cosine":
+            norms = self.norms if rows is None else self.norms[rows]
+            denominator = norms * np.sqrt(query_squared)
+            return np.divide(dots, denominator, out=np.zeros_like(dots), where=denominator > 0)
+        squared = np.clip(squared_norms - 2 * dots + query_squared, 0, None)
+        return squared if metric == "sqeuclidean" else np.sqrt(squared)
+
+    def rank(self, scores, k, metric="euclidean"):
+        """Indices of the k best scores of every row of a (Q x N) score matrix, best first."""
+        return self.top_k(scores, k, largest=self.is_similarity(metric))
+
+    @staticmethod
     def cosine_similarity(projections, query_projection):
         """Compute cosine similarities between query image and all dataset images."""
-        return np.dot(projections, query_projection) / (np.linalg.norm(projections, axis=1) * np.linalg.norm(query_projection))
-    
+        return SimilarityCalculator(projections).scores(query_projection, "cosine")
+
     @staticmethod
     def euclidean_distance(projections, query_projection):
         """Compute Euclidean distances between query image and all dataset images."""
         return np.linalg.norm(projections - query_projection, axis=1)
 
+    @staticmethod
+    def top_k(scores, k, largest=False):
+        """
+        Column indices of the k best entries of every row of scores, best first,
+        using argpartition instead of a full sort.
+        """
+        scores = -scores if largest else scores
+        k = min(k, scores.shape[1])
+        if k <= 0:
+            return np.zeros((scores.shape[0], 0), dtype=np.intp)
+        part = np.argpartition(scores, k - 1, axis=1)[:, :k]
+        order = np.argsort(np.take_along_axis(scores, part, axis=1), axis=1, kind="stable")
+        return np.take_along_axis(part, order, axis=1)
+
     @staticmethod
     def rank_similarities(distances, image_paths, limit=5, max_distance=float('inf')):
         """Rank images by similarity and return the top results."""
-        indices = np.argsort(distances)
-        results = [
-            (image_paths[i], distances[i])
-            for i in indices if distances[i] <= max_distance
-        ][:limit]
-        return results
\ No newline at end of file
+        distances = np.asarray(distances)
+        indices = SimilarityCalculator.top_k(distances[None, :], limit)[0]
+        return [(image_paths[i], distances[i]) for i in indices if distances[i] <= max_distance]